@@ -0,0 +1,145 @@
+import argparse
+import socket
+import os
+from threading import Thread
+from time import perf_counter, sleep
+from lib.BatchIO import BatchReceiver, BatchSender, HAS_MMSG, BATCH_SIZE
+from lib.Datagram import Datagram
+from lib.Endpoint import Endpoint
+from lib.Flags import Flags
+from lib.Header import Header, HEADER_SIZE
+
+MSS = 1024
+
+
+def benchmark_io(
+    packets: int, batched: bool, segmented: bool
+) -> tuple[float, float]:
+    receiver_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 24)
+    receiver_sock.bind(('127.0.0.1', 0))
+    sender_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    addr = receiver_sock.getsockname()
+    payload = os.urandom(MSS + HEADER_SIZE)
+    received = [0, 0.0]
+
+    def receive():
+        receiver = BatchReceiver(
+            receiver_sock, MSS + HEADER_SIZE,
+            BATCH_SIZE if batched else 1, gro=segmented
+        )
+        start = None
+        while received[0] < packets:
+            if batched:
+                count = len(receiver.receive())
+            else:
+                receiver_sock.recvfrom(MSS + HEADER_SIZE)
+                count = 1
+            if start is None:
+                start = perf_counter()
+            received[0] += count
+            received[1] = perf_counter() - start
+
+    receiver_sock.settimeout(None)
+    thread = Thread(target=receive, daemon=True)
+    thread.start()
+    sleep(0.1)
+    start = perf_counter()
+    if batched:
+        sender = BatchSender(sender_sock, gso=segmented)
+        messages = [([payload], addr)] * BATCH_SIZE
+        for _ in range(0, packets, BATCH_SIZE):
+            sender.send(messages)
+    else:
+        for _ in range(packets):
+            sender_sock.sendto(payload, addr)
+    send_time = perf_counter() - start
+    thread.join(timeout=5)
+    receiver_sock.close()
+    sender_sock.close()
+    return packets / send_time, received[0] / max(received[1], 1e-9)
+
+
+class NullSocket:
+    # Descarta lo enviado, para medir solo el armado de los datagramas
+    def sendto(self, data: bytes, addr: tuple):
+        pass
+
+
+def benchmark_codec(packets: int) -> list[tuple[str, float]]:
+    # Costo por paquete, en nanosegundos, de armar y decodificar los
+    # datagramas de datos y los ACKs
+    endpoint = Endpoint(4, MSS, NullSocket(), ('127.0.0.1', 0))
+    endpoint.connection_id = 1
+    payload = os.urandom(MSS)
+    data = Datagram(Header(MSS, 1, 1, Flags.UPLOAD, connection_id=1), payload)
+    ack = Datagram(Header(0, 1, 2, Flags.ACK, 256, connection_id=1), b'')
+    raw_data = data.to_bytes()
+    raw_ack = ack.to_bytes()
+    # Los headers de datos se escriben en el buffer de envio
+    buffer = bytearray(HEADER_SIZE + MSS)
+
+    def build_data(seq: int):
+        header = Header(MSS, seq, 1, Flags.UPLOAD, connection_id=1)
+        Datagram(header, payload).header.pack_into(buffer)
+
+    def build_ack(seq: int):
+        endpoint.send_ack(seq, 256)
+
+    def parse_data(_):
+        Datagram.from_bytes(raw_data).get_sequence_number()
+
+    def parse_ack(_):
+        Datagram.from_bytes(raw_ack).get_ack_number()
+
+    results = []
+    for name, operation in [
+        ("armar datos", build_data),
+        ("armar ACK", build_ack),
+        ("decodificar datos", parse_data),
+        ("decodificar ACK", parse_ack),
+    ]:
+        start = perf_counter()
+        for seq in range(packets):
+            operation(seq)
+        results.append((name, (perf_counter() - start) / packets * 1e9))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='protocol benchmarks')
+    parser.add_argument(
+        'benchmark',
+        type=str,
+        help='benchmark to run',
+        choices=['io', 'codec']
+    )
+    parser.add_argument(
+        '-n', '--packets',
+        type=int,
+        help='number of packets',
+        default=200000
+    )
+    args = parser.parse_args()
+
+    match args.benchmark:
+        case 'io':
+            print(f"recvmmsg/sendmmsg disponibles: {HAS_MMSG}")
+            modes = [
+                ("sendto/recvfrom", False, False),
+                ("sendmmsg/recvmmsg", True, False),
+                ("GSO/GRO", True, True),
+            ]
+            for name, batched, segmented in modes:
+                send_pps, recv_pps = benchmark_io(
+                    args.packets, batched, segmented)
+                print(
+                    f"{name:>18}: envío {send_pps:,.0f} paquetes/s, "
+                    f"recepción {recv_pps:,.0f} paquetes/s")
+        case 'codec':
+            for name, cost in benchmark_codec(args.packets):
+                print(f"{name:>18}: {cost:,.0f} ns/paquete")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,9 +2,15 @@ import argparse
 import socket
 import logging
 from lib.Client import Client
+from lib.Streams import MAX_STREAMS, run_streams
 from lib.StopAndWait import StopAndWait
 from lib.GoBackN import GoBackN
+from lib.SelectiveRepeat import SelectiveRepeat
 from lib.logger import setup_logger
+from lib.CongestionControl import CONGESTION_CONTROLS
+from lib.MSS import MAX_MSS
+from lib.FEC import HAS_NUMPY, NO_FEC_PARAMS, REED_SOLOMON, parse_fec
+from lib.Compression import COMPRESSIONS, HAS_ZSTD, NO_COMPRESSION
 
 
 def main():
@@ -22,38 +28,95 @@ def main():
     parser.add_argument('-H', '--host', type=str, help='server IP address')
     parser.add_argument('-p', '--port', type=int, help='server port')
     parser.add_argument('-d', '--dst', type=str, help='destination file path')
-    parser.add_argument('-n', '--name', type=str, help='file name')
+    parser.add_argument(
+        '-n', '--name',
+        type=str,
+        help='file name, a directory is downloaded recursively'
+    )
     parser.add_argument(
         '-r', '--protocol',
         type=str,
         help='error recovery protocol',
         required=True,
-        choices=['GBN', 'SW'],
+        choices=['GBN', 'SW', 'SR'],
         default='GBN'
     )
+    parser.add_argument(
+        '-c', '--congestion',
+        type=str,
+        help='congestion control algorithm',
+        choices=list(CONGESTION_CONTROLS),
+        default='reno'
+    )
+    parser.add_argument(
+        '-m', '--mss',
+        type=int,
+        help='maximum segment size, taken from the path MTU by default'
+    )
+    parser.add_argument(
+        '-j', '--streams',
+        type=int,
+        help='number of parallel streams the file is split into',
+        default=1
+    )
+    parser.add_argument(
+        '-f', '--fec',
+        type=parse_fec,
+        help='forward error correction with R repair segments per K data '
+             'segments, as K:R (R > 1 uses Reed-Solomon and needs NumPy)'
+    )
+    parser.add_argument(
+        '-z', '--compression',
+        type=str,
+        help='compress each segment that shrinks (zstd needs zstandard)',
+        choices=list(COMPRESSIONS)
+    )
 
     args = parser.parse_args()
+    if args.mss is not None and not 0 < args.mss <= MAX_MSS:
+        parser.error(f'mss must be between 1 and {MAX_MSS}')
+    if not 0 < args.streams <= MAX_STREAMS:
+        parser.error(f'streams must be between 1 and {MAX_STREAMS}')
+    if args.fec is not None and args.fec.scheme == REED_SOLOMON and \
+            not HAS_NUMPY:
+        parser.error('Reed-Solomon needs NumPy, use a single repair segment')
+    if args.compression == 'zstd' and not HAS_ZSTD:
+        parser.error('zstd compression needs the zstandard package')
     setup_logger(args.verbose, args.quiet)
     logging.debug('Iniciando cliente de download con argumentos: %s', args)
-    recovery_protocol = None
     addr = (args.host, args.port)
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    match args.protocol:
-        case 'GBN':
-            recovery_protocol = GoBackN()
-
-        case 'SW':
-            recovery_protocol = StopAndWait()
-    logging.debug('Protocolo de recuperacion: %s', recovery_protocol)
-    client = Client(
-        recovery_protocol,
-        args.dst,
-        args.name,
-        addr,
-        sock
-    )
-    logging.info('Cliente creado con protocolo %s', args.protocol)
-    client.start_download()
+    congestion_control = CONGESTION_CONTROLS[args.congestion]
+
+    def recovery_protocol():
+        match args.protocol:
+            case 'GBN':
+                return GoBackN(congestion_control)
+            case 'SW':
+                return StopAndWait(congestion_control)
+            case 'SR':
+                return SelectiveRepeat(congestion_control)
+
+    compression = COMPRESSIONS.get(args.compression, NO_COMPRESSION)
+    # Cada stream tiene su socket y su instancia del protocolo
+    clients = [
+        Client(
+            recovery_protocol(),
+            args.dst,
+            args.name,
+            addr,
+            socket.socket(socket.AF_INET, socket.SOCK_DGRAM),
+            args.mss,
+            (index, args.streams),
+            fec=args.fec or NO_FEC_PARAMS,
+            compression=compression
+        )
+        for index in range(args.streams)
+    ]
+    logging.info(
+        'Clientes creados con protocolo %s y %d streams',
+        args.protocol, args.streams
+    )
+    run_streams([client.start_download for client in clients])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,92 @@
+import hmac
+import os
+from hashlib import sha256
+from time import monotonic, time
+
+# Numero de periodo y HMAC truncado de la dirección del cliente
+COOKIE_SIZE = 16
+COOKIE_MAC_SIZE = COOKIE_SIZE - 4
+NO_COOKIE = bytes(COOKIE_SIZE)
+# Una cookie vale durante su periodo y el siguiente
+COOKIE_PERIOD = 30
+MAX_SESSIONS = 1024
+# Datagramas de direcciones sin sesión que acepta cada IP, por segundo y
+# en ráfaga. La ráfaga alcanza para abrir MAX_STREAMS streams a la vez
+SOURCE_RATE = 100
+SOURCE_BURST = 600
+# IPs con limite de tasa registradas, las más viejas se olvidan
+MAX_SOURCES = 4096
+
+
+class Admission:
+    """
+    Control de admisión de conexiones nuevas, sin estado por cliente.
+
+    Un SYN sin cookie se responde con una cookie, un HMAC con un secreto
+    del servidor de la dirección del cliente y el periodo actual, sin
+    guardar nada. Solo el SYN que la repite, que prueba que el cliente
+    recibe en esa dirección, crea el thread, la cola y el endpoint. Además
+    se limita la cantidad de sesiones concurrentes y la tasa de datagramas
+    de direcciones nuevas por IP de origen.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = MAX_SESSIONS,
+        rate: float = SOURCE_RATE,
+        burst: float = SOURCE_BURST
+    ):
+        self.secret = os.urandom(32)
+        self.max_sessions = max_sessions
+        self.rate = rate
+        self.burst = burst
+        # IP -> (tokens, instante de la ultima recarga)
+        self.sources: dict[str, tuple[float, float]] = {}
+
+    def cookie(self, address: tuple[str, int]) -> bytes:
+        period = int(time() // COOKIE_PERIOD)
+        return period.to_bytes(4, 'big') + self.mac(address, period)
+
+    def valid(self, address: tuple[str, int], cookie: bytes) -> bool:
+        if len(cookie) != COOKIE_SIZE:
+            return False
+        period = int.from_bytes(cookie[:4], 'big')
+        if not 0 <= int(time() // COOKIE_PERIOD) - period <= 1:
+            return False
+        return hmac.compare_digest(cookie[4:], self.mac(address, period))
+
+    def proves(
+        self, address: tuple[str, int], secret: bytes, response: bytes
+    ) -> bool:
+        # La respuesta a una cookie de migración es la cookie de la nueva
+        # dirección seguida de su prueba con el secreto de la sesión
+        challenge = response[:COOKIE_SIZE]
+        proof = response[COOKIE_SIZE:]
+        if not self.valid(address, challenge):
+            return False
+        return hmac.compare_digest(proof, migration_proof(secret, challenge))
+
+    def mac(self, address: tuple[str, int], period: int) -> bytes:
+        host, port = address
+        message = f'{host}:{port}:{period}'.encode()
+        return hmac.new(self.secret, message, sha256).digest()[
+            :COOKIE_MAC_SIZE]
+
+    def allow(self, host: str) -> bool:
+        # Token bucket por IP de origen
+        now = monotonic()
+        tokens, last = self.sources.pop(host, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        if len(self.sources) >= MAX_SOURCES:
+            del self.sources[next(iter(self.sources))]
+        if tokens < 1:
+            self.sources[host] = (tokens, now)
+            return False
+        self.sources[host] = (tokens - 1, now)
+        return True
+
+
+def migration_proof(secret: bytes, challenge: bytes) -> bytes:
+    # HMAC de la cookie de migración con la cookie del handshake, que solo
+    # conocen el cliente y el servidor
+    return hmac.new(secret, challenge, sha256).digest()[:COOKIE_SIZE]
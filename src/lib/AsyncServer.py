@@ -0,0 +1,239 @@
+import asyncio
+from socket import socket
+from typing import Optional
+from time import time
+from .Datagram import Datagram
+from .Flags import Flags
+from .Util import open_file
+from .Messages.UploadSYN import UploadSYN
+from .Messages.DownloadSYN import DownloadSYN
+from .RecoveryProtocol import RecoveryProtocol
+from .Endpoint import Endpoint
+from .FileSource import FileSource
+from .Server import (
+    Server, DOWNLOAD_ACK_RETRIES, INITIAL_RTT, select_range, upload_offset,
+    upload_sink
+)
+from .RTTEstimator import MAX_RTO
+from .MSS import negotiate_mss
+from .FEC import negotiate_fec
+from .Compression import negotiate_compression
+from .Sessions import Session
+from .Admission import MAX_SESSIONS
+from .IngressQueue import AsyncIngressQueue
+import logging
+
+
+class ServerProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server: 'AsyncServer'):
+        self.server = server
+
+    def connection_made(self, transport: asyncio.DatagramTransport):
+        self.server.transport = transport
+
+    def datagram_received(self, data: bytes, client_addr: tuple[str, int]):
+        self.server.dispatch(data, client_addr)
+
+
+class AsyncServer(Server):
+    """
+    Servidor sobre un event loop de asyncio.
+
+    Cada cliente es una tarea del loop en lugar de un thread, y los
+    protocolos de recuperación se ejecutan con sus drivers asincrónicos,
+    por lo que un solo proceso puede atender miles de transferencias sin
+    cambios de contexto entre threads.
+    """
+
+    def __init__(
+        self,
+        recovery_protocol: RecoveryProtocol,
+        address: tuple[str, int],
+        storage_path: str,
+        socket: socket,
+        mss: Optional[int] = None,
+        max_sessions: int = MAX_SESSIONS,
+        rate_limit: Optional[float] = None,
+        server_rate_limit: Optional[float] = None,
+        weights: Optional[dict[str, float]] = None
+    ):
+        super().__init__(
+            recovery_protocol, address, storage_path, socket, mss,
+            max_sessions, rate_limit, server_rate_limit, weights
+        )
+        self.transport = None
+        self.tasks: dict[int, asyncio.Task] = {}
+
+    def start(self):
+        logging.info(
+            "Servidor iniciado con éxito, esperando mensajes de cliente")
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            logging.info("Servidor detenido manualmente")
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(
+            lambda: ServerProtocol(self), sock=self.socket
+        )
+        await loop.create_future()
+
+    def dispatch(self, data: bytes, client_addr: tuple[str, int]):
+        session = self.sessions.route(data, client_addr)
+        if session is None:
+            session = self.admit(data, client_addr)
+            if session is None:
+                return
+            logging.info(f"Nueva conexión recibida: {client_addr}")
+            self.setup_new_client(session)
+        session.deliver(data)
+
+    def reply(self, data: bytes, client_addr: tuple[str, int]):
+        self.transport.sendto(data, client_addr)
+
+    def setup_new_client(self, session: Session):
+        logging.info(f"Configurando nuevo cliente: {session.address}")
+        session.queue = AsyncIngressQueue()
+        # El transporte expone sendto, igual que el socket
+        session.endpoint = self.session_endpoint(session, self.transport)
+        self.tasks[session.id] = asyncio.create_task(
+            self.handle_client(session)
+        )
+
+    async def handle_client(self, session: Session):
+        logging.info(f"Cliente conectado: {session.address}")
+        try:
+            datagram = Datagram.from_bytes(await session.queue.get())
+            payload = datagram.analyze()
+
+            match payload:
+                case UploadSYN():
+                    await self.handle_upload_syn(datagram, payload, session)
+                case DownloadSYN():
+                    await self.handle_download_syn(
+                        datagram, payload, session)
+        finally:
+            self.tasks.pop(session.id)
+            self.cleanup(session)
+
+    async def handle_upload_syn(
+        self,
+        client_datagram: Datagram,
+        client_payload: UploadSYN,
+        session: Session
+    ):
+        logging.info(f"Recibido SYN para upload de {session.address}")
+        ack = client_datagram.get_sequence_number()
+        error = self.validate_upload_syn(client_payload)
+        endp = session.endpoint
+        queue = session.queue
+        if error is not None:
+            logging.error(f"Error en SYN de upload: {error.decode()}")
+            self.send_error_response(error, ack, session)
+            return
+
+        endp.update_mss(negotiate_mss(client_payload.mss, endp.mss))
+        endp.fec = negotiate_fec(client_payload.fec, self.rp.SUPPORTS_FEC)
+        endp.compression = negotiate_compression(
+            client_payload.compression, self.rp.SUPPORTS_COMPRESSION)
+        checkpoint = self.upload_checkpoint(client_payload)
+        offset = upload_offset(client_payload, checkpoint)
+        ack = self.upload_ack(endp, ack, offset)
+        endp.update_last_msg(ack)
+        endp.send_message(ack)
+        logging.info(f"ACK enviado para upload de {session.address}")
+
+        filename = client_payload.filename
+        try:
+            sink = upload_sink(client_payload, endp.mss, checkpoint, offset)
+            receiver = await self.rp.receive_async(endp, sink, queue)
+            self.sessions.linger(session, receiver.on_linger)
+            logging.info(
+                f"Archivo '{filename}' recibido correctamente de "
+                f"{session.address}"
+            )
+        except Exception as e:
+            # El archivo parcial y su checkpoint quedan para reanudar
+            logging.error(
+                f"Error durante la recepción del archivo '{filename}': {e}")
+
+    async def handle_download_syn(
+        self,
+        client_datagram: Datagram,
+        client_payload: DownloadSYN,
+        session: Session
+    ):
+        logging.info(f"Recibido SYN para download de {session.address}")
+        endp = session.endpoint
+        ack = client_datagram.get_sequence_number()
+        error, filepath = self.validate_download_syn(client_payload)
+
+        queue = session.queue
+        if error is None:
+            source = open_file(filepath, mapped=True)
+            if source is None:
+                error = str.encode("El archivo no existe en el servidor")
+        if error is not None:
+            logging.error(f"Error en SYN de download: {error.decode()}")
+            self.send_error_response(error, ack, session)
+            return
+        logging.info(f"SYN válido para download de {session.address}")
+        endp.update_mss(negotiate_mss(client_payload.mss, endp.mss))
+        endp.fec = negotiate_fec(client_payload.fec, self.rp.SUPPORTS_FEC)
+        endp.compression = negotiate_compression(
+            client_payload.compression, self.rp.SUPPORTS_COMPRESSION)
+        with source:
+            select_range(client_payload, source)
+            try:
+                rtt = await self.send_download_ack(ack, source, endp, queue)
+                await self.rp.send_async(
+                    endp,
+                    source,
+                    queue,
+                    endp.mss,
+                    Flags.DOWNLOAD,
+                    rtt
+                )
+            except ConnectionAbortedError as e:
+                logging.error(
+                    f"El cliente {session.address} abortó el download: {e}")
+                return
+            except TimeoutError as e:
+                logging.error(f"Download a {session.address} abandonado: {e}")
+                return
+        logging.info(f"Archivo enviado a {session.address}")
+
+    async def send_download_ack(
+        self,
+        ack_number: int,
+        source: FileSource,
+        endpoint: Endpoint,
+        queue: asyncio.Queue
+    ) -> float:
+        datagram = self.download_ack(endpoint, ack_number, source)
+        endpoint.update_last_msg(datagram)
+        timeout = INITIAL_RTT
+        retries = 0
+        start = time()
+        endpoint.send_message(datagram)
+        while True:
+            try:
+                data = await asyncio.wait_for(
+                    queue.get(), max(0, start + timeout - time()))
+            except asyncio.TimeoutError:
+                if retries == DOWNLOAD_ACK_RETRIES:
+                    raise TimeoutError("El cliente no respondió el ACK")
+                retries += 1
+                timeout = min(2 * timeout, MAX_RTO)
+                logging.debug(
+                    f"Timeout esperando download ACK de "
+                    f"{endpoint.remote_addr}, reenviando")
+                start = time()
+                endpoint.send_message(datagram)
+                continue
+            if Datagram.from_bytes(data).is_ack():
+                rtt = time() - start
+                break
+        logging.info(f"RTT inicial calculado: {rtt:.2f} segundos")
+        return rtt
@@ -0,0 +1,292 @@
+import os
+import struct
+from bisect import bisect_right
+from pathlib import PurePosixPath
+from typing import BinaryIO, Optional
+from .FileSource import FileSource
+from .FileSink import SegmentSink, fdatasync, preallocate, pwrite
+import logging
+
+# Cantidad de archivos del manifiesto: un directorio vacío también tiene
+# manifiesto, lo que distingue a un lote de un archivo suelto
+ENTRY_COUNT = struct.Struct('!I')
+# Largo del nombre, y tamaño y mtime de cada archivo del manifiesto
+ENTRY_NAME = struct.Struct('!H')
+ENTRY_INFO = struct.Struct('!QQ')
+# Un manifiesto más grande se rechaza en lugar de reservar su buffer
+MAX_MANIFEST_SIZE = 64 * 1024 * 1024
+# Archivos de un lote abiertos a la vez para leer o escribir
+MAX_OPEN_FILES = 64
+
+
+class ManifestEntry:
+    __slots__ = ('name', 'size', 'mtime')
+
+    def __init__(self, name: str, size: int, mtime: int):
+        # Ruta relativa a la raiz del lote, separada por '/'
+        self.name = name
+        self.size = size
+        self.mtime = mtime
+
+
+class Manifest:
+    """
+    Lista de los archivos de un lote. Viaja al principio de los datos de la
+    transferencia, seguida del contenido de los archivos en el mismo orden.
+    """
+
+    def __init__(self, entries: list[ManifestEntry]):
+        self.entries = entries
+        # Offset de cada archivo dentro de los datos que siguen al manifiesto
+        self.offsets = []
+        offset = 0
+        for entry in entries:
+            self.offsets.append(offset)
+            offset += entry.size
+        self.data_size = offset
+
+    @staticmethod
+    def scan(root: str) -> 'Manifest':
+        # Recorre el directorio en orden para que el lote sea reproducible
+        entries = []
+        for directory, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = os.path.join(directory, filename)
+                if not os.path.isfile(path):
+                    continue
+                stat = os.stat(path)
+                name = PurePosixPath(
+                    *os.path.relpath(path, root).split(os.sep))
+                entries.append(
+                    ManifestEntry(str(name), stat.st_size, stat.st_mtime_ns))
+        return Manifest(entries)
+
+    def find(self, offset: int) -> int:
+        # Indice del archivo que contiene el offset de los datos
+        return bisect_right(self.offsets, offset) - 1
+
+    def to_bytes(self) -> bytes:
+        parts = [ENTRY_COUNT.pack(len(self.entries))]
+        for entry in self.entries:
+            name = entry.name.encode('utf-8')
+            parts.append(ENTRY_NAME.pack(len(name)))
+            parts.append(name)
+            parts.append(ENTRY_INFO.pack(entry.size, entry.mtime))
+        return b''.join(parts)
+
+    @staticmethod
+    def from_bytes(data: bytes) -> 'Manifest':
+        entries = []
+        (count,) = ENTRY_COUNT.unpack_from(data)
+        offset = ENTRY_COUNT.size
+        for _ in range(count):
+            (length,) = ENTRY_NAME.unpack_from(data, offset)
+            offset += ENTRY_NAME.size
+            name = bytes(data[offset:offset + length]).decode('utf-8')
+            offset += length
+            size, mtime = ENTRY_INFO.unpack_from(data, offset)
+            offset += ENTRY_INFO.size
+            entries.append(ManifestEntry(name, size, mtime))
+        if offset != len(data):
+            raise ValueError("Manifiesto inválido")
+        return Manifest(entries)
+
+
+class BatchSource(FileSource):
+    """
+    Fuente de un lote de archivos: el manifiesto seguido del contenido de
+    cada archivo, como si fueran uno solo. Así el lote usa un único
+    handshake y la ventana del protocolo no se vacía entre archivos.
+
+    Los archivos se abren a demanda y se mantienen abiertos hasta
+    MAX_OPEN_FILES a la vez.
+    """
+
+    def __init__(self, root: str, manifest: Manifest):
+        self.root = root
+        self.manifest = manifest
+        self.header = manifest.to_bytes()
+        self.total = len(self.header) + manifest.data_size
+        self.size = self.total
+        self.start = 0
+        self.files: dict[int, int] = {}
+
+    @property
+    def manifest_size(self) -> int:
+        return len(self.header)
+
+    @property
+    def identity(self) -> tuple[int, int]:
+        # Un lote no se reanuda, no tiene un mtime que lo identifique
+        return self.total, 0
+
+    def read(self, offset: int, length: int) -> bytes:
+        if offset >= self.size:
+            return b''
+        offset += self.start
+        end = min(offset + length, self.start + self.size)
+        chunks = []
+        while offset < end:
+            if offset < len(self.header):
+                chunk = self.header[offset:end]
+            else:
+                chunk = self.read_data(offset - len(self.header), end - offset)
+            chunks.append(chunk)
+            offset += len(chunk)
+        return b''.join(chunks)
+
+    def read_data(self, offset: int, length: int) -> bytes:
+        index = self.manifest.find(offset)
+        entry = self.manifest.entries[index]
+        file_offset = offset - self.manifest.offsets[index]
+        length = min(length, entry.size - file_offset)
+        data = os.pread(self.open_entry(index), length, file_offset)
+        # Si el archivo se achicó desde que se armó el manifiesto se
+        # completa con ceros, los offsets del lote no pueden cambiar
+        return data.ljust(length, b'\0')
+
+    def open_entry(self, index: int) -> int:
+        fd = self.files.get(index)
+        if fd is not None:
+            return fd
+        if len(self.files) >= MAX_OPEN_FILES:
+            oldest = next(iter(self.files))
+            os.close(self.files.pop(oldest))
+        name = self.manifest.entries[index].name
+        fd = os.open(os.path.join(self.root, *name.split('/')), os.O_RDONLY)
+        self.files[index] = fd
+        return fd
+
+    def close(self):
+        for fd in self.files.values():
+            os.close(fd)
+        self.files.clear()
+
+
+class BatchSink(SegmentSink):
+    """
+    Destino de un lote de archivos recibido como un único SegmentSink.
+
+    Los primeros manifest_size bytes son el manifiesto, que se arma en
+    memoria. Los datos que llegan antes de completarlo (fuera de orden con
+    Selective Repeat) se guardan hasta entonces. El thread de escritura
+    reparte cada bloque entre los archivos que abarca, que se crean bajo
+    root al escribirles el primer byte y se cierran al completarse. Como
+    mucho MAX_OPEN_FILES quedan abiertos a la vez: si hay que abrir otro se
+    cierra el usado hace más tiempo, que se reabre sin truncar si vuelve a
+    recibir datos.
+    """
+
+    def __init__(self, root: str, size: int, mss: int, manifest_size: int):
+        self.root = root
+        self.manifest_size = manifest_size
+        self.header = bytearray(manifest_size)
+        self.header_received = 0
+        self.manifest: Optional[Manifest] = None
+        self.early: list[tuple[int, bytes]] = []
+        self.files: dict[int, BinaryIO] = {}
+        self.created: set[int] = set()
+        self.written: list[int] = []
+        super().__init__(None, size, mss)
+
+    def allocate(self):
+        # Cada archivo se reserva al crearlo
+        pass
+
+    def write_at(self, offset: int, data: bytes):
+        if offset < self.manifest_size:
+            part = data[:self.manifest_size - offset]
+            self.header[offset:offset + len(part)] = part
+            self.header_received += len(part)
+            data = data[len(part):]
+            offset += len(part)
+            if self.header_received == self.manifest_size:
+                self.open_manifest()
+        if not data:
+            return
+        if self.manifest is None:
+            self.early.append((offset, bytes(data)))
+            return
+        super().write_at(offset, data)
+
+    def open_manifest(self):
+        try:
+            manifest = Manifest.from_bytes(self.header)
+        except (struct.error, UnicodeDecodeError, ValueError):
+            raise ValueError("Manifiesto inválido")
+        if self.manifest_size + manifest.data_size != self.size:
+            raise ValueError("El manifiesto no coincide con el lote")
+        for entry in manifest.entries:
+            entry_path(self.root, entry.name)
+        os.makedirs(self.root, exist_ok=True)
+        logging.info(f"Recibiendo lote de {len(manifest.entries)} archivos")
+        self.written = [0] * len(manifest.entries)
+        self.manifest = manifest
+        # Los archivos vacios no reciben datos, se crean ahora
+        for index, entry in enumerate(manifest.entries):
+            if entry.size == 0:
+                self.open_entry(index)
+                self.close_entry(index)
+        early, self.early = self.early, []
+        for offset, data in early:
+            super().write_at(offset, data)
+
+    def write_block(self, offset: int, block: bytearray):
+        view = memoryview(block)
+        offset -= self.manifest_size
+        while view:
+            index = self.manifest.find(offset)
+            entry = self.manifest.entries[index]
+            file_offset = offset - self.manifest.offsets[index]
+            length = min(len(view), entry.size - file_offset)
+            file = self.open_entry(index)
+            pwrite(file.fileno(), view[:length], file_offset)
+            self.written[index] += length
+            if self.written[index] >= entry.size:
+                self.close_entry(index)
+            view = view[length:]
+            offset += length
+
+    def open_entry(self, index: int) -> BinaryIO:
+        file = self.files.pop(index, None)
+        if file is None:
+            if len(self.files) >= MAX_OPEN_FILES:
+                oldest = next(iter(self.files))
+                self.files.pop(oldest).close()
+            entry = self.manifest.entries[index]
+            path = entry_path(self.root, entry.name)
+            if index in self.created:
+                file = open(path, "r+b")
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                file = open(path, "wb")
+                preallocate(file, entry.size)
+                self.created.add(index)
+        # El ultimo usado queda al final, el primero es el que se cierra
+        self.files[index] = file
+        return file
+
+    def close_entry(self, index: int):
+        entry = self.manifest.entries[index]
+        self.files.pop(index).close()
+        path = entry_path(self.root, entry.name)
+        os.utime(path, ns=(entry.mtime, entry.mtime))
+
+    def sync_file(self):
+        for file in self.files.values():
+            fdatasync(file.fileno())
+
+    def close_file(self):
+        for file in self.files.values():
+            file.close()
+        self.files.clear()
+
+
+def entry_path(root: str, name: str) -> str:
+    # Las rutas del manifiesto las elige el otro extremo, no pueden salir
+    # de root
+    path = PurePosixPath(name)
+    if path.is_absolute() or not path.parts or '..' in path.parts:
+        raise ValueError(f"Ruta inválida en el manifiesto: {name}")
+    return os.path.join(root, *path.parts)
@@ -0,0 +1,448 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import socket
+import struct
+import sys
+from ctypes import POINTER, c_int, c_size_t, c_uint, c_void_p
+from typing import Any, Callable, Sequence
+
+# Datagramas por syscall
+BATCH_SIZE = 64
+MSG_WAITFORONE = 0x10000
+SOCKADDR_SIZE = 128
+# Direcciones decodificadas que se recuerdan antes de vaciar la cache
+MAX_CACHED_ADDRESSES = 4096
+# linux/udp.h, Python no los expone
+UDP_SEGMENT = 103
+UDP_GRO = 104
+# Limites del kernel para un envío con GSO
+GSO_MAX_SEGMENTS = 64
+GSO_MAX_BYTES = 65507
+# Con GRO el kernel puede entregar hasta 64 KB de segmentos concatenados
+GRO_BUFFER_SIZE = 65535
+CONTROL_SIZE = socket.CMSG_SPACE(4) if hasattr(socket, 'CMSG_SPACE') else 24
+# Con segmentos de 64 KB los buffers por defecto del socket se llenan con
+# un par de datagramas. El kernel lo limita a net.core.rmem_max/wmem_max
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024
+
+
+class IOVec(ctypes.Structure):
+    _fields_ = [('iov_base', c_void_p), ('iov_len', c_size_t)]
+
+
+class MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_name', c_void_p),
+        ('msg_namelen', c_uint),
+        ('msg_iov', POINTER(IOVec)),
+        ('msg_iovlen', c_size_t),
+        ('msg_control', c_void_p),
+        ('msg_controllen', c_size_t),
+        ('msg_flags', c_int),
+    ]
+
+
+class MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', MsgHdr), ('msg_len', c_uint)]
+
+
+MMSGHDR_SIZE = ctypes.sizeof(MMsgHdr)
+IOVEC_SIZE = ctypes.sizeof(IOVec)
+NAMELEN_OFFSET = MMsgHdr.msg_hdr.offset + MsgHdr.msg_namelen.offset
+CONTROLLEN_OFFSET = MMsgHdr.msg_hdr.offset + MsgHdr.msg_controllen.offset
+MSG_LEN_OFFSET = MMsgHdr.msg_len.offset
+IOVEC = struct.Struct('PN')
+UINT = struct.Struct('I')
+SIZE = struct.Struct('N')
+# cmsghdr seguido de los datos del mensaje de control
+CMSG_HEADER = struct.Struct('Nii')
+CMSG_SEGMENT = struct.Struct('NiiH')
+CMSG_INT = struct.Struct('i')
+
+
+def load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, 'recvmmsg') or not hasattr(libc, 'sendmmsg'):
+        return None
+    libc.recvmmsg.argtypes = [c_int, c_void_p, c_uint, c_int, c_void_p]
+    libc.sendmmsg.argtypes = [c_int, c_void_p, c_uint, c_int]
+    return libc
+
+
+libc = load_libc()
+HAS_MMSG = libc is not None
+
+
+def decode_address(raw: bytes) -> tuple:
+    family = struct.unpack_from('=H', raw)[0]
+    port = struct.unpack_from('!H', raw, 2)[0]
+    if family == socket.AF_INET6:
+        flowinfo, = struct.unpack_from('!I', raw, 4)
+        scope_id, = struct.unpack_from('=I', raw, 24)
+        host = socket.inet_ntop(socket.AF_INET6, raw[8:24])
+        return host, port, flowinfo, scope_id
+    return socket.inet_ntop(socket.AF_INET, raw[4:8]), port
+
+
+def encode_address(addr: tuple) -> bytes:
+    if ':' in addr[0]:
+        flowinfo = addr[2] if len(addr) > 2 else 0
+        scope_id = addr[3] if len(addr) > 3 else 0
+        return struct.pack('=H', socket.AF_INET6) + \
+            struct.pack('!HI', addr[1], flowinfo) + \
+            socket.inet_pton(socket.AF_INET6, addr[0]) + \
+            struct.pack('=I', scope_id)
+    return struct.pack('=H', socket.AF_INET) + struct.pack('!H', addr[1]) + \
+        socket.inet_pton(socket.AF_INET, addr[0]) + bytes(8)
+
+
+def raise_errno():
+    error = ctypes.get_errno()
+    raise OSError(error, os.strerror(error))
+
+
+def uses_mmsg(sock: Any) -> bool:
+    # Con timeout el socket es no bloqueante, se usa la ruta de Python
+    return HAS_MMSG and isinstance(sock, socket.socket) and \
+        sock.gettimeout() is None
+
+
+def set_socket_buffers(sock: socket.socket, size: int = SOCKET_BUFFER_SIZE):
+    for option in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, option, size)
+        except OSError:
+            pass
+
+
+def enable_udp_option(sock: socket.socket, option: int, value: int) -> bool:
+    try:
+        sock.setsockopt(socket.SOL_UDP, option, value)
+    except (OSError, AttributeError):
+        return False
+    return True
+
+
+def split_segments(data: Any, segment_size: int) -> list:
+    # Separa los datagramas que GRO entrego concatenados
+    return [
+        data[start:start + segment_size]
+        for start in range(0, len(data), segment_size)
+    ]
+
+
+def gro_segment_size(level: int, kind: int, data: Any) -> int:
+    if level == socket.SOL_UDP and kind == UDP_GRO:
+        return CMSG_INT.unpack_from(data)[0]
+    return 0
+
+
+def pin(buffer: bytearray) -> tuple[ctypes.Array, int]:
+    # El array de ctypes mantiene exportado el buffer, por lo que su
+    # direccion no cambia mientras se conserve la referencia
+    array = (ctypes.c_char * len(buffer)).from_buffer(buffer)
+    return array, ctypes.addressof(array)
+
+
+def message_headers(
+    batch_size: int, names_address: int, iovecs_address: int,
+    control_address: int, control_size: int
+) -> bytes:
+    headers = (MMsgHdr * batch_size)()
+    for i, message in enumerate(headers):
+        message.msg_hdr.msg_name = names_address + i * SOCKADDR_SIZE
+        message.msg_hdr.msg_namelen = SOCKADDR_SIZE
+        message.msg_hdr.msg_iov = ctypes.cast(
+            iovecs_address + i * IOVEC_SIZE, POINTER(IOVec))
+        message.msg_hdr.msg_iovlen = 1
+        message.msg_hdr.msg_control = control_address + i * CONTROL_SIZE
+        message.msg_hdr.msg_controllen = control_size
+    return bytes(headers)
+
+
+class BatchReceiver:
+    """
+    Recibe hasta BATCH_SIZE datagramas por syscall con recvmmsg.
+
+    Los buffers se reservan una sola vez. Si el kernel soporta UDP_GRO,
+    cada buffer puede traer varios datagramas del mismo cliente
+    concatenados, que se separan antes de devolverlos. Si recvmmsg no está
+    disponible recibe de a un datagrama con recvfrom.
+    """
+
+    def __init__(self, sock: socket.socket, buffer_size: int,
+                 batch_size: int = BATCH_SIZE, gro: bool = True):
+        self.socket = sock
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.gro = False
+        if not uses_mmsg(sock):
+            return
+        self.gro = gro and enable_udp_option(sock, UDP_GRO, 1)
+        if self.gro:
+            self.buffer_size = max(buffer_size, GRO_BUFFER_SIZE)
+        self.data = bytearray(batch_size * self.buffer_size)
+        self.names = bytearray(batch_size * SOCKADDR_SIZE)
+        iovecs = bytearray(batch_size * IOVEC_SIZE)
+        self.control = bytearray(batch_size * CONTROL_SIZE)
+        self.headers = bytearray(batch_size * MMSGHDR_SIZE)
+        self.pins = [
+            pin(buffer)
+            for buffer in (
+                self.data, self.names, iovecs, self.control, self.headers
+            )
+        ]
+        data_address, names_address, iovecs_address, control_address, \
+            headers_address = [address for _, address in self.pins]
+        for i in range(batch_size):
+            IOVEC.pack_into(
+                iovecs, i * IOVEC_SIZE,
+                data_address + i * self.buffer_size, self.buffer_size
+            )
+        self.template = message_headers(
+            batch_size, names_address, iovecs_address, control_address,
+            CONTROL_SIZE if self.gro else 0
+        )
+        self.headers_address = headers_address
+        self.addresses: dict[bytes, tuple] = {}
+
+    def receive(self) -> list[tuple[bytes, tuple]]:
+        if not uses_mmsg(self.socket):
+            return self.receive_one()
+        # Restaura msg_namelen y msg_controllen, que el kernel sobrescribe
+        self.headers[:] = self.template
+        count = libc.recvmmsg(
+            self.socket.fileno(), self.headers_address, self.batch_size,
+            MSG_WAITFORONE, None
+        )
+        if count < 0:
+            if ctypes.get_errno() == errno.EINTR:
+                return []
+            raise_errno()
+        data = memoryview(self.data)
+        received = []
+        for i in range(count):
+            header = i * MMSGHDR_SIZE
+            length, = UINT.unpack_from(self.headers, header + MSG_LEN_OFFSET)
+            name_length, = UINT.unpack_from(
+                self.headers, header + NAMELEN_OFFSET)
+            name_start = i * SOCKADDR_SIZE
+            name = bytes(self.names[name_start:name_start + name_length])
+            addr = self.addresses.get(name)
+            if addr is None:
+                if len(self.addresses) >= MAX_CACHED_ADDRESSES:
+                    self.addresses.clear()
+                addr = self.addresses[name] = decode_address(name)
+            start = i * self.buffer_size
+            datagram = bytes(data[start:start + length])
+            segment_size = self.segment_size(i) if self.gro else 0
+            if segment_size and segment_size < length:
+                for segment in split_segments(datagram, segment_size):
+                    received.append((segment, addr))
+            else:
+                received.append((datagram, addr))
+        return received
+
+    def segment_size(self, index: int) -> int:
+        control_length, = SIZE.unpack_from(
+            self.headers, index * MMSGHDR_SIZE + CONTROLLEN_OFFSET)
+        if control_length < CMSG_HEADER.size + CMSG_INT.size:
+            return 0
+        start = index * CONTROL_SIZE
+        _, level, kind = CMSG_HEADER.unpack_from(self.control, start)
+        return gro_segment_size(
+            level, kind,
+            self.control[start + CMSG_HEADER.size:start + CONTROL_SIZE]
+        )
+
+    def receive_one(self) -> list[tuple[bytes, tuple]]:
+        if not self.gro:
+            return [self.socket.recvfrom(self.buffer_size)]
+        data, ancillary, _, addr = self.socket.recvmsg(
+            self.buffer_size, CONTROL_SIZE)
+        for level, kind, control in ancillary:
+            segment_size = gro_segment_size(level, kind, control)
+            if segment_size:
+                return [
+                    (segment, addr)
+                    for segment in split_segments(data, segment_size)
+                ]
+        return [(data, addr)]
+
+
+class BatchSender:
+    """
+    Envía varios datagramas, cada uno formado por una lista de buffers, con
+    una llamada a sendmmsg por cada BATCH_SIZE datagramas.
+
+    Cada datagrama se arma en un area de memoria fija, que es la unica copia
+    en espacio de usuario. Si el kernel soporta UDP_SEGMENT, los datagramas
+    consecutivos del mismo tamaño hacia el mismo destino se envían como un
+    solo buffer que el kernel (o la placa de red) divide. Sin sendmmsg se
+    envían de a uno con sendto.
+    """
+
+    def __init__(self, sock: Any, batch_size: int = BATCH_SIZE,
+                 gso: bool = True):
+        self.socket = sock
+        self.batch_size = batch_size
+        self.gso = False
+        if not uses_mmsg(sock):
+            return
+        self.gso = gso and enable_udp_option(sock, UDP_SEGMENT, 0)
+        self.names = bytearray(batch_size * SOCKADDR_SIZE)
+        self.iovecs = bytearray(batch_size * IOVEC_SIZE)
+        self.control = bytearray(batch_size * CONTROL_SIZE)
+        self.headers = bytearray(batch_size * MMSGHDR_SIZE)
+        self.pins = [
+            pin(buffer)
+            for buffer in (
+                self.names, self.iovecs, self.control, self.headers
+            )
+        ]
+        names_address, iovecs_address, control_address, \
+            self.headers_address = [address for _, address in self.pins]
+        self.headers[:] = message_headers(
+            batch_size, names_address, iovecs_address, control_address, 0)
+        self.arena = bytearray()
+        self.arena_pin = None
+        self.arena_address = 0
+        self.encoded: dict[tuple, bytes] = {}
+
+    def send(self, messages: Sequence[tuple[Sequence[Any], tuple]]):
+        if not uses_mmsg(self.socket):
+            for buffers, addr in messages:
+                self.socket.sendto(b''.join(buffers), addr)
+            return
+        for start in range(0, len(messages), self.batch_size):
+            self.send_chunk(messages[start:start + self.batch_size])
+
+    def send_datagrams(
+        self, datagrams: Sequence[Any], addr: tuple, header_size: int
+    ):
+        # Como send, para datagramas con header y payload hacia un mismo
+        # destino: cada header se escribe directo en el arena con su
+        # pack_into, sin armar antes sus bytes
+        if not uses_mmsg(self.socket):
+            for datagram in datagrams:
+                self.socket.sendto(datagram.to_bytes(), addr)
+            return
+        for start in range(0, len(datagrams), self.batch_size):
+            self.send_datagram_chunk(
+                datagrams[start:start + self.batch_size], addr, header_size)
+
+    def send_datagram_chunk(
+        self, datagrams: Sequence[Any], addr: tuple, header_size: int
+    ):
+        self.reserve(sum(header_size + len(d.data) for d in datagrams))
+        arena = self.arena
+        packed = []
+        offset = 0
+        for datagram in datagrams:
+            start = offset
+            datagram.header.pack_into(arena, offset)
+            offset += header_size
+            end = offset + len(datagram.data)
+            arena[offset:end] = datagram.data
+            offset = end
+            self.add_run(packed, start, offset - start, addr)
+        self.flush(
+            packed,
+            lambda sent: self.send_datagram_chunk(
+                datagrams[sent:], addr, header_size)
+        )
+
+    def send_chunk(self, messages: Sequence[tuple[Sequence[Any], tuple]]):
+        self.reserve(sum(len(buffer) for buffers, _ in messages
+                         for buffer in buffers))
+        packed = []
+        offset = 0
+        for buffers, addr in messages:
+            start = offset
+            for buffer in buffers:
+                end = offset + len(buffer)
+                self.arena[offset:end] = buffer
+                offset = end
+            self.add_run(packed, start, offset - start, addr)
+        self.flush(packed, lambda sent: self.send_chunk(messages[sent:]))
+
+    def reserve(self, total: int):
+        if total > len(self.arena):
+            self.arena_pin = None
+            self.arena = bytearray(total)
+            self.arena_pin, self.arena_address = pin(self.arena)
+
+    def add_run(self, packed: list, start: int, length: int, addr: tuple):
+        # Cada mensaje de sendmmsg es una tanda de datagramas contiguos en
+        # el arena: [inicio, largo, destino, tamaño de segmento, cantidad]
+        if self.gso and packed and \
+                self.coalesces(packed[-1], length, addr):
+            run = packed[-1]
+            run[1] += length
+            run[4] += 1
+        else:
+            packed.append([start, length, addr, length, 1])
+
+    def flush(self, packed: list, resend: Callable[[int], None]):
+        # resend reenvia los datagramas desde el indice que recibe
+        for i, (start, length, addr, segment_size, count) in \
+                enumerate(packed):
+            IOVEC.pack_into(
+                self.iovecs, i * IOVEC_SIZE,
+                self.arena_address + start, length
+            )
+            name = self.encoded.get(addr)
+            if name is None:
+                if len(self.encoded) >= MAX_CACHED_ADDRESSES:
+                    self.encoded.clear()
+                name = self.encoded[addr] = encode_address(addr)
+            self.names[i * SOCKADDR_SIZE:i * SOCKADDR_SIZE + len(name)] = name
+            UINT.pack_into(
+                self.headers, i * MMSGHDR_SIZE + NAMELEN_OFFSET, len(name))
+            control_length = 0
+            if count > 1:
+                control_length = CONTROL_SIZE
+                CMSG_SEGMENT.pack_into(
+                    self.control, i * CONTROL_SIZE,
+                    CMSG_SEGMENT.size, socket.SOL_UDP, UDP_SEGMENT,
+                    segment_size
+                )
+            SIZE.pack_into(
+                self.headers, i * MMSGHDR_SIZE + CONTROLLEN_OFFSET,
+                control_length
+            )
+        sent = 0
+        while sent < len(packed):
+            count = libc.sendmmsg(
+                self.socket.fileno(),
+                self.headers_address + sent * MMSGHDR_SIZE,
+                len(packed) - sent, 0
+            )
+            if count < 0:
+                error = ctypes.get_errno()
+                if error == errno.EINTR:
+                    continue
+                if self.gso and error in (errno.EIO, errno.EINVAL):
+                    # La interfaz no admite segmentacion, se reenvia el
+                    # resto de a un datagrama
+                    self.gso = False
+                    resend(sum(run[4] for run in packed[:sent]))
+                    return
+                raise_errno()
+            sent += count
+
+    def coalesces(self, run: list, length: int, addr: tuple) -> bool:
+        _, run_length, run_addr, segment_size, count = run
+        # Todos los segmentos miden lo mismo salvo el ultimo, que puede
+        # ser mas corto y cierra la tanda
+        return run_addr == addr and length <= segment_size and \
+            run_length == segment_size * count and \
+            count < GSO_MAX_SEGMENTS and \
+            run_length + length <= GSO_MAX_BYTES
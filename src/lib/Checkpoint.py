@@ -0,0 +1,74 @@
+import os
+import struct
+from typing import Optional
+from .Streams import SINGLE_STREAM
+import logging
+
+CHECKPOINT_SUFFIX = '.checkpoint'
+# Tamaño y mtime del archivo de origen, y bytes escritos sin huecos
+CHECKPOINT_FORMAT = struct.Struct('!QQQ')
+
+
+class Checkpoint:
+    """
+    Avance durable de un archivo recibido parcialmente.
+
+    Se guarda junto al archivo, en un archivo con el sufijo
+    CHECKPOINT_SUFFIX, la identidad del archivo de origen y la cantidad de
+    bytes desde el inicio que ya están en disco. Una transferencia del
+    mismo archivo puede entonces reanudarse desde ese offset. Cuando el
+    archivo se transfiere en varios streams cada uno tiene su checkpoint,
+    con el avance dentro de su rango.
+    """
+
+    def __init__(
+        self,
+        filepath: str,
+        identity: Optional[tuple[int, int]] = None,
+        stream: tuple[int, int] = SINGLE_STREAM
+    ):
+        self.filepath = filepath
+        index, count = stream
+        suffix = f'.{index}-{count}' if count > 1 else ''
+        self.path = filepath + suffix + CHECKPOINT_SUFFIX
+        self.identity = identity
+
+    def read(self) -> Optional[tuple[tuple[int, int], int]]:
+        try:
+            with open(self.path, 'rb') as file:
+                data = file.read(CHECKPOINT_FORMAT.size)
+        except OSError:
+            return None
+        if len(data) != CHECKPOINT_FORMAT.size or \
+                not os.path.isfile(self.filepath):
+            return None
+        size, mtime, offset = CHECKPOINT_FORMAT.unpack(data)
+        return (size, mtime), offset
+
+    def load(self) -> int:
+        # Offset desde el que se puede reanudar, 0 si el checkpoint no es
+        # del mismo archivo
+        checkpoint = self.read()
+        if checkpoint is None or checkpoint[0] != self.identity:
+            return 0
+        return min(checkpoint[1], self.identity[0])
+
+    def save(self, offset: int):
+        size, mtime = self.identity
+        temporary = self.path + '.tmp'
+        try:
+            with open(temporary, 'wb') as file:
+                file.write(CHECKPOINT_FORMAT.pack(size, mtime, offset))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, self.path)
+        except OSError as e:
+            logging.error(f"No se pudo guardar el checkpoint: {e}")
+            return
+        logging.debug(f"Checkpoint guardado: {offset} bytes")
+
+    def remove(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
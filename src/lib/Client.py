@@ -1,25 +1,34 @@
 from pathlib import Path
+from typing import Optional
 from socket import socket
 from socket import timeout
 from time import time
 from threading import Thread
-from queue import Queue
 from .Flags import Flags
-from .Header import Header
+from .Header import Header, HEADER_SIZE
 from .Datagram import Datagram
 from .Messages.UploadACK import UploadACK
-from .Messages.UploadSYN import UploadSYN
+from .Messages.UploadSYN import UploadSYN, MAX_FILE_SIZE
 from .Messages.DownloadACK import DownloadACK
 from .Messages.DownloadSYN import DownloadSYN
 from .RecoveryProtocol import RecoveryProtocol
 from .Endpoint import Endpoint
-from .Util import read_file
+from .FileSource import FileSource
+from .BatchIO import BatchReceiver, set_socket_buffers
+from .MSS import local_mss, negotiate_mss
+from .FEC import FecParams, NO_FEC_PARAMS
+from .Compression import NO_COMPRESSION
+from .Util import open_file, open_sink
+from .Checkpoint import Checkpoint
+from .Streams import SINGLE_STREAM, stream_range
+from .Batch import BatchSink
+from .IngressQueue import IngressQueue
+from .Admission import COOKIE_SIZE, NO_COOKIE, migration_proof
 import logging
 
 
-MSS = 1024
 INITIAL_RTT = 1
-TIMEOUT_COEFFICIENT = 4
+# Ventana inicial, luego la ajusta el control de congestion
 WINDOW_SIZE = 4
 
 
@@ -30,14 +39,37 @@ class Client:
         filepath: str,
         filename: str,
         remote_addr: tuple[str, int],
-        socket: socket
+        socket: socket,
+        mss: Optional[int] = None,
+        stream: tuple[int, int] = SINGLE_STREAM,
+        rate_limit: Optional[float] = None,
+        fec: FecParams = NO_FEC_PARAMS,
+        compression: int = NO_COMPRESSION
     ):
-        self.endpoint = Endpoint(WINDOW_SIZE, MSS, socket, remote_addr)
+        set_socket_buffers(socket)
+        # Sin MSS configurado se usa el que entra en el MTU del camino
+        self.endpoint = Endpoint(
+            WINDOW_SIZE, local_mss(remote_addr, mss), socket, remote_addr)
+        self.endpoint.rate_limit = rate_limit
         self.filepath = filepath
         self.filename = filename
         self.rp = recovery_protocol
+        # Cookie con la que se abrió la sesión, prueba ante el servidor que
+        # una dirección nueva es de este cliente
+        self.cookie = NO_COOKIE
+        # Indice y cantidad de streams, cada uno transfiere un rango del
+        # archivo con su propio socket
+        self.stream = stream
+        # Envio del ultimo SYN, y si fue una retransmisión por timeout
+        self.syn_sent = 0.0
+        self.syn_retransmitted = False
+        # Bloques FEC que se piden al servidor
+        self.fec = fec
+        # Compresión de los segmentos que se pide al servidor
+        self.compression = compression
 
-    def handshake_upload(self, syn_payload):
+    def handshake_upload(self, syn: UploadSYN, retransmission: bool = False):
+        syn_payload = syn.to_bytes()
         header = Header(
             len(syn_payload),
             self.endpoint.seq,
@@ -47,6 +79,8 @@ class Client:
 
         datagram = Datagram(header, syn_payload).to_bytes()
         try:
+            self.syn_sent = time()
+            self.syn_retransmitted = retransmission
             self.endpoint.send_message(datagram)
             logging.debug("SYN enviado para upload")
             data = self.endpoint.receive_message()
@@ -56,17 +90,26 @@ class Client:
             if response.is_error():
                 logging.error(response.analyze().msg)
                 return None
+            if response.is_cookie():
+                # El servidor pide repetir el SYN con su cookie
+                logging.debug("Cookie recibida, reenviando SYN")
+                syn.cookie = bytes(response.data)
+                return self.handshake_upload(syn)
             if response.is_upload_ack():
                 self.endpoint.set_timeout(None)
+                # Desde ahora cada datagrama lleva el ID de la sesión
+                self.endpoint.connection_id = response.header.connection_id
+                self.cookie = syn.cookie
                 logging.info("Handshake de upload completado")
                 return response
             logging.warning("No es un SYN ACK, reintentando handshake")
-            return self.handshake_upload(syn_payload)
+            return self.handshake_upload(syn, True)
         except timeout:
             logging.warning("Timeout durante handshake, reintentando")
-            return self.handshake_upload(syn_payload)
+            return self.handshake_upload(syn, True)
 
-    def handshake_download(self, syn_payload):
+    def handshake_download(self, syn: DownloadSYN):
+        syn_payload = syn.to_bytes()
         header = Header(
             len(syn_payload),
             self.endpoint.seq,
@@ -85,17 +128,24 @@ class Client:
             if response.is_error():
                 logging.error(response.analyze().msg)
                 return None
+            if response.is_cookie():
+                # El servidor pide repetir el SYN con su cookie
+                logging.debug("Cookie recibida, reenviando SYN")
+                syn.cookie = bytes(response.data)
+                return self.handshake_download(syn)
             if not response.is_download_ack():
                 logging.warning("No es un SYN ACK, reintentando handshake")
-                return self.handshake_download(syn_payload)
+                return self.handshake_download(syn)
             self.endpoint.set_timeout(None)
+            self.endpoint.connection_id = response.header.connection_id
+            self.cookie = syn.cookie
             self.endpoint.increment_seq()
             self.endpoint.ack = response.get_sequence_number()
             self.handshake_download_2(datagram)
             return response
         except timeout:
             logging.warning("Timeout durante handshake, reintentando")
-            return self.handshake_download(syn_payload)
+            return self.handshake_download(syn)
 
     def handshake_download_2(self, datagram: Datagram):
         header = Header(
@@ -103,6 +153,7 @@ class Client:
             self.endpoint.seq,
             self.endpoint.ack,
             Flags.ACK,
+            connection_id=self.endpoint.connection_id
         )
 
         datagram = Datagram(header, b"").to_bytes()
@@ -111,29 +162,61 @@ class Client:
         logging.info("ACK enviado para completar handshake de download")
 
     def start_upload(self):
-        file_data = read_file(self.filepath)
+        source = open_file(self.filepath)
         self.endpoint.set_timeout(INITIAL_RTT)
-        if file_data is None:
+        if source is None:
             return
-        syn_payload = UploadSYN(
+        with source:
+            self.upload(source)
+
+    def upload(self, source: FileSource):
+        # El tamaño no entraría en el campo de 4 bytes del SYN
+        if len(source) > MAX_FILE_SIZE:
+            logging.error(
+                f"El archivo es demasiado grande para ser subido: "
+                f"{len(source)} bytes, el máximo es {MAX_FILE_SIZE}")
+            return
+        syn = UploadSYN(
             self.filename,
-            len(file_data),
-            self.rp.PROTOCOL_ID
-        ).to_bytes()
+            len(source),
+            self.endpoint.mss,
+            self.rp.PROTOCOL_ID,
+            source.identity[1],
+            self.stream,
+            source.manifest_size,
+            fec=self.fec,
+            compression=self.compression
+        )
 
         start = time()
-        syn_ack = self.handshake_upload(syn_payload)
+        syn_ack = self.handshake_upload(syn)
         if syn_ack is None:
             logging.error("Handshake fallido durante upload")
             return
-        rtt = time() - start
+        # El RTT inicial se mide solo sobre el SYN respondido, sin el
+        # intercambio de la cookie. Si ese SYN fue una retransmisión la
+        # muestra es ambigua y no se usa (regla de Karn)
+        rtt = None
+        if not self.syn_retransmitted:
+            rtt = time() - self.syn_sent
 
         ack_payload = syn_ack.analyze()
 
         if not isinstance(ack_payload, UploadACK):
             logging.error(f"Error durante upload: {ack_payload.msg}")
             return
-        queue = Queue(-1)
+        self.endpoint.update_mss(
+            negotiate_mss(ack_payload.mss, self.endpoint.mss))
+        self.endpoint.fec = ack_payload.fec
+        self.endpoint.compression = ack_payload.compression
+        range_start, range_end = stream_range(len(source), self.stream)
+        offset = min(max(ack_payload.offset, range_start), range_end)
+        if offset > range_start:
+            logging.info(f"Reanudando upload desde el byte {offset}")
+        source.skip(offset)
+        source.limit(range_end - offset)
+        queue = IngressQueue()
+        self.endpoint.ingress = queue
         thread = Thread(
             target=self.enqueue_incoming_packets,
             args=(queue,),
@@ -141,14 +224,18 @@ class Client:
         )
         thread.start()
         logging.info("Iniciando envío de archivo")
-        self.rp.send(
-            self.endpoint,
-            file_data,
-            queue,
-            ack_payload.mss,
-            Flags.UPLOAD,
-            rtt * TIMEOUT_COEFFICIENT
-        )
+        try:
+            self.rp.send(
+                self.endpoint,
+                source,
+                queue,
+                self.endpoint.mss,
+                Flags.UPLOAD,
+                rtt
+            )
+        except (ConnectionAbortedError, TimeoutError) as e:
+            logging.error(f"Upload abortado: {e}")
+            return
         logging.info("Archivo enviado con éxito")
 
         end = time() - start
@@ -156,13 +243,22 @@ class Client:
 
     def start_download(self):
         self.endpoint.set_timeout(INITIAL_RTT)
-        payload = DownloadSYN(
+        filepath = str(Path(self.filepath) / self.filename)
+        # Una descarga anterior incompleta deja un checkpoint
+        checkpoint = Checkpoint(filepath, stream=self.stream)
+        identity, offset = checkpoint.read() or ((0, 0), 0)
+        syn = DownloadSYN(
             self.filename,
-            MSS,
-            self.rp.PROTOCOL_ID
-        ).to_bytes()
+            self.endpoint.mss,
+            self.rp.PROTOCOL_ID,
+            offset,
+            identity,
+            self.stream,
+            fec=self.fec,
+            compression=self.compression
+        )
         start = time()
-        syn_ack = self.handshake_download(payload)
+        syn_ack = self.handshake_download(syn)
         logging.info("Handshake finalizado para download")
         if syn_ack is None:
             logging.error("Handshake fallido durante download")
@@ -172,8 +268,13 @@ class Client:
         if not isinstance(ack_payload, DownloadACK):
             logging.error(f"Error durante download: {ack_payload.msg}")
             return
-        filepath = str(Path(self.filepath) / self.filename)
-        queue = Queue(-1)
+        self.endpoint.update_mss(
+            negotiate_mss(ack_payload.mss, self.endpoint.mss))
+        self.endpoint.fec = ack_payload.fec
+        self.endpoint.compression = ack_payload.compression
+        checkpoint.identity = ack_payload.identity
+        queue = IngressQueue()
+        self.endpoint.ingress = queue
         thread = Thread(
             target=self.enqueue_incoming_packets,
             args=(queue,),
@@ -181,16 +282,56 @@ class Client:
         )
         thread.start()
         logging.info(f"Iniciando descarga del archivo: {self.filename}")
-        with open(filepath, "wb") as file:
-            self.rp.receive(
-                self.endpoint, file, queue, ack_payload.filesize
+        if ack_payload.manifest_size:
+            # El nombre pedido es un directorio del servidor
+            sink = BatchSink(
+                filepath, ack_payload.filesize, self.endpoint.mss,
+                ack_payload.manifest_size
+            )
+        else:
+            sink = open_sink(
+                filepath, ack_payload.filesize, self.endpoint.mss,
+                ack_payload.offset, checkpoint, self.stream
             )
+        try:
+            receiver = self.rp.receive(self.endpoint, sink, queue)
+        except (ConnectionAbortedError, TimeoutError) as e:
+            # El archivo parcial y su checkpoint quedan para reanudar
+            logging.error(f"Download abortado: {e}")
+            return
+        self.rp.wait_close(receiver, queue)
         logging.info("Descarga finalizada con éxito")
         end = time() - start
         logging.info(f"Tiempo de transferencia: {end:.2f} segundos")
 
     def enqueue_incoming_packets(self, queue):
+        receiver = BatchReceiver(
+            self.endpoint.socket, self.endpoint.buffer_size)
         while True:
-            data = self.endpoint.receive_message()
-            queue.put(data)
-            logging.debug("Paquete recibido y encolado")
+            for data, _ in receiver.receive():
+                if self.is_challenge(data):
+                    logging.info("Cookie de migración recibida, respondiendo")
+                    self.answer_challenge(data)
+                    continue
+                if queue.offer(data):
+                    logging.debug("Paquete recibido y encolado")
+                else:
+                    logging.debug("Cola de entrada llena, paquete descartado")
+
+    def is_challenge(self, data: bytes) -> bool:
+        if len(data) != HEADER_SIZE + COOKIE_SIZE:
+            return False
+        datagram = Datagram.from_bytes(data)
+        return datagram.is_cookie() and \
+            datagram.header.connection_id == self.endpoint.connection_id
+
+    def answer_challenge(self, data: bytes):
+        # El servidor valida una dirección nueva del cliente: la sesión
+        # migra cuando recibe la cookie de vuelta junto con su prueba
+        challenge = data[HEADER_SIZE:]
+        response = challenge + migration_proof(self.cookie, challenge)
+        header = Header(
+            len(response), 0, 0, Flags.COOKIE,
+            connection_id=self.endpoint.connection_id
+        )
+        self.endpoint.send_message(Datagram(header, response).to_bytes())
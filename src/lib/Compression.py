@@ -0,0 +1,194 @@
+from threading import Condition, Lock, Thread
+from typing import Optional
+import logging
+import lzma
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    # Sin zstandard solo se ofrecen los códigos de la biblioteca estándar
+    zstandard = None
+
+HAS_ZSTD = zstandard is not None
+
+# Código de los segmentos, negociado en el handshake
+NO_COMPRESSION = 0
+ZLIB = 1
+LZMA = 2
+ZSTD = 3
+COMPRESSIONS = {'zlib': ZLIB, 'lzma': LZMA, 'zstd': ZSTD}
+# Niveles rápidos: cada segmento se comprime por separado y el compresor
+# no debe quedar detrás del emisor
+ZLIB_LEVEL = 1
+LZMA_FILTERS = [{'id': lzma.FILTER_LZMA2, 'preset': 0}]
+ZSTD_LEVEL = 3
+# Un segmento se envía comprimido solo si se achica al menos esta fracción
+MIN_SAVING = 0.1
+# Segmentos que el compresor prepara por delante del ultimo pedido
+LOOKAHEAD = 64
+# Tras esta cantidad de segmentos seguidos que no se achican solo se prueba
+# uno de cada PROBE_INTERVAL
+SKIP_AFTER = 8
+PROBE_INTERVAL = 16
+
+
+class ZlibCodec:
+    # Deflate sin el header ni el checksum de zlib, el UDP ya tiene uno
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, ZLIB_LEVEL, wbits=-15)
+
+    def decompress(self, data: bytes, length: int) -> Optional[bytes]:
+        try:
+            return zlib.decompressobj(wbits=-15).decompress(data, length)
+        except zlib.error:
+            return None
+
+
+class LzmaCodec:
+    # LZMA2 en formato crudo, sin los headers de .xz
+
+    def compress(self, data: bytes) -> bytes:
+        return lzma.compress(data, lzma.FORMAT_RAW, filters=LZMA_FILTERS)
+
+    def decompress(self, data: bytes, length: int) -> Optional[bytes]:
+        decompressor = lzma.LZMADecompressor(
+            lzma.FORMAT_RAW, filters=LZMA_FILTERS)
+        try:
+            return decompressor.decompress(data, length)
+        except lzma.LZMAError:
+            return None
+
+
+class ZstdCodec:
+    def __init__(self):
+        self.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        self.decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def decompress(self, data: bytes, length: int) -> Optional[bytes]:
+        try:
+            return self.decompressor.decompress(data, max_output_size=length)
+        except zstandard.ZstdError:
+            return None
+
+
+CODECS = {ZLIB: ZlibCodec, LZMA: LzmaCodec}
+if HAS_ZSTD:
+    CODECS[ZSTD] = ZstdCodec
+
+
+def compression_codec(compression: int):
+    return CODECS[compression]()
+
+
+def negotiate_compression(offer: int, supported: bool) -> int:
+    # El código que pidió el cliente, si este lado lo tiene
+    if not supported or offer == NO_COMPRESSION:
+        return NO_COMPRESSION
+    if offer not in CODECS:
+        logging.warning(f"Compresión {offer} no disponible, se envía sin "
+                        f"comprimir")
+        return NO_COMPRESSION
+    return offer
+
+
+class SegmentCompressor:
+    """
+    Etapa de compresión del emisor.
+
+    Cada segmento se comprime por separado, así sigue ocupando su lugar
+    en el archivo y la reanudación, el bitmap del sink y FEC no cambian.
+    Un thread comprime los segmentos que siguen al ultimo que pidió el
+    emisor, hasta LOOKAHEAD por delante, y el emisor solo toma el
+    resultado: la compresión no demora los envios ni el procesamiento de
+    los ACKs. Un segmento que no está listo cuando se pide, o que no se
+    achica al menos MIN_SAVING, se envía sin comprimir. Tras SKIP_AFTER
+    segmentos seguidos que no se achican solo se prueba uno de cada
+    PROBE_INTERVAL, por lo que los datos ya comprimidos no gastan CPU.
+    """
+
+    def __init__(self, codec, source, mss: int, lookahead: int = LOOKAHEAD):
+        self.codec = codec
+        self.source = source
+        self.mss = mss
+        self.segments = source.segment_count(mss)
+        self.lookahead = lookahead
+        self.ready: dict[int, bytes] = {}
+        # Proximo segmento que va a pedir el emisor y proximo a comprimir
+        self.position = 0
+        self.next = 0
+        self.incompressible = 0
+        self.saved = 0
+        self.closed = False
+        self.condition = Condition()
+        # La fuente no se lee desde dos threads a la vez: BatchSource abre
+        # y cierra archivos en cada lectura
+        self.lock = Lock()
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def segment(self, index: int) -> bytes:
+        # El segmento index tal como se envía
+        with self.condition:
+            data = self.ready.pop(index, None)
+            if index >= self.position:
+                self.position = index + 1
+                self.condition.notify()
+        if data is None:
+            return self.read(index)
+        self.saved += \
+            min(self.mss, len(self.source) - index * self.mss) - len(data)
+        return data
+
+    def read(self, index: int) -> bytes:
+        with self.lock:
+            return self.source.read_segment(index, self.mss)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.closed and not self.pending():
+                    self.condition.wait()
+                if self.closed:
+                    return
+                # Los segmentos que el emisor ya pidió se saltean
+                index = max(self.next, self.position)
+                self.next = index + 1
+            data = self.compress(index)
+            if data is None:
+                continue
+            with self.condition:
+                if index >= self.position and not self.closed:
+                    self.ready[index] = data
+
+    def pending(self) -> bool:
+        index = max(self.next, self.position)
+        return index < self.segments and \
+            index < self.position + self.lookahead
+
+    def compress(self, index: int) -> Optional[bytes]:
+        # El segmento comprimido, o None si no conviene comprimirlo
+        if self.incompressible >= SKIP_AFTER and index % PROBE_INTERVAL:
+            return None
+        with self.lock:
+            if self.closed:
+                return None
+            raw = self.source.read_segment(index, self.mss)
+        compressed = self.codec.compress(raw)
+        if len(compressed) > len(raw) * (1 - MIN_SAVING):
+            self.incompressible += 1
+            return None
+        self.incompressible = 0
+        return compressed
+
+    def close(self):
+        # Luego de cerrarlo el thread no vuelve a leer la fuente
+        with self.lock, self.condition:
+            self.closed = True
+            self.ready.clear()
+            self.condition.notify()
+        logging.info(f"Compresión: {self.saved} bytes ahorrados")
@@ -0,0 +1,88 @@
+from abc import ABC, abstractmethod
+from typing import Optional
+
+# Limite del campo window del header
+MAX_WINDOW = 0xFFFF
+
+
+class CongestionControl(ABC):
+    """
+    Ventana de congestion en segmentos, actualizada a partir de los ACKs y
+    timeouts del emisor.
+    """
+
+    def __init__(self, initial_window: int, max_window: int = MAX_WINDOW):
+        self.cwnd = float(initial_window)
+        self.ssthresh = float(max_window)
+        self.max_window = max_window
+
+    @property
+    def window(self) -> int:
+        return max(1, int(self.cwnd))
+
+    @abstractmethod
+    def on_ack(self, acked: int, rtt_sample: Optional[float]):
+        pass
+
+    def on_timeout(self):
+        self.ssthresh = max(self.cwnd / 2, 2)
+        self.cwnd = 1
+
+    def on_loss(self):
+        # Perdida detectada por ACKs duplicados: los segmentos siguientes
+        # llegaron, la red no está congestionada como en un timeout
+        self.ssthresh = max(self.cwnd / 2, 2)
+        self.cwnd = self.ssthresh
+
+    def clamp(self):
+        self.cwnd = min(max(self.cwnd, 1), self.max_window)
+
+
+class Reno(CongestionControl):
+    # Slow start hasta ssthresh, luego incremento aditivo de un segmento
+    # por RTT. En timeout se reduce a la mitad el umbral y la ventana
+    # vuelve a 1, ante ACKs duplicados la ventana se reduce a la mitad
+
+    def on_ack(self, acked: int, rtt_sample: Optional[float]):
+        for _ in range(acked):
+            if self.cwnd < self.ssthresh:
+                self.cwnd += 1
+            else:
+                self.cwnd += 1 / self.cwnd
+        self.clamp()
+
+
+class Vegas(CongestionControl):
+    # Control basado en delay: compara el throughput esperado con el real
+    # y mantiene entre ALPHA y BETA segmentos encolados en la red
+    ALPHA = 2
+    BETA = 4
+    GAMMA = 1
+
+    def __init__(self, initial_window: int, max_window: int = MAX_WINDOW):
+        super().__init__(initial_window, max_window)
+        self.base_rtt = None
+
+    def on_ack(self, acked: int, rtt_sample: Optional[float]):
+        if rtt_sample is None or rtt_sample <= 0:
+            return
+        if self.base_rtt is None or rtt_sample < self.base_rtt:
+            self.base_rtt = rtt_sample
+        queued = self.cwnd * (1 - self.base_rtt / rtt_sample)
+        for _ in range(acked):
+            if self.cwnd < self.ssthresh:
+                if queued > self.GAMMA:
+                    self.ssthresh = self.cwnd
+                else:
+                    self.cwnd += 1
+            elif queued < self.ALPHA:
+                self.cwnd += 1 / self.cwnd
+            elif queued > self.BETA:
+                self.cwnd -= 1 / self.cwnd
+        self.clamp()
+
+
+CONGESTION_CONTROLS = {
+    'reno': Reno,
+    'vegas': Vegas,
+}
@@ -1,8 +1,13 @@
-from .Header import Header, HEADER_SIZE
+from .Header import HEADER_SIZE, NO_CONNECTION, Header
 from .Flags import Flags
 
+# Un payload más grande se referencia con una vista en lugar de copiarlo.
+# Para payloads chicos la copia es más barata que crear la vista
+VIEW_THRESHOLD = 8192
+
 
 class Datagram:
+    __slots__ = ('header', 'data')
 
     def __init__(
         self, header: Header, data: bytes
@@ -15,7 +20,8 @@ class Datagram:
 
     # -> Mensaje
     def analyze(self):
-        return self.header.analyze(self.data)
+        # Los mensajes de control son chicos, se decodifican de una copia
+        return self.header.analyze(bytes(self.data))
 
     def get_sequence_number(self) -> int:
         return self.header.sequence_number
@@ -29,12 +35,24 @@ class Datagram:
     def is_fin(self) -> bool:
         return self.header.flags == Flags.FIN
 
+    def is_fin_ack(self) -> bool:
+        return self.header.flags == Flags.FIN_ACK
+
     def is_ack(self) -> bool:
         return self.header.flags == Flags.ACK
 
+    def is_cookie(self) -> bool:
+        return self.header.flags == Flags.COOKIE
+
     def is_error(self) -> bool:
         return self.header.flags == Flags.ERROR
 
+    def is_data(self) -> bool:
+        return self.header.flags in (Flags.UPLOAD, Flags.DOWNLOAD)
+
+    def is_repair(self) -> bool:
+        return bool(self.header.flags & Flags.REPAIR)
+
     def is_download_ack(self) -> bool:
         return self.header.flags == Flags.ACK_DOWNLOAD
 
@@ -44,14 +62,18 @@ class Datagram:
     @staticmethod
     def from_bytes(datagram) -> 'Datagram':
         header = Header.from_bytes(datagram)
-        return Datagram(
-            header,
-            datagram[HEADER_SIZE:HEADER_SIZE + header.payload_size]
-        )
+        end = HEADER_SIZE + header.payload_size
+        if header.payload_size < VIEW_THRESHOLD:
+            return Datagram(header, datagram[HEADER_SIZE:end])
+        return Datagram(header, memoryview(datagram)[HEADER_SIZE:end])
 
     @staticmethod
     def make_error_datagram(
-        seq_number: int, ack_number, payload: bytes
+        seq_number: int, ack_number, payload: bytes,
+        connection_id: int = NO_CONNECTION
     ) -> 'Datagram':
-        header = Header(len(payload), seq_number, ack_number, Flags.ERROR)
+        header = Header(
+            len(payload), seq_number, ack_number, Flags.ERROR,
+            connection_id=connection_id
+        )
         return Datagram(header, payload)
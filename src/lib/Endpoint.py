@@ -1,10 +1,17 @@
-from typing import Optional
+from typing import Optional, Union
 from socket import socket
 from lib.Datagram import Datagram
-from lib.Header import HEADER_SIZE
+from lib.Flags import Flags
+from lib.Header import HEADER, HEADER_SIZE, NO_CONNECTION
+from lib.TimerWheel import TimerWheel, DEFAULT_TIMER_WHEEL
+from lib.BatchIO import BatchSender
+from lib.FEC import NO_FEC_PARAMS
+from lib.Compression import NO_COMPRESSION
 
 INITIAL_ACK_NUMBER = 0
 INITIAL_SEQ_NUMBER = 0
+# Segmentos que el receptor acepta por delante del ultimo ACK acumulado
+RECEIVE_WINDOW = 256
 
 
 class Endpoint:
@@ -13,17 +20,43 @@ class Endpoint:
         window_size: int,
         mss: int,
         socket: socket,
-        remote_addr: str
+        remote_addr: str,
+        receive_window: int = RECEIVE_WINDOW,
+        timers: TimerWheel = DEFAULT_TIMER_WHEEL,
+        ingress=None
     ):
         self.ack = INITIAL_ACK_NUMBER
         self.seq = INITIAL_SEQ_NUMBER
         self.window_size = window_size
+        self.receive_window = receive_window
+        self.peer_window = window_size
+        self.mss = mss
         self.buffer_size = mss + HEADER_SIZE
         self.socket = socket
         self.remote_addr = remote_addr
         self.last_msg = None
+        self.timers = timers
+        self.batch_sender: Optional[BatchSender] = None
+        # Buffers donde se escriben el header de cada datagrama enviado y
+        # cada ACK, se reutilizan en lugar de armar bytes nuevos
+        self.header_buffer = bytearray(HEADER_SIZE)
+        self.ack_buffer = bytearray(HEADER_SIZE)
+        # Cola de entrada acotada, su espacio libre limita la ventana
+        # anunciada
+        self.ingress = ingress
+        # ID de la sesión en el servidor, viaja en cada header
+        self.connection_id = NO_CONNECTION
+        # Limite de tasa de envio de la transferencia en bytes por segundo
+        self.rate_limit: Optional[float] = None
+        # Flujo del planificador de salida del servidor. Si está, los
+        # datagramas de datos se encolan en él en lugar de enviarse
+        self.egress = None
+        # Bloques FEC negociados en el handshake
+        self.fec = NO_FEC_PARAMS
+        # Código de compresión de los segmentos negociado en el handshake
+        self.compression = NO_COMPRESSION
 
-    last_msg: Optional[bytes]
+    last_msg: Optional[Union[bytes, Datagram]]
 
     def increment_seq(self, value: int = 1):
         self.seq += value
@@ -34,12 +67,57 @@ class Endpoint:
     def update_window_size(self, new_size: int):
         self.window_size = new_size
 
+    def update_mss(self, mss: int):
+        self.mss = mss
+
+    @property
+    def advertised_window(self) -> int:
+        # Nunca se anuncia 0: no hay persist timer que reabra la ventana
+        if self.ingress is None:
+            return self.receive_window
+        return max(1, min(self.receive_window, self.ingress.free))
+
+    def update_peer_window(self, window: int):
+        if window > 0:
+            self.peer_window = window
+
+    def apply_congestion_window(self, congestion_window: int):
+        # La ventana de envio no supera la que anuncia el receptor
+        self.update_window_size(min(congestion_window, self.peer_window))
+
     def update_last_msg(self, ack_datagram: Datagram):
         self.last_msg = ack_datagram
 
     def send_message(self, data: bytes):
         self.socket.sendto(data, self.remote_addr)
 
+    def send_datagram(self, datagram: Datagram):
+        # Header y payload se envian con scatter/gather para no tener que
+        # concatenarlos en un nuevo buffer
+        if self.egress is not None:
+            self.egress.send((datagram,))
+        elif hasattr(self.socket, "sendmsg"):
+            datagram.header.pack_into(self.header_buffer)
+            self.socket.sendmsg(
+                (self.header_buffer, datagram.data), (), 0, self.remote_addr)
+        else:
+            self.send_message(datagram.to_bytes())
+
+    def send_ack(
+        self, sequence_number: int, window: int = 0, payload: bytes = b''
+    ) -> bytearray:
+        # Escribe el ACK en el buffer de ACKs, sin armar Header ni Datagram.
+        # Devuelve el buffer, que se sobrescribe con el proximo ACK
+        if len(self.ack_buffer) != HEADER_SIZE + len(payload):
+            self.ack_buffer = bytearray(HEADER_SIZE + len(payload))
+        HEADER.pack_into(
+            self.ack_buffer, 0, len(payload), sequence_number, self.ack,
+            Flags.ACK, window, self.connection_id
+        )
+        self.ack_buffer[HEADER_SIZE:] = payload
+        self.send_message(self.ack_buffer)
+        return self.ack_buffer
+
     def receive_message(self):
         data, _ = self.socket.recvfrom(self.buffer_size)
         return data
@@ -47,5 +125,20 @@ class Endpoint:
     def set_timeout(self, time: float):
         self.socket.settimeout(time)
 
+    def send_datagrams(self, datagrams: list[Datagram]):
+        # Una sola syscall para toda la rafaga cuando hay sendmmsg
+        if self.egress is not None:
+            self.egress.send(datagrams)
+        elif len(datagrams) == 1:
+            self.send_datagram(datagrams[0])
+        elif datagrams:
+            if self.batch_sender is None:
+                self.batch_sender = BatchSender(self.socket)
+            self.batch_sender.send_datagrams(
+                datagrams, self.remote_addr, HEADER_SIZE)
+
     def send_last_message(self):
-        self.send_message(self.last_msg)
+        if isinstance(self.last_msg, Datagram):
+            self.send_datagram(self.last_msg)
+        else:
+            self.send_message(self.last_msg)
@@ -0,0 +1,338 @@
+from typing import Callable, NamedTuple, Optional, Sequence
+import logging
+
+try:
+    import numpy
+except ImportError:
+    # Sin NumPy solo se ofrece la paridad XOR
+    numpy = None
+
+HAS_NUMPY = numpy is not None
+
+# Código de los segmentos de reparación
+NO_FEC = 0
+XOR = 1
+REED_SOLOMON = 2
+# Segmentos de datos y de reparación por bloque. Con Reed-Solomon sobre
+# GF(2^8) un bloque tiene a lo sumo 256 segmentos
+MAX_BLOCK = 64
+MAX_REPAIR = 16
+DEFAULT_BLOCK = 8
+# Polinomio primitivo de GF(2^8), el mismo de los códigos de QR y RAID 6
+GF_POLYNOMIAL = 0x11D
+
+
+class FecParams(NamedTuple):
+    # Parámetros negociados en el handshake, viajan en los SYN y sus ACK
+    scheme: int = NO_FEC
+    k: int = 0
+    r: int = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.scheme != NO_FEC
+
+    def to_bytes(self) -> bytes:
+        return bytes((self.scheme, self.k, self.r))
+
+    @staticmethod
+    def from_bytes(data: bytes) -> 'FecParams':
+        # Un SYN sin el campo es de un cliente sin FEC
+        if len(data) < 3:
+            return NO_FEC_PARAMS
+        return FecParams(data[0], data[1], data[2])
+
+
+NO_FEC_PARAMS = FecParams()
+
+
+def fec_params(k: int, r: int) -> FecParams:
+    # Una sola reparación es la paridad XOR, más requieren Reed-Solomon
+    return FecParams(XOR if r == 1 else REED_SOLOMON, k, r)
+
+
+def parse_fec(value: str) -> FecParams:
+    # Bloque de K segmentos con R de reparación, con la forma K:R o K
+    k, _, r = value.partition(':')
+    params = fec_params(int(k), int(r or 1))
+    if not 1 < params.k <= MAX_BLOCK or not 0 < params.r <= MAX_REPAIR:
+        raise ValueError(f"Parámetros de FEC inválidos: {value}")
+    return params
+
+
+def negotiate_fec(offer: FecParams, supported: bool) -> FecParams:
+    # Lo que pidió el cliente, acotado a lo que se puede usar de este lado
+    if not supported or not offer.enabled:
+        return NO_FEC_PARAMS
+    k = min(max(offer.k, 2), MAX_BLOCK)
+    r = min(max(offer.r, 1), MAX_REPAIR)
+    if r > 1 and not HAS_NUMPY:
+        logging.warning("Reed-Solomon requiere NumPy, se usa paridad XOR")
+        r = 1
+    return fec_params(k, r)
+
+
+class XorCode:
+    """
+    Paridad XOR: una reparación por bloque que recupera un segmento
+    perdido. Los segmentos se operan como enteros, por lo que el XOR de un
+    segmento entero es una sola operación en C.
+    """
+
+    def encode(self, segments: Sequence[bytes], length: int) -> list[bytes]:
+        parity = 0
+        for segment in segments:
+            parity ^= int.from_bytes(segment, 'little')
+        return [parity.to_bytes(length, 'little')]
+
+    def decode(
+        self,
+        data: dict[int, bytes],
+        repairs: dict[int, bytes],
+        n: int,
+        length: int
+    ) -> dict[int, bytes]:
+        missing = [i for i in range(n) if i not in data]
+        if len(missing) != 1 or 0 not in repairs:
+            return {}
+        parity = int.from_bytes(repairs[0], 'little')
+        for segment in data.values():
+            parity ^= int.from_bytes(segment, 'little')
+        return {missing[0]: parity.to_bytes(length, 'little')}
+
+
+class ReedSolomonCode:
+    """
+    Código Reed-Solomon sistemático sobre GF(2^8) con matriz de Cauchy.
+
+    La reparación j es la suma de los segmentos i multiplicados por
+    1 / (x_j + y_i), con x_j = k + j e y_i = i: toda submatriz cuadrada es
+    invertible, así cualquier combinación de r pérdidas en el bloque se
+    recupera con r reparaciones. Cada producto de un segmento por una
+    constante es un lookup vectorizado con NumPy en la tabla de
+    multiplicación.
+    """
+
+    def __init__(self, k: int, r: int):
+        self.matrix = [
+            [gf_inverse((k + j) ^ i) for i in range(k)] for j in range(r)
+        ]
+
+    def encode(self, segments: Sequence[bytes], length: int) -> list[bytes]:
+        symbols = [as_symbols(segment, length) for segment in segments]
+        return [
+            combine(row, symbols, length).tobytes() for row in self.matrix
+        ]
+
+    def decode(
+        self,
+        data: dict[int, bytes],
+        repairs: dict[int, bytes],
+        n: int,
+        length: int
+    ) -> dict[int, bytes]:
+        missing = [i for i in range(n) if i not in data]
+        rows = sorted(repairs)[:len(missing)]
+        if len(rows) < len(missing):
+            return {}
+        known = sorted(data)
+        symbols = [as_symbols(data[i], length) for i in known]
+        # Cada reparación menos la parte de los segmentos recibidos queda
+        # en función de los que faltan
+        syndromes = []
+        for j in rows:
+            row = self.matrix[j]
+            syndrome = as_symbols(repairs[j], length).copy()
+            syndrome ^= combine([row[i] for i in known], symbols, length)
+            syndromes.append(syndrome)
+        inverse = gf_invert_matrix(
+            [[self.matrix[j][i] for i in missing] for j in rows])
+        return {
+            index: combine(inverse[t], syndromes, length).tobytes()
+            for t, index in enumerate(missing)
+        }
+
+
+def as_symbols(segment: bytes, length: int):
+    symbols = numpy.frombuffer(segment, dtype=numpy.uint8)
+    if len(symbols) < length:
+        symbols = numpy.concatenate(
+            (symbols, numpy.zeros(length - len(symbols), numpy.uint8)))
+    return symbols
+
+
+def combine(coefficients: Sequence[int], symbols: list, length: int):
+    # Suma en GF(2^8) de cada segmento por su coeficiente
+    result = numpy.zeros(length, numpy.uint8)
+    for coefficient, segment in zip(coefficients, symbols):
+        if coefficient:
+            result ^= GF_MUL[coefficient][segment]
+    return result
+
+
+def gf_tables() -> tuple[list[int], list[int]]:
+    exp = [0] * 510
+    log = [0] * 256
+    x = 1
+    for i in range(255):
+        exp[i] = x
+        log[x] = i
+        x <<= 1
+        if x & 0x100:
+            x ^= GF_POLYNOMIAL
+    # Duplicada para sumar logaritmos sin reducir modulo 255
+    exp[255:] = exp[:255]
+    return exp, log
+
+
+GF_EXP, GF_LOG = gf_tables()
+
+
+def gf_multiply(a: int, b: int) -> int:
+    if a == 0 or b == 0:
+        return 0
+    return GF_EXP[GF_LOG[a] + GF_LOG[b]]
+
+
+def gf_inverse(a: int) -> int:
+    return GF_EXP[255 - GF_LOG[a]]
+
+
+def gf_invert_matrix(matrix: list[list[int]]) -> list[list[int]]:
+    # Gauss-Jordan sobre GF(2^8), la matriz es de a lo sumo r x r
+    n = len(matrix)
+    rows = [
+        row[:] + [int(i == j) for j in range(n)]
+        for i, row in enumerate(matrix)
+    ]
+    for column in range(n):
+        pivot = next(i for i in range(column, n) if rows[i][column])
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        scale = gf_inverse(rows[column][column])
+        rows[column] = [gf_multiply(scale, x) for x in rows[column]]
+        for i in range(n):
+            factor = rows[i][column]
+            if i != column and factor:
+                rows[i] = [
+                    x ^ gf_multiply(factor, y)
+                    for x, y in zip(rows[i], rows[column])
+                ]
+    return [row[n:] for row in rows]
+
+
+if HAS_NUMPY:
+    # Fila c: el producto de cada byte por c
+    GF_MUL = numpy.array(
+        [[gf_multiply(a, b) for b in range(256)] for a in range(256)],
+        dtype=numpy.uint8
+    )
+
+
+def fec_code(params: FecParams):
+    if params.scheme == XOR:
+        return XorCode()
+    return ReedSolomonCode(params.k, params.r)
+
+
+class FecEncoder:
+    # Reparaciones de los bloques de k segmentos consecutivos del emisor
+
+    def __init__(self, params: FecParams):
+        self.k = params.k
+        self.code = fec_code(params)
+
+    def closes_block(self, index: int, total: int) -> bool:
+        return (index + 1) % self.k == 0 or index + 1 == total
+
+    def encode(self, segments: Sequence[bytes]) -> list[bytes]:
+        # El primer segmento es el más largo, solo el ultimo del archivo
+        # puede ser más corto
+        return self.code.encode(segments, len(segments[0]))
+
+
+class Block:
+    __slots__ = ('data', 'repairs')
+
+    def __init__(self):
+        self.data: dict[int, bytes] = {}
+        self.repairs: dict[int, bytes] = {}
+
+
+class FecDecoder:
+    """
+    Bloques incompletos del receptor. Guarda los segmentos de datos y de
+    reparación de cada bloque hasta tener todos sus datos, o suficientes
+    reparaciones para reconstruir los que faltan.
+    """
+
+    def __init__(
+        self,
+        params: FecParams,
+        segments: int,
+        segment_length: Callable[[int], int]
+    ):
+        self.k = params.k
+        self.code = fec_code(params)
+        self.segments = segments
+        self.segment_length = segment_length
+        self.blocks: dict[int, Block] = {}
+        # Primer bloque que puede estar incompleto
+        self.first = 0
+
+    def add_data(self, index: int, data: bytes) -> list[tuple[int, bytes]]:
+        number, position = divmod(index, self.k)
+        block = self.block(number)
+        if block is None:
+            return []
+        block.data[position] = data
+        return self.decode(number, block)
+
+    def add_repair(
+        self, first: int, j: int, repair: bytes
+    ) -> list[tuple[int, bytes]]:
+        number = first // self.k
+        block = self.block(number)
+        if block is None:
+            return []
+        block.repairs[j] = repair
+        return self.decode(number, block)
+
+    def block(self, number: int) -> Optional[Block]:
+        if number < self.first or number * self.k >= self.segments:
+            return None
+        block = self.blocks.get(number)
+        if block is None:
+            block = self.blocks[number] = Block()
+        return block
+
+    def decode(self, number: int, block: Block) -> list[tuple[int, bytes]]:
+        first = number * self.k
+        n = min(self.k, self.segments - first)
+        missing = n - len(block.data)
+        if missing == 0:
+            del self.blocks[number]
+            return []
+        if len(block.repairs) < missing:
+            return []
+        length = self.segment_length(first)
+        recovered = self.code.decode(block.data, block.repairs, n, length)
+        if not recovered:
+            return []
+        del self.blocks[number]
+        logging.debug(
+            f"FEC: recuperados {len(recovered)} segmentos del bloque "
+            f"{number}")
+        return [
+            (first + i, data[:self.segment_length(first + i)])
+            for i, data in sorted(recovered.items())
+        ]
+
+    def prune(self, contiguous: int):
+        # Los bloques anteriores al primer segmento faltante ya están
+        # completos en el destino
+        first = contiguous // self.k
+        if first == self.first:
+            return
+        self.first = first
+        for number in [n for n in self.blocks if n < first]:
+            del self.blocks[number]
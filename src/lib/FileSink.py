@@ -0,0 +1,259 @@
+import os
+from collections import deque
+from queue import Full, Queue
+from threading import Thread
+from typing import BinaryIO, Optional
+from .Checkpoint import Checkpoint
+import logging
+
+# Tamaño de las escrituras, las que no son la ultima quedan alineadas
+BLOCK_SIZE = 1024 * 1024
+# Bloques que pueden esperar al disco antes de frenar al receptor
+MAX_PENDING_BLOCKS = 16
+# Avance entre checkpoints de un archivo recibido
+CHECKPOINT_INTERVAL = 16 * 1024 * 1024
+fdatasync = getattr(os, 'fdatasync', os.fsync)
+
+
+class FileSink:
+    """
+    Destino de los datos de un archivo recibido.
+
+    El archivo se reserva entero con fallocate y los datos contiguos se
+    acumulan en bloques de hasta BLOCK_SIZE que escribe un thread aparte con
+    pwrite. El receptor solo copia el segmento al bloque, por lo que la
+    latencia del disco no demora los ACKs salvo que se llene la cola de
+    bloques pendientes. Al cerrarlo se cierra el archivo.
+
+    Sin blocking, como en el servidor con asyncio, encolar un bloque nunca
+    espera: si la cola está llena queda en overflow, y quien recibe debe
+    llamar a drain desde otro thread antes de procesar el siguiente
+    datagrama. Mientras tanto no se envían ACKs, lo que frena al emisor.
+    """
+
+    def __init__(
+        self,
+        file: BinaryIO,
+        size: int,
+        block_size: int = BLOCK_SIZE,
+        max_pending: int = MAX_PENDING_BLOCKS
+    ):
+        self.file = file
+        self.size = size
+        self.block_size = block_size
+        self.block = bytearray()
+        self.offset = 0
+        self.error: Optional[OSError] = None
+        self.closed = False
+        self.allocate()
+        self.pending: Queue = Queue(max_pending)
+        self.blocking = True
+        # Bloques que no entraron en la cola, solo sin blocking
+        self.overflow: deque = deque()
+        self.writer = Thread(target=self.write_blocks, daemon=True)
+        self.writer.start()
+
+    def write(self, data: bytes):
+        self.write_at(self.offset + len(self.block), data)
+
+    def write_at(self, offset: int, data: bytes):
+        # Un dato que no continua el bloque actual empieza uno nuevo
+        if offset != self.offset + len(self.block):
+            if self.block:
+                self.submit(len(self.block))
+            self.offset = offset
+        self.block += data
+        # Se escribe hasta el ultimo limite de bloque del archivo
+        end = self.offset + len(self.block)
+        length = end - end % self.block_size - self.offset
+        if length > 0:
+            self.submit(length)
+
+    def submit(self, length: int):
+        if self.error is not None:
+            raise self.error
+        block = self.block
+        self.block = block[length:]
+        del block[length:]
+        self.enqueue((self.offset, block))
+        self.offset += length
+
+    def sync(self, offset: int):
+        # Cuando el thread de escritura llega a esta marca, todo lo
+        # escrito antes ya está en disco
+        if self.block:
+            self.submit(len(self.block))
+        elif self.error is not None:
+            raise self.error
+        self.enqueue((offset, None))
+
+    def enqueue(self, item: tuple):
+        if self.blocking:
+            self.pending.put(item)
+            return
+        if not self.overflow:
+            try:
+                self.pending.put_nowait(item)
+                return
+            except Full:
+                pass
+        self.overflow.append(item)
+
+    @property
+    def congested(self) -> bool:
+        return bool(self.overflow)
+
+    def drain(self):
+        # Pasa los bloques demorados a la cola, esperando al disco
+        while self.overflow:
+            self.pending.put(self.overflow.popleft())
+
+    def on_sync(self, offset: int):
+        pass
+
+    # Operaciones sobre el archivo, las ejecuta el thread de escritura salvo
+    # allocate y close_file
+
+    def allocate(self):
+        preallocate(self.file, self.size)
+
+    def write_block(self, offset: int, block: bytearray):
+        pwrite(self.file.fileno(), block, offset)
+
+    def sync_file(self):
+        fdatasync(self.file.fileno())
+
+    def close_file(self):
+        self.file.close()
+
+    def write_blocks(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            offset, block = item
+            if self.error is not None:
+                continue
+            try:
+                if block is None:
+                    self.sync_file()
+                    self.on_sync(offset)
+                    continue
+                self.write_block(offset, block)
+            except OSError as e:
+                logging.error(f"Error escribiendo el archivo: {e}")
+                self.error = e
+
+    def close(self):
+        # Escribe lo que queda y espera al thread de escritura
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if self.block:
+                self.submit(len(self.block))
+        finally:
+            self.drain()
+            self.pending.put(None)
+            self.writer.join()
+            self.close_file()
+        if self.error is not None:
+            raise self.error
+
+
+class SegmentSink(FileSink):
+    """
+    FileSink direccionado por segmento: el segmento i va en el offset
+    start + i * mss, por lo que los segmentos fuera de orden se escriben
+    apenas llegan en lugar de esperar a que se complete el hueco.
+
+    Los segmentos cubren el rango [start, end) del archivo, que con varios
+    streams es solo una parte de él. Un bitmap de un bit por segmento
+    registra los recibidos. Con un checkpoint, cada CHECKPOINT_INTERVAL
+    bytes contiguos y al cerrar un archivo incompleto se registra cuánto
+    está en disco, para poder reanudar la transferencia desde ahí.
+    """
+
+    def __init__(
+        self,
+        file: BinaryIO,
+        size: int,
+        mss: int,
+        start: int = 0,
+        checkpoint: Optional[Checkpoint] = None,
+        end: Optional[int] = None
+    ):
+        super().__init__(file, size)
+        self.mss = mss
+        self.start = start
+        self.end = size if end is None else end
+        self.checkpoint = checkpoint
+        self.segments = -(-(self.end - start) // mss)
+        self.bitmap = bytearray(-(-self.segments // 8))
+        # Segmentos recibidos sin huecos desde start
+        self.contiguous = 0
+        self.checkpointed = start
+
+    @property
+    def remaining(self) -> int:
+        return self.end - self.start
+
+    @property
+    def complete(self) -> bool:
+        return self.contiguous >= self.segments
+
+    @property
+    def contiguous_offset(self) -> int:
+        return min(self.start + self.contiguous * self.mss, self.end)
+
+    def segment_length(self, index: int) -> int:
+        return min(self.mss, self.end - self.start - index * self.mss)
+
+    def has(self, index: int) -> bool:
+        return bool(self.bitmap[index >> 3] & (1 << (index & 7)))
+
+    def write_segment(self, index: int, data: bytes) -> bool:
+        # Devuelve False si el segmento ya estaba o no es del archivo
+        if not 0 <= index < self.segments or self.has(index):
+            return False
+        self.bitmap[index >> 3] |= 1 << (index & 7)
+        self.write_at(self.start + index * self.mss, data)
+        while self.contiguous < self.segments and self.has(self.contiguous):
+            self.contiguous += 1
+        if self.checkpoint is not None and not self.complete and \
+                self.contiguous_offset - self.checkpointed >= \
+                CHECKPOINT_INTERVAL:
+            self.checkpointed = self.contiguous_offset
+            self.sync(self.checkpointed)
+        return True
+
+    def on_sync(self, offset: int):
+        self.checkpoint.save(offset)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.checkpoint is not None and not self.complete:
+                self.sync(self.contiguous_offset)
+        finally:
+            super().close()
+        if self.checkpoint is not None and self.complete:
+            self.checkpoint.remove()
+
+
+def pwrite(fd: int, data: bytes, offset: int):
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+def preallocate(file: BinaryIO, size: int):
+    if size <= 0 or not hasattr(os, 'posix_fallocate'):
+        return
+    try:
+        os.posix_fallocate(file.fileno(), 0, size)
+    except OSError as e:
+        logging.debug(f"No se pudo reservar el archivo: {e}")
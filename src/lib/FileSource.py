@@ -0,0 +1,109 @@
+import os
+import mmap
+from typing import BinaryIO
+
+
+class FileSource:
+    """
+    Fuente de datos para el envío de un archivo.
+
+    En lugar de cargar el archivo entero en memoria, los segmentos se leen
+    a demanda con os.pread, por lo que el protocolo de recuperación solo
+    mantiene en memoria los segmentos de la ventana en vuelo.
+    """
+
+    def __init__(self, file: BinaryIO):
+        self.file = file
+        self.size = os.fstat(file.fileno()).st_size
+        # Offset del archivo donde empieza la transferencia
+        self.start = 0
+
+    @property
+    def manifest_size(self) -> int:
+        # Un archivo suelto no lleva manifiesto, ver BatchSource
+        return 0
+
+    @property
+    def identity(self) -> tuple[int, int]:
+        # Tamaño y mtime, permiten saber si un envío parcial sigue siendo
+        # del mismo archivo al reanudarlo
+        stat = os.fstat(self.file.fileno())
+        return stat.st_size, stat.st_mtime_ns
+
+    def skip(self, offset: int):
+        # Los offsets de read pasan a ser relativos al nuevo inicio
+        offset = min(offset, self.size)
+        self.start += offset
+        self.size -= offset
+
+    def limit(self, size: int):
+        # Deja afuera lo que sigue a los primeros size bytes
+        self.size = max(0, min(size, self.size))
+
+    def read(self, offset: int, length: int) -> bytes:
+        if offset >= self.size:
+            return b''
+        length = min(length, self.size - offset)
+        return os.pread(self.file.fileno(), length, self.start + offset)
+
+    def read_segment(self, index: int, mss: int) -> bytes:
+        return self.read(index * mss, mss)
+
+    def segment_count(self, mss: int) -> int:
+        return -(-self.size // mss)
+
+    def close(self):
+        self.file.close()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __enter__(self) -> 'FileSource':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MappedFileSource(FileSource):
+    """
+    Fuente de datos respaldada por un mmap del archivo.
+
+    Los segmentos son memoryviews sobre el mapeo, sin copias: todos los
+    clientes que descargan el mismo archivo comparten las páginas del
+    page cache.
+    """
+
+    def __init__(self, file: BinaryIO):
+        super().__init__(file)
+        # mmap no admite archivos vacios
+        self.map = None
+        self.view = memoryview(b'')
+        if self.size > 0:
+            self.map = mmap.mmap(
+                file.fileno(), self.size, access=mmap.ACCESS_READ
+            )
+            self.view = memoryview(self.map)
+
+    def skip(self, offset: int):
+        offset = min(offset, self.size)
+        super().skip(offset)
+        self.view = self.view[offset:]
+
+    def limit(self, size: int):
+        super().limit(size)
+        self.view = self.view[:self.size]
+
+    def read(self, offset: int, length: int) -> memoryview:
+        return self.view[offset:offset + length]
+
+    def close(self):
+        self.view.release()
+        if self.map is not None:
+            try:
+                self.map.close()
+            except BufferError:
+                # Quedan segmentos referenciados, el mapeo se libera
+                # cuando se recolecten
+                pass
+        super().close()
@@ -1,13 +1,17 @@
-from enum import IntEnum
-
-
-class Flags(IntEnum):
+class Flags:
+    # Constantes enteras y no un IntEnum: struct empaqueta un int sin
+    # convertirlo, y cada datagrama lleva sus flags
     UPLOAD = 1
     DOWNLOAD = 2
     SYN = 4
     ACK = 8
     ERROR = 16
+    FIN = 32
+    COOKIE = 64
+    # Segmento de reparación FEC, junto con UPLOAD o DOWNLOAD
+    REPAIR = 128
     SYN_UPLOAD = SYN | UPLOAD
     ACK_UPLOAD = ACK | UPLOAD
     SYN_DOWNLOAD = SYN | DOWNLOAD
     ACK_DOWNLOAD = ACK | DOWNLOAD
+    FIN_ACK = FIN | ACK
@@ -1,158 +1,205 @@
-from io import BufferedWriter
 from time import time
-from queue import Queue, Empty
-from threading import Event
-from threading import Thread
-from .Header import Header
-from .Flags import Flags
+from typing import Optional
+from .Header import Header, HEADER_SIZE
 from .Datagram import Datagram
-from .RecoveryProtocol import RecoveryProtocol
+from .RecoveryProtocol import RecoveryProtocol, Sender, Receiver
 from .Endpoint import Endpoint
 from .ProtocolID import ProtocolID
-from math import ceil
+from .FileSource import FileSource
+from .FileSink import SegmentSink
 import logging
-from .Server import CONNECTION_TIMEOUT
+
+# Segmentos en orden que se confirman con un solo ACK acumulativo
+ACK_EVERY = 2
+# ACKs duplicados que disparan la retransmisión rápida de la ventana
+DUP_ACK_THRESHOLD = 3
 
 
 class GoBackN(RecoveryProtocol):
     PROTOCOL_ID = ProtocolID.GO_BACK_N
+    SUPPORTS_FEC = True
+    SUPPORTS_COMPRESSION = True
 
-    def send(
+    def sender(
         self,
         endpoint: Endpoint,
-        file_data: bytes,
-        queue: Queue,
+        source: FileSource,
         receiver_mss: int,
-        flag: Flags,
-        rtt: float
-    ):
-        timer_thread = None
-        timer_event = Event()
-        base = endpoint.seq
-        next_seq = base
+        flag: int,
+        rtt: Optional[float]
+    ) -> 'GoBackNSender':
+        return GoBackNSender(
+            endpoint, source, receiver_mss, flag, rtt,
+            self.congestion_control
+        )
+
+    def receiver(
+        self, endpoint: Endpoint, sink: SegmentSink
+    ) -> 'GoBackNReceiver':
+        return GoBackNReceiver(endpoint, sink)
+
+
+class GoBackNSender(Sender):
+    def __init__(self, endpoint: Endpoint, source: FileSource, *args):
+        super().__init__(endpoint, source, *args)
+        self.base = endpoint.seq
+        self.next_seq = self.base
         endpoint.increment_seq()
-        buffer = {}
-        logging.info(f"Tamaño del archivo: {len(file_data)} bytes")
-        logging.info(f"MSS: {receiver_mss} bytes")
+        # Solo se guardan los segmentos en vuelo, [base, next_seq)
+        self.buffer: dict[int, Datagram] = {}
+        self.sent_at: dict[int, float] = {}
+        self.retransmitted: set[int] = set()
+        # ACKs seguidos que no avanzan base con segmentos en vuelo
+        self.dup_acks = 0
+        self.total_segments = source.segment_count(self.receiver_mss)
+        logging.info(f"Tamaño del archivo: {len(source)} bytes")
+        logging.info(f"MSS: {self.receiver_mss} bytes")
         logging.info(f"Tamaño de la ventana: {endpoint.window_size} paquetes")
-        logging.info(
-            f"Número total de paquetes: {ceil(len(file_data) / receiver_mss)}")
-        while base * receiver_mss < len(file_data):
-            while next_seq < base + endpoint.window_size and next_seq * \
-                    receiver_mss < len(file_data):
-                segment_start = next_seq * receiver_mss
-                segment_end = segment_start + receiver_mss
-                segment = file_data[segment_start:segment_end]
+        logging.info(f"Número total de paquetes: {self.total_segments}")
+
+    @property
+    def done(self) -> bool:
+        return self.base >= self.total_segments
 
+    def send_window(self):
+        batch = []
+        allowance = self.pacer.allowance()
+        sent = 0
+        self.paced = False
+        while self.next_seq < self.base + self.endpoint.window_size and \
+                self.next_seq < self.total_segments:
+            if sent >= allowance:
+                self.paced = True
+                break
+            next_seq = self.next_seq
+            datagram = self.buffer.get(next_seq)
+            if datagram is None:
+                segment = self.read_segment(next_seq)
                 header = Header(
                     payload_size=len(segment),
                     sequence_number=next_seq + 1,
-                    acknowledgment_number=endpoint.ack,
-                    flags=flag
-                )
-                datagram = Datagram(header, segment).to_bytes()
-                buffer[next_seq] = datagram
-                start = time()
-                if next_seq == 0:
-                    start_timer(timer_event, timer_thread, rtt, queue)
-                    logging.debug(f"Iniciando timer paquete: {base + 1}")
-                endpoint.send_message(datagram)
-                logging.debug(
-                    f"Paquete enviado: Seq={next_seq + 1}, "
-                    f"Tamaño={len(segment)} bytes")
-                next_seq += 1
-            try:
-                response_data = queue.get()
-                if isinstance(response_data, Exception):
-                    raise response_data
-                rtt = (rtt + (time() - start)) / 2
-                response_datagram = Datagram.from_bytes(response_data)
-
-                if response_datagram.is_ack():
-                    ack_number = response_datagram.get_ack_number() - 1
-                    logging.debug(f"ACK recibido: {ack_number + 1}")
-                    if ack_number > base:
-                        base = ack_number
-                        stop_timer(timer_event, timer_thread)
-                        start_timer(timer_event, timer_thread, rtt, queue)
-
-            except TimeoutError:
-                logging.debug(f"Timeout actual: {rtt} segundos")
-                logging.debug("Timeout esperando ACK, reenviando ventana")
-                rtt = rtt * 2
-                logging.debug(f"Reenviando ventana desde Seq={base + 1}")
-                logging.debug(f"Hasta Seq={next_seq + 1}")
-                for seq in range(base, next_seq):
-                    if seq in buffer:
-                        endpoint.send_message(buffer[seq])
-                        logging.debug(f"Reenviado paquete: {seq + 1}")
-                start_timer(timer_event, timer_thread, rtt, queue)
-
-    def receive(
-        self,
-        endpoint: Endpoint,
-        file: BufferedWriter,
-        queue: Queue,
-        file_size: int,
-    ):
-        endpoint.increment_ack()
-        bytes_written = 0
-        while bytes_written < file_size:
-            logging.debug(f"bytes_written: {bytes_written}")
-            logging.debug(f"file_size: {file_size}")
-            data = queue.get()
-            datagram = Datagram.from_bytes(data)
-            logging.debug(f"Numero de seq esperado: {endpoint.ack}")
-
-            if datagram.get_sequence_number() == endpoint.ack:
-                logging.debug(
-                    f"Paquete recibido: Seq={datagram.get_sequence_number()}")
-                endpoint.increment_ack()
-                file.write(datagram.data)
-                bytes_written += len(datagram.data)
-                endpoint.increment_seq()
-                logging.debug(f"ACK actualizado: {endpoint.ack}")
-                ack_header = Header(
-                    payload_size=0,
-                    sequence_number=endpoint.seq,
-                    acknowledgment_number=endpoint.ack,
-                    flags=Flags.ACK
+                    acknowledgment_number=self.endpoint.ack,
+                    flags=self.flag,
+                    connection_id=self.endpoint.connection_id
                 )
-                ack_datagram = Datagram(ack_header, b'').to_bytes()
-                endpoint.send_message(ack_datagram)
-                endpoint.update_last_msg(ack_datagram)
-                logging.debug(f"ACK enviado: {endpoint.ack}")
+                datagram = Datagram(header, segment)
+                self.buffer[next_seq] = datagram
+            elif next_seq in self.sent_at:
+                self.retransmitted.add(next_seq)
+            self.sent_at[next_seq] = time()
+            if self.deadline is None:
+                self.restart_timer()
+                logging.debug(f"Iniciando timer paquete: {self.base + 1}")
+            batch.append(datagram)
+            sent += HEADER_SIZE + datagram.get_payload_size()
+            for repair in self.repairs(next_seq, self.total_segments):
+                batch.append(repair)
+                sent += HEADER_SIZE + repair.get_payload_size()
+            logging.debug(
+                f"Paquete enviado: Seq={next_seq + 1}, "
+                f"Tamaño={datagram.get_payload_size()} bytes")
+            self.next_seq += 1
+        self.pacer.consume(sent)
+        self.endpoint.send_datagrams(batch)
+
+    def on_datagram(self, datagram: Datagram):
+        if not datagram.is_ack():
+            return
+        ack_number = datagram.get_ack_number() - 1
+        logging.debug(f"ACK recibido: {ack_number + 1}")
+        self.endpoint.update_peer_window(datagram.header.window)
+        if ack_number > self.base:
+            sample = None
+            if ack_number - 1 not in self.retransmitted:
+                sample = time() - self.sent_at[ack_number - 1]
+                self.rtt_estimator.sample(sample)
+            for seq in range(self.base, ack_number):
+                self.buffer.pop(seq, None)
+                self.sent_at.pop(seq, None)
+                self.retransmitted.discard(seq)
+            self.congestion.on_ack(ack_number - self.base, sample)
+            self.base = ack_number
+            self.next_seq = max(self.next_seq, self.base)
+            self.dup_acks = 0
+            if self.base < self.next_seq:
+                self.restart_timer()
             else:
-                seq_num = datagram.get_sequence_number()
-                logging.debug(f"Paquete fuera de orden: Seq={seq_num}")
-                endpoint.send_last_message()
-        file.close()
-        logging.info(f"Archivo recibido correctamente: {bytes_written} bytes")
-        while True:
-            try:
-                data = queue.get(timeout=CONNECTION_TIMEOUT)
-                endpoint.send_last_message()
-                continue
-            except Empty:
-                return
+                self.stop_timer()
+        elif ack_number == self.base and self.base < self.next_seq:
+            self.dup_acks += 1
+            if self.dup_acks == DUP_ACK_THRESHOLD:
+                self.fast_retransmit()
+        self.endpoint.apply_congestion_window(self.congestion.window)
 
+    def fast_retransmit(self):
+        # El receptor descarta lo que sigue a un hueco: se reenvia la ventana
+        # desde base sin esperar el timeout ni aumentar el RTO
+        logging.debug(
+            f"{DUP_ACK_THRESHOLD} ACKs duplicados, reenviando desde "
+            f"Seq={self.base + 1}")
+        self.congestion.on_loss()
+        self.next_seq = self.base
+        self.restart_timer()
 
-def start_timer(
-    timer_event: Event, timer_thread: Thread, rtt: int, queue: Queue
-):
-    stop_timer(timer_event, timer_thread)
-    timer_event.clear()
-    thread = Thread(target=timer, args=(timer_event, timer_thread, rtt, queue))
-    thread.start()
+    def on_timeout(self):
+        logging.debug(f"Timeout actual: {self.rtt_estimator.rto} segundos")
+        logging.debug("Timeout esperando ACK, reenviando ventana")
+        self.rtt_estimator.backoff()
+        self.congestion.on_timeout()
+        self.endpoint.apply_congestion_window(self.congestion.window)
+        logging.debug(
+            f"Reenviando desde Seq={self.base + 1}, "
+            f"ventana={self.endpoint.window_size}")
+        self.next_seq = self.base
+        self.dup_acks = 0
+        self.restart_timer()
 
 
-def stop_timer(timer_event, timer_thread: Thread):
-    timer_event.set()
-    if timer_thread is not None:
-        timer_thread.join()
-        timer_thread = None
+class GoBackNReceiver(Receiver):
+    """
+    Receptor con ACKs acumulativos demorados.
 
+    Los segmentos en orden se confirman cada ACK_EVERY, o al vaciarse la
+    cola de entrada, con un solo ACK acumulativo. Un segmento fuera de
+    orden se confirma en el momento: el emisor cuenta esos duplicados para
+    retransmitir sin esperar el timeout.
+    """
+
+    def __init__(self, endpoint: Endpoint, *args):
+        super().__init__(endpoint, *args)
+        endpoint.increment_ack()
+        # Segmentos recibidos en orden que todavía no se confirmaron
+        self.unacked = 0
+
+    def on_datagram(self, datagram: Datagram):
+        endpoint = self.endpoint
+        logging.debug(f"bytes_written: {self.bytes_written}")
+        logging.debug(f"bytes_remaining: {self.sink.remaining}")
+        logging.debug(f"Numero de seq esperado: {endpoint.ack}")
+
+        if datagram.get_sequence_number() == endpoint.ack:
+            logging.debug(
+                f"Paquete recibido: Seq={datagram.get_sequence_number()}")
+            endpoint.increment_ack()
+            self.write(datagram.data)
+            endpoint.increment_seq()
+            logging.debug(f"ACK actualizado: {endpoint.ack}")
+            self.unacked += 1
+            if self.unacked >= ACK_EVERY or self.done:
+                self.flush()
+        else:
+            seq_num = datagram.get_sequence_number()
+            logging.debug(f"Paquete fuera de orden: Seq={seq_num}")
+            if self.unacked:
+                self.flush()
+            else:
+                endpoint.send_last_message()
 
-def timer(timer_event: Event, timer_thread: Thread, rtt: int, queue: Queue):
-    if not timer_event.wait(rtt):
-        queue.put(TimeoutError())
+    def flush(self):
+        if not self.unacked:
+            return
+        endpoint = self.endpoint
+        ack = endpoint.send_ack(endpoint.seq, endpoint.advertised_window)
+        endpoint.update_last_msg(ack)
+        self.unacked = 0
+        logging.debug(f"ACK enviado: {endpoint.ack}")
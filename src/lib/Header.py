@@ -1,4 +1,5 @@
 import struct
+from typing import NamedTuple
 
 from .Flags import Flags
 from .Messages.UploadACK import UploadACK
@@ -7,26 +8,50 @@ from .Messages.DownloadACK import DownloadACK
 from .Messages.DownloadSYN import DownloadSYN
 from .Messages.Error import Error
 
-HEADER_SIZE = struct.calcsize("!HIIB")
+# Los campos en el orden de Header, compilado una sola vez
+HEADER = struct.Struct("!HIIBHI")
+HEADER_SIZE = HEADER.size
+# El ID de conexión se lee en su offset para rutear sin decodificar el resto
+CONNECTION_ID = struct.Struct("!I")
+CONNECTION_ID_OFFSET = HEADER_SIZE - CONNECTION_ID.size
+# ID de los datagramas enviados antes de que el servidor asigne uno
+NO_CONNECTION = 0
+_tuple_new = tuple.__new__
 
 
-class Header:
-    def __init__(
-        self, payload_size, sequence_number,
-        acknowledgment_number, flags
-    ):
-        self.payload_size = payload_size
-        self.sequence_number = sequence_number
-        self.acknowledgment_number = acknowledgment_number
-        self.flags = flags
+class Header(NamedTuple):
+    # Una tupla: se decodifica con un solo unpack_from, sin copiar los bytes
+    # ni asignar sus atributos uno por uno
+    payload_size: int
+    sequence_number: int
+    acknowledgment_number: int
+    flags: int
+    # Ventana de recepcion anunciada en segmentos, 0 si no se anuncia
+    window: int = 0
+    # Sesión asignada por el servidor en el handshake
+    connection_id: int = NO_CONNECTION
 
     def to_bytes(self) -> bytes:
-        return struct.pack(
-            "!HIIB",
+        return HEADER.pack(
             self.payload_size,
             self.sequence_number,
             self.acknowledgment_number,
-            self.flags
+            self.flags,
+            self.window,
+            self.connection_id
+        )
+
+    def pack_into(self, buffer: bytearray, offset: int = 0):
+        # Escribe el header en un buffer de envio ya reservado
+        HEADER.pack_into(
+            buffer,
+            offset,
+            self.payload_size,
+            self.sequence_number,
+            self.acknowledgment_number,
+            self.flags,
+            self.window,
+            self.connection_id
         )
 
     def analyze(self, data: bytes):
@@ -43,9 +68,10 @@ class Header:
                 return Error.from_bytes(data)
 
     @staticmethod
-    def from_bytes(bytes) -> 'Header':
-        header = struct.unpack("!HIIB", bytes[:HEADER_SIZE])
-        payload_size, sequence_number, ack_number, flags = header
-        return Header(
-            payload_size, sequence_number, ack_number, flags
-        )
+    def from_bytes(data: bytes) -> 'Header':
+        # Arma la tupla en C, sin pasar por el __new__ con valores default
+        return _tuple_new(Header, HEADER.unpack_from(data))
+
+
+def connection_id(data: bytes) -> int:
+    return CONNECTION_ID.unpack_from(data, CONNECTION_ID_OFFSET)[0]
@@ -0,0 +1,76 @@
+import asyncio
+from queue import Queue
+
+# Datagramas que pueden esperar a ser procesados por cada transferencia. El
+# emisor no debería superarlo, la ventana anunciada se achica con el espacio
+# libre
+INGRESS_CAPACITY = 512
+# Evento interno que solo despierta al handler, por ejemplo cuando el
+# planificador de salida vuelve a tener lugar para la transferencia
+WAKEUP = object()
+
+
+class IngressQueue(Queue):
+    """
+    Cola de datagramas recibidos de un cliente, acotada a capacity.
+
+    Los datagramas se encolan con offer, que los descarta si la cola está
+    llena (tail drop) y lleva la cuenta de los descartados: la memoria por
+    cliente queda acotada aunque el handler se atrase o la dirección
+    inunde al servidor, y el protocolo de recuperación retransmite lo
+    descartado. Los eventos internos, como los timeouts de la rueda de
+    timers, se encolan con put y nunca se descartan.
+    """
+
+    def __init__(self, capacity: int = INGRESS_CAPACITY):
+        super().__init__()
+        self.capacity = capacity
+        self.dropped = 0
+
+    def offer(self, data: bytes) -> bool:
+        with self.mutex:
+            if self._qsize() >= self.capacity:
+                self.dropped += 1
+                return False
+            self._put(data)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+        return True
+
+    @property
+    def free(self) -> int:
+        return max(0, self.capacity - self.qsize())
+
+    def wake(self):
+        self.put(WAKEUP)
+
+
+class AsyncIngressQueue(asyncio.Queue):
+    # Equivalente de IngressQueue para el servidor con asyncio
+
+    def __init__(self, capacity: int = INGRESS_CAPACITY):
+        super().__init__(capacity)
+        self.capacity = capacity
+        self.dropped = 0
+        # Se crea desde el loop, wake llega desde otros threads
+        self.loop = asyncio.get_running_loop()
+
+    def offer(self, data: bytes) -> bool:
+        try:
+            self.put_nowait(data)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        return True
+
+    @property
+    def free(self) -> int:
+        return max(0, self.capacity - self.qsize())
+
+    def wake(self):
+        self.loop.call_soon_threadsafe(self.wake_nowait)
+
+    def wake_nowait(self):
+        # Con la cola llena el handler ya tiene datagramas que procesar
+        if not self.full():
+            self.put_nowait(WAKEUP)
@@ -0,0 +1,43 @@
+import socket
+from typing import Optional
+from .Header import HEADER_SIZE
+
+# MSS cuando no se puede consultar el MTU del camino
+DEFAULT_MSS = 1024
+# Headers de IPv4 y UDP
+IP_UDP_OVERHEAD = 28
+# Mayor payload de un datagrama UDP sobre IPv4
+MAX_UDP_PAYLOAD = 65507
+MAX_MSS = MAX_UDP_PAYLOAD - HEADER_SIZE
+# linux/in.h, Python no lo expone
+IP_MTU = 14
+
+
+def path_mss(remote_addr: tuple[str, int]) -> Optional[int]:
+    """
+    MSS que entra sin fragmentar en el MTU del camino hacia remote_addr,
+    segun la ruta del kernel. None si el sistema no lo informa.
+    """
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # Conectar un socket UDP no envía nada, solo resuelve la ruta
+        probe.connect(remote_addr)
+        mtu = probe.getsockopt(socket.IPPROTO_IP, IP_MTU)
+    except OSError:
+        return None
+    finally:
+        probe.close()
+    return mtu - IP_UDP_OVERHEAD - HEADER_SIZE
+
+
+def local_mss(
+    remote_addr: tuple[str, int], configured: Optional[int] = None
+) -> int:
+    if configured is not None:
+        return negotiate_mss(configured)
+    return negotiate_mss(path_mss(remote_addr) or DEFAULT_MSS)
+
+
+def negotiate_mss(*offers: int) -> int:
+    # Se usa la menor de las ofertas, dentro de lo que admite el header
+    return max(1, min(MAX_MSS, *offers))
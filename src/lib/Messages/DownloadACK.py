@@ -1,15 +1,49 @@
 from .Message import Message
+from ..FEC import FecParams, NO_FEC_PARAMS
+from ..Compression import NO_COMPRESSION
 
 
 class DownloadACK(Message):
-    def __init__(self, filesize: int):
+    def __init__(
+        self, filesize: int, mss: int, offset: int = 0, mtime: int = 0,
+        manifest_size: int = 0, fec: FecParams = NO_FEC_PARAMS,
+        compression: int = NO_COMPRESSION
+    ):
         self.filesize = filesize
+        # MSS elegido por el servidor entre la oferta del cliente y la suya
+        self.mss = mss
+        # Offset desde el que se envía el archivo, 0 si no se reanuda
+        self.offset = offset
+        self.mtime = mtime
+        # Distinto de 0 si se descarga un directorio como lote de archivos
+        self.manifest_size = manifest_size
+        # Bloques FEC aceptados por el servidor
+        self.fec = fec
+        # Compresión aceptada por el servidor
+        self.compression = compression
+
+    @property
+    def identity(self) -> tuple[int, int]:
+        return self.filesize, self.mtime
 
     def to_bytes(self) -> bytes:
-        return self.filesize.to_bytes(4, byteorder='big')
+        return self.filesize.to_bytes(4, byteorder='big') + \
+            self.mss.to_bytes(2, byteorder='big') + \
+            self.offset.to_bytes(4, byteorder='big') + \
+            self.mtime.to_bytes(8, byteorder='big') + \
+            self.manifest_size.to_bytes(4, byteorder='big') + \
+            self.fec.to_bytes() + \
+            self.compression.to_bytes(1, byteorder='big')
 
     @staticmethod
     def from_bytes(bytes: bytes) -> 'DownloadACK':
         filesize = int.from_bytes(bytes[0:4], byteorder='big')
+        mss = int.from_bytes(bytes[4:6], byteorder='big')
+        offset = int.from_bytes(bytes[6:10], byteorder='big')
+        mtime = int.from_bytes(bytes[10:18], byteorder='big')
+        manifest_size = int.from_bytes(bytes[18:22], byteorder='big')
+        fec = FecParams.from_bytes(bytes[22:25])
+        compression = int.from_bytes(bytes[25:26], byteorder='big')
 
-        return DownloadACK(filesize)
+        return DownloadACK(
+            filesize, mss, offset, mtime, manifest_size, fec, compression)
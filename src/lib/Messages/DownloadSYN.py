@@ -1,20 +1,50 @@
 from .Message import Message
+from ..Streams import SINGLE_STREAM
+from ..Admission import COOKIE_SIZE, NO_COOKIE
+from ..FEC import FecParams, NO_FEC_PARAMS
+from ..Compression import NO_COMPRESSION
 
 
 class DownloadSYN(Message):
-    def __init__(self, filename: str, mss: int, recovery_protocol: int):
+    def __init__(
+        self, filename: str, mss: int, recovery_protocol: int,
+        offset: int = 0, identity: tuple[int, int] = (0, 0),
+        stream: tuple[int, int] = SINGLE_STREAM, cookie: bytes = NO_COOKIE,
+        fec: FecParams = NO_FEC_PARAMS, compression: int = NO_COMPRESSION
+    ):
         self.filename = filename
         self.mss = mss
         self.recovery_protocol = recovery_protocol
+        # Offset desde el que reanudar y tamaño y mtime del archivo que se
+        # estaba descargando
+        self.offset = offset
+        self.identity = identity
+        # Indice del stream y cantidad de streams en que se divide el archivo
+        self.stream = stream
+        # Cookie que el servidor envió en respuesta al primer SYN
+        self.cookie = cookie
+        # Bloques FEC que pide el cliente
+        self.fec = fec
+        # Compresión de los segmentos que pide el cliente
+        self.compression = compression
 
     def to_bytes(self) -> bytes:
         filename_bytes = self.filename.encode('utf-8')
         filename_length = len(filename_bytes).to_bytes(2, byteorder='big')
         mss_bytes = self.mss.to_bytes(2, byteorder='big')
         recovery_bytes = self.recovery_protocol.to_bytes(1, byteorder='big')
+        size, mtime = self.identity
+        resume_bytes = (
+            self.offset.to_bytes(4, byteorder='big') +
+            size.to_bytes(4, byteorder='big') +
+            mtime.to_bytes(8, byteorder='big')
+        )
+        stream_bytes = bytes(self.stream)
 
         syn_segment = (
-            filename_length + filename_bytes + mss_bytes + recovery_bytes
+            filename_length + filename_bytes + mss_bytes + recovery_bytes +
+            resume_bytes + stream_bytes + self.cookie + self.fec.to_bytes() +
+            self.compression.to_bytes(1, byteorder='big')
         )
         return syn_segment
 
@@ -25,6 +55,18 @@ class DownloadSYN(Message):
         bytes = bytes[filename_lenght:]
         mss = int.from_bytes(bytes[:2], byteorder='big')
         bytes = bytes[2:]
-        recovery_protocol = int.from_bytes(bytes[:2], byteorder='big')
+        recovery_protocol = int.from_bytes(bytes[:1], byteorder='big')
+        bytes = bytes[1:]
+        offset = int.from_bytes(bytes[:4], byteorder='big')
+        size = int.from_bytes(bytes[4:8], byteorder='big')
+        mtime = int.from_bytes(bytes[8:16], byteorder='big')
+        stream = (bytes[16], bytes[17])
+        cookie = bytes[18:18 + COOKIE_SIZE]
+        bytes = bytes[18 + COOKIE_SIZE:]
+        fec = FecParams.from_bytes(bytes[:3])
+        compression = int.from_bytes(bytes[3:4], byteorder='big')
 
-        return DownloadSYN(filename, mss, recovery_protocol)
+        return DownloadSYN(
+            filename, mss, recovery_protocol, offset, (size, mtime), stream,
+            cookie, fec, compression
+        )
@@ -1,14 +1,31 @@
 from .Message import Message
+from ..FEC import FecParams, NO_FEC_PARAMS
+from ..Compression import NO_COMPRESSION
 
 
 class UploadACK(Message):
-    def __init__(self, mss: int):
+    def __init__(
+        self, mss: int, offset: int = 0, fec: FecParams = NO_FEC_PARAMS,
+        compression: int = NO_COMPRESSION
+    ):
+        # MSS elegido por el servidor entre la oferta del cliente y la suya
         self.mss = mss
+        # Offset desde el que se reanuda el upload, 0 si empieza de nuevo
+        self.offset = offset
+        # Bloques FEC aceptados por el servidor
+        self.fec = fec
+        # Compresión aceptada por el servidor
+        self.compression = compression
 
     def to_bytes(self) -> bytes:
-        return self.mss.to_bytes(2, byteorder='big')
+        return self.mss.to_bytes(2, byteorder='big') + \
+            self.offset.to_bytes(4, byteorder='big') + self.fec.to_bytes() + \
+            self.compression.to_bytes(1, byteorder='big')
 
     @staticmethod
     def from_bytes(bytes: bytes) -> 'UploadACK':
         mss = int.from_bytes(bytes[:2], byteorder='big')
-        return UploadACK(mss)
+        offset = int.from_bytes(bytes[2:6], byteorder='big')
+        fec = FecParams.from_bytes(bytes[6:9])
+        compression = int.from_bytes(bytes[9:10], byteorder='big')
+        return UploadACK(mss, offset, fec, compression)
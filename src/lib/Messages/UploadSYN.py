@@ -1,22 +1,57 @@
 from .Message import Message
+from ..Streams import SINGLE_STREAM
+from ..Admission import COOKIE_SIZE, NO_COOKIE
+from ..FEC import FecParams, NO_FEC_PARAMS
+from ..Compression import NO_COMPRESSION
+
+# El tamaño del archivo viaja en 4 bytes, en UploadSYN y en DownloadACK
+MAX_FILE_SIZE = 2**32 - 1
 
 
 class UploadSYN(Message):
     def __init__(
-        self, filename: str, file_size: int, recovery_protocol: int
+        self, filename: str, file_size: int, mss: int,
+        recovery_protocol: int, mtime: int = 0,
+        stream: tuple[int, int] = SINGLE_STREAM, manifest_size: int = 0,
+        cookie: bytes = NO_COOKIE, fec: FecParams = NO_FEC_PARAMS,
+        compression: int = NO_COMPRESSION
     ):
         self.filename = filename
         self.file_size = file_size
+        self.mss = mss
         self.recovery_protocol = recovery_protocol
+        # Junto con el tamaño identifica al archivo para reanudar el upload
+        self.mtime = mtime
+        # Indice del stream y cantidad de streams en que se divide el archivo
+        self.stream = stream
+        # Distinto de 0 si se sube un lote de archivos, los primeros bytes
+        # de los datos son el manifiesto y filename es el directorio destino
+        self.manifest_size = manifest_size
+        # Cookie que el servidor envió en respuesta al primer SYN
+        self.cookie = cookie
+        # Bloques FEC que pide el cliente
+        self.fec = fec
+        # Compresión de los segmentos que pide el cliente
+        self.compression = compression
+
+    @property
+    def identity(self) -> tuple[int, int]:
+        return self.file_size, self.mtime
 
     def to_bytes(self) -> bytes:
         filename_bytes = self.filename.encode('utf-8')
         filename_length = len(filename_bytes).to_bytes(2, byteorder='big')
         file_size_bytes = self.file_size.to_bytes(4, byteorder='big')
+        mss_bytes = self.mss.to_bytes(2, byteorder='big')
         recovery_bytes = self.recovery_protocol.to_bytes(1, byteorder='big')
+        mtime_bytes = self.mtime.to_bytes(8, byteorder='big')
+        stream_bytes = bytes(self.stream)
+        manifest_bytes = self.manifest_size.to_bytes(4, byteorder='big')
         syn_segment = (
             filename_length + filename_bytes + file_size_bytes +
-            recovery_bytes
+            mss_bytes + recovery_bytes + mtime_bytes + stream_bytes +
+            manifest_bytes + self.cookie + self.fec.to_bytes() +
+            self.compression.to_bytes(1, byteorder='big')
         )
 
         return syn_segment
@@ -29,6 +64,20 @@ class UploadSYN(Message):
         bytes = bytes[filename_lenght:]
         file_size = int.from_bytes(bytes[:4], byteorder='big')
         bytes = bytes[4:]
-        recovery_protocol = int.from_bytes(bytes[:2], byteorder='big')
+        mss = int.from_bytes(bytes[:2], byteorder='big')
+        bytes = bytes[2:]
+        recovery_protocol = int.from_bytes(bytes[:1], byteorder='big')
+        bytes = bytes[1:]
+        mtime = int.from_bytes(bytes[:8], byteorder='big')
+        bytes = bytes[8:]
+        stream = (bytes[0], bytes[1])
+        manifest_size = int.from_bytes(bytes[2:6], byteorder='big')
+        cookie = bytes[6:6 + COOKIE_SIZE]
+        bytes = bytes[6 + COOKIE_SIZE:]
+        fec = FecParams.from_bytes(bytes[:3])
+        compression = int.from_bytes(bytes[3:4], byteorder='big')
 
-        return UploadSYN(filename, file_size, recovery_protocol)
+        return UploadSYN(
+            filename, file_size, mss, recovery_protocol, mtime, stream,
+            manifest_size, cookie, fec, compression
+        )
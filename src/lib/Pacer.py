@@ -0,0 +1,140 @@
+from math import inf
+from threading import Lock
+from time import monotonic
+from typing import Optional
+from .Header import HEADER_SIZE
+
+# Ganancia sobre ventana / RTT: en slow start la ventana se duplica en cada
+# RTT y el pacer no debe frenar ese crecimiento
+SLOW_START_GAIN = 2
+CONGESTION_AVOIDANCE_GAIN = 1.25
+# Ráfaga que sale junta, en tiempo de envio a la tasa actual. Con menos,
+# cada datagrama costaría despertar al emisor y se perdería el envio en lote
+BURST_TIME = 0.002
+MIN_BURST_SEGMENTS = 4
+# Sufijos de las tasas configuradas, en bytes por segundo
+RATE_UNITS = {'K': 10 ** 3, 'M': 10 ** 6, 'G': 10 ** 9}
+
+
+class TokenBucket:
+    """
+    Token bucket en bytes, que puede compartirse entre transferencias.
+
+    Un envio se permite mientras quedan tokens y consume los bytes que
+    envió aunque deje el bucket en deuda, así un datagrama nunca se parte
+    ni espera a juntar su tamaño completo.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate * BURST_TIME
+        self.tokens = self.burst
+        self.last = monotonic()
+        # Los threads del servidor comparten el bucket del servidor
+        self.lock = Lock()
+
+    def available(self) -> float:
+        with self.lock:
+            self.refill()
+            return self.tokens
+
+    def delay(self) -> float:
+        # Segundos hasta salir de la deuda, 0 si ya se puede enviar
+        with self.lock:
+            self.refill()
+            return max(0.0, -self.tokens / self.rate)
+
+    def consume(self, size: int):
+        with self.lock:
+            self.refill()
+            self.tokens -= size
+
+    def refill(self):
+        now = monotonic()
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+
+class Pacer:
+    """
+    Espacia los envios de un emisor en lugar de mandar la ventana en una
+    sola ráfaga.
+
+    La tasa es la ventana de envio por RTT suavizado, con una ganancia
+    para que el pacer no limite el crecimiento de la ventana, acotada por
+    el limite de la transferencia. Si el servidor planifica la salida,
+    además se frena mientras la cola del flujo de la transferencia está
+    llena, hasta que el planificador lo despierte. Sin RTT medido ni
+    limites no se frena ningún envio.
+    """
+
+    def __init__(self, endpoint, rtt_estimator, congestion, mss: int):
+        self.endpoint = endpoint
+        self.rtt_estimator = rtt_estimator
+        self.congestion = congestion
+        self.segment_size = mss + HEADER_SIZE
+        self.bucket: Optional[TokenBucket] = None
+
+    def rate(self) -> Optional[float]:
+        rate = self.endpoint.rate_limit
+        srtt = self.rtt_estimator.srtt
+        if srtt:
+            if self.congestion.cwnd < self.congestion.ssthresh:
+                gain = SLOW_START_GAIN
+            else:
+                gain = CONGESTION_AVOIDANCE_GAIN
+            window_rate = \
+                gain * self.endpoint.window_size * self.segment_size / srtt
+            rate = window_rate if rate is None else min(rate, window_rate)
+        return rate
+
+    def update(self) -> Optional[TokenBucket]:
+        # Ajusta el bucket propio a la tasa actual, None si no hay tasa
+        rate = self.rate()
+        if rate is None:
+            self.bucket = None
+            return None
+        burst = max(MIN_BURST_SEGMENTS * self.segment_size, rate * BURST_TIME)
+        if self.bucket is None:
+            self.bucket = TokenBucket(rate, burst)
+        else:
+            self.bucket.rate = rate
+            self.bucket.burst = burst
+        return self.bucket
+
+    def allowance(self) -> float:
+        # Bytes que se pueden enviar ahora, el ultimo puede pasarse
+        allowance = inf
+        bucket = self.update()
+        if bucket is not None:
+            allowance = bucket.available()
+        egress = self.endpoint.egress
+        if egress is not None:
+            allowance = min(allowance, egress.room())
+        return allowance
+
+    def delay(self) -> Optional[float]:
+        # None si hay que esperar a que el planificador despierte al emisor
+        egress = self.endpoint.egress
+        if egress is not None and egress.blocked():
+            return None
+        if self.bucket is not None:
+            return self.bucket.delay()
+        return 0.0
+
+    def consume(self, size: int):
+        if self.bucket is not None:
+            self.bucket.consume(size)
+
+
+def parse_rate(value: str) -> float:
+    # Tasa en bytes por segundo, con sufijo K, M o G opcional
+    value = value.strip().upper()
+    multiplier = RATE_UNITS.get(value[-1:], 1)
+    if value[-1:] in RATE_UNITS:
+        value = value[:-1]
+    rate = float(value) * multiplier
+    if rate <= 0:
+        raise ValueError(f"La tasa debe ser positiva: {value}")
+    return rate
@@ -4,3 +4,4 @@ from enum import IntEnum
 class ProtocolID(IntEnum):
     STOP_AND_WAIT = 1
     GO_BACK_N = 2
+    SELECTIVE_REPEAT = 3
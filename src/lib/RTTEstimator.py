@@ -0,0 +1,53 @@
+from typing import Optional
+
+ALPHA = 1 / 8
+BETA = 1 / 4
+K = 4
+# Granularidad del reloj en segundos
+CLOCK_GRANULARITY = 0.001
+MIN_RTO = 0.05
+MAX_RTO = 60
+INITIAL_RTO = 1
+
+
+class RTTEstimator:
+    """
+    Estimador de RTT de Jacobson/Karels (RFC 6298).
+
+    Por la regla de Karn, los protocolos solo deben llamar a sample con
+    mediciones de segmentos que no fueron retransmitidos. Ante un timeout,
+    backoff duplica el RTO y este se mantiene hasta la siguiente muestra
+    valida.
+    """
+
+    def __init__(
+        self,
+        initial_rtt: Optional[float] = None,
+        min_rto: float = MIN_RTO,
+        max_rto: float = MAX_RTO
+    ):
+        self.srtt = None
+        self.rttvar = None
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.rto = INITIAL_RTO
+        if initial_rtt is not None:
+            self.sample(initial_rtt)
+
+    def sample(self, rtt: float):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - BETA) * self.rttvar + \
+                BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - ALPHA) * self.srtt + ALPHA * rtt
+        self.rto = self.clamp(
+            self.srtt + max(CLOCK_GRANULARITY, K * self.rttvar)
+        )
+
+    def backoff(self):
+        self.rto = self.clamp(self.rto * 2)
+
+    def clamp(self, rto: float) -> float:
+        return min(max(rto, self.min_rto), self.max_rto)
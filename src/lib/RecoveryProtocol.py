@@ -1,22 +1,525 @@
-from io import BufferedWriter
-from queue import Queue
+import asyncio
+from queue import Queue, Empty
 from abc import ABC, abstractmethod
+from time import time
+from typing import Optional
 from .Flags import Flags
+from .Header import Header
+from .Datagram import Datagram
+from .FileSource import FileSource
+from .FileSink import SegmentSink
+from .CongestionControl import CongestionControl, Reno
+from .RTTEstimator import RTTEstimator, MAX_RTO
+from .Pacer import Pacer
+from .FEC import FecEncoder, FecDecoder
+from .Compression import (
+    NO_COMPRESSION, SegmentCompressor, compression_codec
+)
+from .TimerWheel import Timer, TimerWheel
+from .Sessions import TIME_WAIT
+from .IngressQueue import WAKEUP
+import logging
+
+# Envios del FIN sin respuesta antes de dar la conexión por cerrada
+FIN_RETRIES = 5
+# Sin datos del emisor durante este tiempo se da por caida la transferencia,
+# supera a cualquier espera entre retransmisiones
+IDLE_TIMEOUT = 2 * MAX_RTO
+
+
+class Sender(ABC):
+    """
+    Estado del emisor de un protocolo de recuperación.
+
+    No hace I/O de recepción: el driver (con threads o asyncio) le entrega
+    los datagramas recibidos y los timeouts, y respeta el deadline que
+    indica el emisor.
+    """
+
+    def __init__(
+        self,
+        endpoint,
+        source: FileSource,
+        receiver_mss: int,
+        flag: int,
+        rtt: Optional[float],
+        congestion_control: type[CongestionControl]
+    ):
+        self.endpoint = endpoint
+        self.source = source
+        self.receiver_mss = receiver_mss
+        self.flag = flag
+        self.rtt_estimator = RTTEstimator(rtt)
+        self.congestion = congestion_control(endpoint.window_size)
+        self.deadline: Optional[float] = None
+        self.pacer = Pacer(
+            endpoint, self.rtt_estimator, self.congestion, receiver_mss)
+        # send_window dejó datos sin enviar porque el pacer lo frenó
+        self.paced = False
+        self.fec = None
+        if endpoint.fec.enabled:
+            self.fec = FecEncoder(endpoint.fec)
+        self.compressor = None
+        if endpoint.compression != NO_COMPRESSION:
+            self.compressor = SegmentCompressor(
+                compression_codec(endpoint.compression), source, receiver_mss)
+
+    @property
+    @abstractmethod
+    def done(self) -> bool:
+        pass
+
+    @abstractmethod
+    def send_window(self):
+        pass
+
+    @abstractmethod
+    def on_datagram(self, datagram: Datagram):
+        pass
+
+    @abstractmethod
+    def on_timeout(self):
+        pass
+
+    def read_segment(self, index: int) -> bytes:
+        # El segmento tal como se envía, comprimido si se negoció
+        if self.compressor is not None:
+            return self.compressor.segment(index)
+        return self.source.read_segment(index, self.receiver_mss)
+
+    def raw_segment(self, index: int) -> bytes:
+        if self.compressor is not None:
+            return self.compressor.read(index)
+        return self.source.read_segment(index, self.receiver_mss)
+
+    def repairs(self, index: int, total: int) -> list[Datagram]:
+        # Segmentos de reparación del bloque que cierra el segmento index,
+        # ninguno si no cierra un bloque
+        fec = self.fec
+        if fec is None or not fec.closes_block(index, total):
+            return []
+        first = index - index % fec.k
+        # Las reparaciones cubren los segmentos sin comprimir
+        segments = [self.raw_segment(i) for i in range(first, index + 1)]
+        # El numero de ACK de una reparación es su indice en el bloque
+        return [
+            Datagram(
+                Header(
+                    payload_size=len(repair),
+                    sequence_number=first + 1,
+                    acknowledgment_number=j,
+                    flags=self.flag | Flags.REPAIR,
+                    connection_id=self.endpoint.connection_id
+                ),
+                repair
+            )
+            for j, repair in enumerate(fec.encode(segments))
+        ]
+
+    def pause(self) -> Optional[float]:
+        # Espera hasta poder seguir enviando. None si no hay envios frenados
+        # o si los despierta el planificador de salida del servidor
+        if not self.paced:
+            return None
+        return self.pacer.delay()
+
+    def restart_timer(self):
+        self.deadline = time() + self.rtt_estimator.rto
+
+    def stop_timer(self):
+        self.deadline = None
+
+    def close(self):
+        if self.compressor is not None:
+            self.compressor.close()
+
+
+class Receiver(ABC):
+    """
+    Estado del receptor de un protocolo de recuperación.
+
+    Los datos se escriben a través de un SegmentSink, fuera del camino que
+    genera los ACKs. El segmento 0 es el primero desde el inicio del sink,
+    que puede no ser el del archivo si la transferencia se reanuda.
+    """
+
+    def __init__(self, endpoint, sink: SegmentSink):
+        self.endpoint = endpoint
+        self.sink = sink
+        self.bytes_written = 0
+        self.fec = None
+        if endpoint.fec.enabled:
+            self.fec = FecDecoder(
+                endpoint.fec, sink.segments, sink.segment_length)
+        # Segmentos que el protocolo descartó por llegar fuera de orden,
+        # se le entregan cuando FEC recupera el que faltaba
+        self.held: dict[int, bytes] = {}
+        self.codec = None
+        if endpoint.compression != NO_COMPRESSION:
+            self.codec = compression_codec(endpoint.compression)
+
+    @property
+    def done(self) -> bool:
+        return self.sink.complete
+
+    @abstractmethod
+    def on_datagram(self, datagram: Datagram):
+        pass
+
+    def receive(self, datagram: Datagram):
+        # Con FEC, además de entregar el datagrama al protocolo se
+        # reconstruyen los segmentos que faltan de su bloque
+        if self.codec is not None and datagram.is_data():
+            datagram = self.expand(datagram)
+        fec = self.fec
+        if fec is None:
+            self.on_datagram(datagram)
+            return
+        sink = self.sink
+        flags = datagram.header.flags & ~Flags.REPAIR
+        if datagram.is_repair():
+            recovered = fec.add_repair(
+                datagram.get_sequence_number() - 1,
+                datagram.get_ack_number(),
+                datagram.data
+            )
+        else:
+            index = datagram.get_sequence_number() - 1
+            fresh = 0 <= index < sink.segments and not sink.has(index)
+            self.on_datagram(datagram)
+            if not fresh:
+                return
+            self.hold(index, datagram.data)
+            recovered = fec.add_data(index, datagram.data)
+        for index, data in recovered:
+            self.deliver(index, data, flags)
+        while sink.contiguous in self.held:
+            index = sink.contiguous
+            self.deliver(index, self.held.pop(index), flags)
+            if sink.contiguous == index:
+                break
+        fec.prune(sink.contiguous)
+
+    def expand(self, datagram: Datagram) -> Datagram:
+        # Un segmento más corto que su lugar en el archivo llegó comprimido.
+        # Si no se puede descomprimir se aborta: el emisor reenviaría los
+        # mismos bytes y la transferencia no avanzaría
+        index = datagram.get_sequence_number() - 1
+        if not 0 <= index < self.sink.segments:
+            return datagram
+        length = self.sink.segment_length(index)
+        if datagram.get_payload_size() >= length:
+            return datagram
+        data = self.codec.decompress(datagram.data, length)
+        if data is None or len(data) != length:
+            abort(self.endpoint, f"Segmento comprimido inválido: {index + 1}")
+        return Datagram(datagram.header._replace(payload_size=length), data)
+
+    def deliver(self, index: int, data: bytes, flags: int):
+        # Entrega un segmento recuperado como si hubiera llegado
+        if self.sink.has(index):
+            return
+        self.on_datagram(
+            Datagram(Header(len(data), index + 1, 0, flags), data))
+        self.hold(index, data)
+
+    def hold(self, index: int, data: bytes):
+        if self.sink.has(index):
+            return
+        contiguous = self.sink.contiguous
+        if index < contiguous + self.endpoint.receive_window:
+            self.held[index] = data
+        if len(self.held) > self.endpoint.receive_window:
+            for stale in [i for i in self.held if i < contiguous]:
+                del self.held[stale]
+
+    def flush(self):
+        # La cola de entrada se vació: se envían los ACKs demorados
+        pass
+
+    def on_linger(self, datagram: Datagram) -> bool:
+        # Datagramas recibidos luego de completar el archivo. El FIN del
+        # emisor cierra la conexión, cualquier otro indica que el emisor no
+        # recibio el ultimo ACK
+        if datagram.is_fin():
+            send_fin_ack(self.endpoint, datagram)
+            return True
+        if datagram.is_repair():
+            return False
+        self.endpoint.send_last_message()
+        return False
+
+    def write(self, data: bytes):
+        # Escritura en orden, el segmento es el siguiente al ultimo contiguo
+        self.write_segment(self.sink.contiguous, data)
+
+    def write_segment(self, index: int, data: bytes) -> bool:
+        if not self.sink.write_segment(index, data):
+            return False
+        self.bytes_written += len(data)
+        return True
+
+    def close(self):
+        self.sink.close()
 
 
 class RecoveryProtocol(ABC):
+    # Si el emisor envía reparaciones FEC. Requiere una ventana: los
+    # bloques se codifican sobre segmentos consecutivos en vuelo
+    SUPPORTS_FEC = False
+    # Si los segmentos pueden ir comprimidos. Sin ventana cada segmento
+    # espera su ACK, y comprimirlo no reduce los RTTs de la transferencia
+    SUPPORTS_COMPRESSION = False
+
+    def __init__(
+        self, congestion_control: type[CongestionControl] = Reno
+    ):
+        self.congestion_control = congestion_control
 
     @abstractmethod
-    def send(self, endpoint, data: bytes, receiver_mss: int):
+    def sender(
+        self,
+        endpoint,
+        source: FileSource,
+        receiver_mss: int,
+        flag: int,
+        rtt: Optional[float]
+    ) -> Sender:
         pass
 
     @abstractmethod
-    def receive(
+    def receiver(self, endpoint, sink: SegmentSink) -> Receiver:
+        pass
+
+    def send(
         self,
         endpoint,
-        file: BufferedWriter,
+        source: FileSource,
         queue: Queue,
-        file_size: int,
-        flag: Flags
+        receiver_mss: int,
+        flag: int,
+        rtt: Optional[float]
     ):
-        pass
+        sender = self.sender(endpoint, source, receiver_mss, flag, rtt)
+        timer = None
+        deadline = None
+        last_reply = time()
+        try:
+            while not sender.done:
+                sender.send_window()
+                if sender.deadline != deadline:
+                    deadline = sender.deadline
+                    endpoint.timers.cancel(timer)
+                    timer = None
+                    if deadline is not None:
+                        timer = start_timer(
+                            endpoint.timers, deadline - time(), queue)
+                try:
+                    response_data = queue.get(timeout=sender.pause())
+                except Empty:
+                    continue
+                if response_data is WAKEUP:
+                    # El planificador de salida volvió a tener lugar
+                    continue
+                if isinstance(response_data, TimeoutError):
+                    # Un timer cancelado pudo haber vencido antes
+                    if response_data.args[0] is timer:
+                        timer = deadline = None
+                        check_idle(last_reply)
+                        sender.on_timeout()
+                    continue
+                last_reply = time()
+                sender.on_datagram(receive_reply(response_data))
+        finally:
+            endpoint.timers.cancel(timer)
+            sender.close()
+        self.close(endpoint, queue, sender.rtt_estimator.rto)
+
+    def close(self, endpoint, queue: Queue, rto: float):
+        # El FIN se reenvia con backoff hasta recibir el FIN-ACK. Pasado
+        # TIME_WAIT el receptor ya olvidó la conexión y no va a responder
+        fin = fin_datagram(endpoint)
+        give_up = time() + TIME_WAIT
+        for _ in range(FIN_RETRIES):
+            if time() >= give_up:
+                break
+            endpoint.send_message(fin)
+            deadline = min(time() + rto, give_up)
+            while deadline > time():
+                try:
+                    data = queue.get(timeout=deadline - time())
+                except Empty:
+                    break
+                if data is WAKEUP or isinstance(data, TimeoutError):
+                    continue
+                if Datagram.from_bytes(data).is_fin_ack():
+                    logging.info("Conexión cerrada correctamente")
+                    return
+            rto = min(2 * rto, MAX_RTO)
+        logging.warning("El receptor no confirmó el cierre de la conexión")
+
+    def receive(
+        self,
+        endpoint,
+        sink: SegmentSink,
+        queue: Queue
+    ) -> Receiver:
+        receiver = self.receiver(endpoint, sink)
+        try:
+            while not receiver.done:
+                try:
+                    data = queue.get_nowait()
+                except Empty:
+                    receiver.flush()
+                    try:
+                        data = queue.get(timeout=IDLE_TIMEOUT)
+                    except Empty:
+                        raise TimeoutError("El emisor dejó de enviar datos")
+                receiver.receive(Datagram.from_bytes(data))
+        finally:
+            receiver.close()
+        logging.info(
+            f"Archivo recibido correctamente: {receiver.bytes_written} bytes")
+        return receiver
+
+    def wait_close(self, receiver: Receiver, queue: Queue):
+        # Responde las retransmisiones del emisor hasta recibir su FIN. El
+        # servidor no espera, deja la sesión en TIME_WAIT
+        while True:
+            try:
+                data = queue.get(timeout=TIME_WAIT)
+            except Empty:
+                logging.warning("El emisor no cerró la conexión")
+                return
+            if receiver.on_linger(Datagram.from_bytes(data)):
+                logging.info("Conexión cerrada correctamente")
+                return
+
+    async def send_async(
+        self,
+        endpoint,
+        source: FileSource,
+        queue: asyncio.Queue,
+        receiver_mss: int,
+        flag: int,
+        rtt: Optional[float]
+    ):
+        sender = self.sender(endpoint, source, receiver_mss, flag, rtt)
+        last_reply = time()
+        try:
+            while not sender.done:
+                sender.send_window()
+                timeout = sender.pause()
+                if sender.deadline is not None:
+                    expires = max(0, sender.deadline - time())
+                    timeout = \
+                        expires if timeout is None else min(timeout, expires)
+                try:
+                    response_data = await asyncio.wait_for(
+                        queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    # La espera pudo terminar para reanudar envios frenados
+                    if sender.deadline is not None and \
+                            time() >= sender.deadline:
+                        check_idle(last_reply)
+                        sender.on_timeout()
+                    continue
+                if response_data is WAKEUP:
+                    continue
+                last_reply = time()
+                sender.on_datagram(receive_reply(response_data))
+        finally:
+            sender.close()
+        await self.close_async(endpoint, queue, sender.rtt_estimator.rto)
+
+    async def close_async(self, endpoint, queue: asyncio.Queue, rto: float):
+        fin = fin_datagram(endpoint)
+        give_up = time() + TIME_WAIT
+        for _ in range(FIN_RETRIES):
+            if time() >= give_up:
+                break
+            endpoint.send_message(fin)
+            deadline = min(time() + rto, give_up)
+            while deadline > time():
+                try:
+                    data = await asyncio.wait_for(
+                        queue.get(), deadline - time())
+                except asyncio.TimeoutError:
+                    break
+                if data is WAKEUP:
+                    continue
+                if Datagram.from_bytes(data).is_fin_ack():
+                    logging.info("Conexión cerrada correctamente")
+                    return
+            rto = min(2 * rto, MAX_RTO)
+        logging.warning("El receptor no confirmó el cierre de la conexión")
+
+    async def receive_async(
+        self,
+        endpoint,
+        sink: SegmentSink,
+        queue: asyncio.Queue
+    ) -> Receiver:
+        receiver = self.receiver(endpoint, sink)
+        # La escritura no puede bloquear el loop: con el disco atrasado se
+        # espera en otro thread, sin procesar datagramas ni enviar ACKs
+        sink.blocking = False
+        try:
+            while not receiver.done:
+                if queue.empty():
+                    receiver.flush()
+                data = await asyncio.wait_for(queue.get(), IDLE_TIMEOUT)
+                receiver.receive(Datagram.from_bytes(data))
+                if sink.congested:
+                    await asyncio.to_thread(sink.drain)
+        finally:
+            # Esperar al thread de escritura no debe bloquear el loop
+            await asyncio.to_thread(receiver.close)
+        logging.info(
+            f"Archivo recibido correctamente: {receiver.bytes_written} bytes")
+        return receiver
+
+
+def check_idle(last_reply: float):
+    # Sin respuestas del receptor durante IDLE_TIMEOUT se abandona el envio,
+    # un cliente que desapareció no retiene la sesión para siempre
+    if time() - last_reply > IDLE_TIMEOUT:
+        raise TimeoutError("El receptor dejó de responder")
+
+
+def receive_reply(data: bytes) -> Datagram:
+    # Un error del receptor aborta el envio
+    datagram = Datagram.from_bytes(data)
+    if datagram.is_error():
+        raise ConnectionAbortedError(datagram.analyze().msg)
+    return datagram
+
+
+def abort(endpoint, reason: str):
+    # Avisa al otro extremo antes de abandonar la transferencia
+    error = Datagram.make_error_datagram(
+        endpoint.seq, endpoint.ack, reason.encode(), endpoint.connection_id)
+    endpoint.send_message(error.to_bytes())
+    raise ConnectionAbortedError(reason)
+
+
+def fin_datagram(endpoint) -> bytes:
+    header = Header(
+        0, endpoint.seq, endpoint.ack, Flags.FIN,
+        connection_id=endpoint.connection_id
+    )
+    return Datagram(header, b'').to_bytes()
+
+
+def send_fin_ack(endpoint, fin: Datagram):
+    header = Header(
+        0, endpoint.seq, fin.get_sequence_number(), Flags.FIN_ACK,
+        connection_id=endpoint.connection_id
+    )
+    endpoint.send_message(Datagram(header, b'').to_bytes())
+
+
+def start_timer(timers: TimerWheel, delay: float, queue: Queue) -> Timer:
+    return timers.schedule(
+        delay, lambda expired: queue.put(TimeoutError(expired))
+    )
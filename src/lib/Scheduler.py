@@ -0,0 +1,176 @@
+from collections import deque
+from threading import Condition, Thread
+from time import sleep
+from typing import Optional
+from .BatchIO import BatchSender
+from .Header import HEADER_SIZE
+from .Pacer import TokenBucket
+import logging
+
+# Bytes que recibe cada flujo por ronda, multiplicados por su peso
+QUANTUM = 16 * 1024
+# Bytes que un flujo puede tener encolados antes de frenar a su emisor, al
+# menos un datagrama del MSS de la transferencia
+FLOW_BUFFER = 2 * QUANTUM
+DEFAULT_WEIGHT = 1.0
+
+
+class Flow:
+    # Cola de salida de una transferencia
+    __slots__ = ('scheduler', 'endpoint', 'weight', 'pending', 'queued',
+                 'deficit', 'listed', 'waiting')
+
+    def __init__(self, scheduler: 'EgressScheduler', endpoint, weight: float):
+        self.scheduler = scheduler
+        self.endpoint = endpoint
+        self.weight = weight
+        self.pending: deque = deque()
+        # Bytes encolados o en envio
+        self.queued = 0
+        self.deficit = 0.0
+        # Lista de flujos activos en la que está, None si en ninguna
+        self.listed: Optional[deque] = None
+        # El emisor espera a que la cola vuelva a tener lugar
+        self.waiting = False
+
+    def send(self, datagrams):
+        self.scheduler.enqueue(self, datagrams)
+
+    @property
+    def capacity(self) -> int:
+        # El MSS se negocia luego de crear el flujo
+        return max(FLOW_BUFFER, self.endpoint.mss + HEADER_SIZE)
+
+    def room(self) -> int:
+        return self.capacity - self.queued
+
+    def blocked(self) -> bool:
+        # Si la cola está llena. El planificador despierta al emisor, a
+        # través de su cola de entrada, cuando vuelve a tener lugar
+        with self.scheduler.ready:
+            self.waiting = self.queued >= self.capacity
+            return self.waiting
+
+    def clear(self):
+        self.scheduler.clear(self)
+
+
+class EgressScheduler:
+    """
+    Planificador de salida del servidor, con deficit round robin entre las
+    transferencias.
+
+    Los emisores encolan sus datagramas de datos en su flujo en lugar de
+    enviarlos, y un thread los envía recorriendo en ronda los flujos con
+    datos: cada visita suma al déficit del flujo QUANTUM por su peso y
+    envía sus datagramas mientras entren en el déficit, así por ronda una
+    transferencia grande no envía más que una chica de igual peso. Como en
+    fq_codel, un flujo que vuelve a tener datos luego de vaciar su cola se
+    atiende antes que los que la tienen siempre llena, por lo que la
+    ventana de una transferencia chica no espera una ronda completa. Con
+    un limite de tasa, el thread espera los tokens del bucket antes de
+    cada envio.
+
+    La cola de cada flujo está acotada: el pacer del emisor no envía
+    mientras esté llena. Los ACKs y mensajes de control no pasan por el
+    planificador.
+    """
+
+    def __init__(self, socket, rate: Optional[float] = None):
+        self.bucket = TokenBucket(rate) if rate is not None else None
+        self.batch_sender = BatchSender(socket)
+        # Flujos con datagramas encolados, en orden de visita. Los nuevos
+        # tienen prioridad durante su primer quantum
+        self.new: deque[Flow] = deque()
+        self.old: deque[Flow] = deque()
+        self.ready = Condition()
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def flow(self, endpoint, weight: float = DEFAULT_WEIGHT) -> Flow:
+        return Flow(self, endpoint, weight)
+
+    def enqueue(self, flow: Flow, datagrams):
+        size = sum(HEADER_SIZE + len(datagram.data) for datagram in datagrams)
+        with self.ready:
+            if flow.listed is None:
+                flow.listed = self.new
+                flow.deficit = QUANTUM * flow.weight
+                self.new.append(flow)
+            flow.pending.extend(datagrams)
+            flow.queued += size
+            self.ready.notify()
+
+    def clear(self, flow: Flow):
+        # Descarta lo que el flujo no llegó a enviar
+        with self.ready:
+            flow.waiting = False
+            if flow.listed is None:
+                return
+            flow.listed.remove(flow)
+            flow.listed = None
+            flow.queued -= sum(
+                HEADER_SIZE + len(datagram.data) for datagram in flow.pending)
+            flow.pending.clear()
+
+    def run(self):
+        while True:
+            # Se esperan los tokens antes de elegir el flujo, así uno que
+            # llega durante la espera ya compite por el proximo envio
+            if self.bucket is not None:
+                delay = self.bucket.delay()
+                if delay > 0:
+                    sleep(delay)
+            with self.ready:
+                while not self.new and not self.old:
+                    self.ready.wait()
+                flow, run, size = self.next_run()
+            if not run:
+                continue
+            if self.bucket is not None:
+                self.bucket.consume(size)
+            try:
+                self.batch_sender.send_datagrams(
+                    run, flow.endpoint.remote_addr, HEADER_SIZE)
+            except OSError as e:
+                # El protocolo de recuperación retransmite lo perdido
+                logging.debug(f"Error enviando datagramas encolados: {e}")
+            with self.ready:
+                flow.queued -= size
+                if flow.waiting and flow.queued < flow.capacity:
+                    flow.waiting = False
+                    flow.endpoint.ingress.wake()
+
+    def next_run(self) -> tuple[Flow, list, int]:
+        # Datagramas del flujo al frente que entran en su déficit
+        flows = self.new or self.old
+        flow = flows[0]
+        pending = flow.pending
+        run = []
+        size = 0
+        while pending:
+            length = HEADER_SIZE + len(pending[0].data)
+            if length > flow.deficit:
+                break
+            run.append(pending.popleft())
+            flow.deficit -= length
+            size += length
+        flows.popleft()
+        if pending:
+            # Agotó su quantum: pasa al final de la ronda con uno nuevo
+            flow.deficit += QUANTUM * flow.weight
+            flow.listed = self.old
+            self.old.append(flow)
+        else:
+            # Un flujo sin datos no acumula déficit para la proxima vez
+            flow.listed = None
+            flow.deficit = 0.0
+        return flow, run, size
+
+
+def parse_weight(value: str) -> tuple[str, float]:
+    # Peso de un cliente con la forma HOST=PESO
+    host, _, weight = value.rpartition('=')
+    if not host or float(weight) <= 0:
+        raise ValueError(f"Peso inválido: {value}")
+    return host, float(weight)
@@ -0,0 +1,238 @@
+from time import time
+from typing import Optional
+from .Header import Header, HEADER_SIZE
+from .Datagram import Datagram
+from .RecoveryProtocol import RecoveryProtocol, Sender, Receiver
+from .Endpoint import Endpoint
+from .ProtocolID import ProtocolID
+from .FileSource import FileSource
+from .FileSink import SegmentSink
+from .GoBackN import DUP_ACK_THRESHOLD
+import logging
+
+SACK_SIZE = 4
+
+
+class SelectiveRepeat(RecoveryProtocol):
+    PROTOCOL_ID = ProtocolID.SELECTIVE_REPEAT
+    SUPPORTS_FEC = True
+    SUPPORTS_COMPRESSION = True
+
+    def sender(
+        self,
+        endpoint: Endpoint,
+        source: FileSource,
+        receiver_mss: int,
+        flag: int,
+        rtt: Optional[float]
+    ) -> 'SelectiveRepeatSender':
+        return SelectiveRepeatSender(
+            endpoint, source, receiver_mss, flag, rtt,
+            self.congestion_control
+        )
+
+    def receiver(
+        self, endpoint: Endpoint, sink: SegmentSink
+    ) -> 'SelectiveRepeatReceiver':
+        return SelectiveRepeatReceiver(endpoint, sink)
+
+
+class SelectiveRepeatSender(Sender):
+    # Cada segmento en vuelo tiene su propio timer, representado por su
+    # deadline. Solo se retransmiten los segmentos cuyo timer vencio. Los
+    # timers de una misma ráfaga de pérdidas vencen con pocos ms de
+    # diferencia: el RTO se duplica y la ventana se reduce una sola vez por
+    # RTO, no una vez por segmento. Un segmento que falta cuando el
+    # receptor ya confirmó uno más de DUP_ACK_THRESHOLD por encima se
+    # reenvia sin esperar su timer
+
+    def __init__(self, endpoint: Endpoint, source: FileSource, *args):
+        super().__init__(endpoint, source, *args)
+        self.base = endpoint.seq
+        self.next_seq = self.base
+        endpoint.increment_seq()
+        self.buffer: dict[int, Datagram] = {}
+        self.deadlines: dict[int, float] = {}
+        self.sent_at: dict[int, float] = {}
+        self.retransmitted: set[int] = set()
+        # Hasta este instante los timeouts no vuelven a aumentar el RTO
+        self.backoff_until = 0.0
+        # Segmentos por debajo de sack_limit ya se revisaron buscando huecos,
+        # y las pérdidas de segmentos anteriores a recover no vuelven a
+        # reducir la ventana
+        self.sack_limit = 0
+        self.recover = 0
+        self.total_segments = source.segment_count(self.receiver_mss)
+        logging.info(f"Tamaño del archivo: {len(source)} bytes")
+        logging.info(f"MSS: {self.receiver_mss} bytes")
+        logging.info(f"Tamaño de la ventana: {endpoint.window_size} paquetes")
+        logging.info(f"Número total de paquetes: {self.total_segments}")
+
+    @property
+    def done(self) -> bool:
+        return self.base >= self.total_segments
+
+    def send_window(self):
+        batch = []
+        allowance = self.pacer.allowance()
+        sent = 0
+        self.paced = False
+        while self.next_seq < self.base + self.endpoint.window_size and \
+                self.next_seq < self.total_segments:
+            if sent >= allowance:
+                self.paced = True
+                break
+            next_seq = self.next_seq
+            segment = self.read_segment(next_seq)
+            header = Header(
+                payload_size=len(segment),
+                sequence_number=next_seq + 1,
+                acknowledgment_number=self.endpoint.ack,
+                flags=self.flag,
+                connection_id=self.endpoint.connection_id
+            )
+            datagram = Datagram(header, segment)
+            self.buffer[next_seq] = datagram
+            batch.append(datagram)
+            sent += HEADER_SIZE + len(segment)
+            for repair in self.repairs(next_seq, self.total_segments):
+                batch.append(repair)
+                sent += HEADER_SIZE + repair.get_payload_size()
+            self.sent_at[next_seq] = time()
+            self.deadlines[next_seq] = \
+                self.sent_at[next_seq] + self.rtt_estimator.rto
+            logging.debug(
+                f"Paquete enviado: Seq={next_seq + 1}, "
+                f"Tamaño={len(segment)} bytes")
+            self.next_seq += 1
+        self.pacer.consume(sent)
+        self.endpoint.send_datagrams(batch)
+        self.update_deadline()
+
+    def update_deadline(self):
+        self.deadline = min(self.deadlines.values(), default=None)
+
+    def on_timeout(self):
+        now = time()
+        expired = [
+            seq for seq, deadline in self.deadlines.items()
+            if deadline <= now
+        ]
+        if expired and now >= self.backoff_until:
+            logging.debug(f"Timeout actual: {self.rtt_estimator.rto} segundos")
+            self.rtt_estimator.backoff()
+            self.congestion.on_timeout()
+            self.endpoint.apply_congestion_window(self.congestion.window)
+            self.backoff_until = now + self.rtt_estimator.rto
+            self.recover = self.next_seq
+        for seq in expired:
+            self.retransmit(seq, now)
+        self.update_deadline()
+
+    def retransmit(self, seq: int, now: float):
+        # Las retransmisiones no esperan al pacer, pero consumen de él
+        datagram = self.buffer[seq]
+        self.endpoint.send_datagram(datagram)
+        self.pacer.consume(HEADER_SIZE + datagram.get_payload_size())
+        self.deadlines[seq] = now + self.rtt_estimator.rto
+        self.retransmitted.add(seq)
+        logging.debug(f"Reenviado paquete: {seq + 1}")
+
+    def on_datagram(self, response_datagram: Datagram):
+        if not response_datagram.is_ack():
+            return
+        self.endpoint.update_peer_window(response_datagram.header.window)
+        cumulative = response_datagram.get_ack_number() - 1
+        acked = {
+            seq for seq in range(self.base, cumulative) if seq in self.buffer
+        }
+        sack = None
+        if len(response_datagram.data) == SACK_SIZE:
+            sack = int.from_bytes(response_datagram.data, 'big') - 1
+            if sack in self.buffer:
+                acked.add(sack)
+        sample = None
+        for seq in acked:
+            logging.debug(f"ACK recibido: {seq + 1}")
+            # Las muestras de segmentos retransmitidos son ambiguas
+            if seq not in self.retransmitted:
+                sample = time() - self.sent_at[seq]
+                self.rtt_estimator.sample(sample)
+            self.buffer.pop(seq)
+            self.deadlines.pop(seq)
+            self.sent_at.pop(seq)
+            self.retransmitted.discard(seq)
+        self.congestion.on_ack(len(acked), sample)
+        self.endpoint.apply_congestion_window(self.congestion.window)
+        while self.base < self.next_seq and self.base not in self.buffer:
+            self.base += 1
+        if sack is not None:
+            self.detect_losses(sack)
+        self.update_deadline()
+
+    def detect_losses(self, sack: int):
+        # Los segmentos sin confirmar más de DUP_ACK_THRESHOLD por debajo
+        # del confirmado se perdieron: se reenvian una vez, y la ventana se
+        # reduce como ante ACKs duplicados, una vez por ráfaga
+        limit = sack - DUP_ACK_THRESHOLD
+        lost = [
+            seq for seq in range(max(self.base, self.sack_limit), limit)
+            if seq in self.buffer and seq not in self.retransmitted
+        ]
+        self.sack_limit = max(self.sack_limit, limit)
+        if not lost:
+            return
+        logging.debug(f"Huecos detectados por SACK: {len(lost)} paquetes")
+        if lost[0] >= self.recover:
+            self.congestion.on_loss()
+            self.endpoint.apply_congestion_window(self.congestion.window)
+            self.recover = self.next_seq
+        now = time()
+        for seq in lost:
+            self.retransmit(seq, now)
+
+
+class SelectiveRepeatReceiver(Receiver):
+    # Los segmentos fuera de orden dentro de la ventana se escriben en su
+    # offset apenas llegan, y cada uno se confirma individualmente. El ACK
+    # acumulado avanza hasta el primer segmento que falta
+
+    def __init__(self, endpoint: Endpoint, *args):
+        super().__init__(endpoint, *args)
+        endpoint.increment_ack()
+        self.first_seq = endpoint.ack
+
+    def on_datagram(self, datagram: Datagram):
+        endpoint = self.endpoint
+        seq_num = datagram.get_sequence_number()
+        if not datagram.is_data():
+            endpoint.send_last_message()
+            return
+        if endpoint.ack <= seq_num < endpoint.ack + endpoint.receive_window:
+            logging.debug(f"Paquete recibido: Seq={seq_num}")
+            self.write_segment(seq_num - self.first_seq, datagram.data)
+            advance = self.first_seq + self.sink.contiguous - endpoint.ack
+            endpoint.increment_ack(advance)
+            endpoint.increment_seq(advance)
+            send_sack(endpoint, seq_num)
+        elif seq_num < endpoint.ack:
+            logging.debug(f"Paquete duplicado: Seq={seq_num}")
+            send_sack(endpoint, seq_num)
+        else:
+            logging.debug(f"Paquete fuera de la ventana: Seq={seq_num}")
+
+    def on_linger(self, datagram: Datagram) -> bool:
+        if datagram.is_data():
+            send_sack(self.endpoint, datagram.get_sequence_number())
+            return False
+        return super().on_linger(datagram)
+
+
+def send_sack(endpoint: Endpoint, seq_num: int):
+    # El ACK lleva el numero acumulado y, en el payload, el segmento que
+    # lo genero
+    endpoint.send_ack(
+        endpoint.seq, endpoint.advertised_window,
+        seq_num.to_bytes(SACK_SIZE, 'big')
+    )
+    logging.debug(f"ACK enviado: {seq_num}, acumulado: {endpoint.ack}")
@@ -1,28 +1,42 @@
-from queue import Queue
+from typing import Optional
+import struct
 from queue import Empty
 from time import time
 from socket import socket
 from threading import Thread
 from .Datagram import Datagram
 from .Flags import Flags
-from .Util import read_file
-from .Messages.UploadSYN import UploadSYN
+from .Util import open_file, open_sink
+from .Messages.UploadSYN import UploadSYN, MAX_FILE_SIZE
 from .Messages.UploadACK import UploadACK
 from .Messages.DownloadSYN import DownloadSYN
 from .Messages.DownloadACK import DownloadACK
-from .Header import Header, HEADER_SIZE
+from .Header import Header, HEADER_SIZE, NO_CONNECTION, connection_id
 from .RecoveryProtocol import RecoveryProtocol
+from .RTTEstimator import MAX_RTO
 from .Endpoint import Endpoint
+from .FileSource import FileSource
+from .Checkpoint import Checkpoint
+from .TimerWheel import TimerWheel
+from .Sessions import Session, SessionTable
+from .IngressQueue import IngressQueue
+from .Admission import Admission, COOKIE_SIZE, MAX_SESSIONS
+from .Scheduler import EgressScheduler, DEFAULT_WEIGHT
+from .BatchIO import BatchReceiver, set_socket_buffers
+from .MSS import MAX_MSS, local_mss, negotiate_mss
+from .FEC import negotiate_fec
+from .Compression import negotiate_compression
+from .Streams import SINGLE_STREAM, stream_range
+from .FileSink import SegmentSink
+from .Batch import BatchSink, MAX_MANIFEST_SIZE
 from pathlib import Path
 import logging
-CONNECTION_TIMEOUT = 5
 
-# 25MB
-MAX_FILE_SIZE = 26214400
-MSS = 1024
 INITIAL_RTT = 1
+# Reenvios con backoff del ACK de download antes de abandonar la sesión
+DOWNLOAD_ACK_RETRIES = 5
+# Ventana inicial, luego la ajusta el control de congestion
 WINDOW_SIZE = 4
-TIMEOUT_COEFFICIENT = 4
 
 
 class Server:
@@ -31,136 +45,224 @@ class Server:
         recovery_protocol: RecoveryProtocol,
         address: tuple[str, int],
         storage_path: str,
-        socket: socket
+        socket: socket,
+        mss: Optional[int] = None,
+        max_sessions: int = MAX_SESSIONS,
+        rate_limit: Optional[float] = None,
+        server_rate_limit: Optional[float] = None,
+        weights: Optional[dict[str, float]] = None
     ):
         self.rp = recovery_protocol
         self.address = address
         self.storage_path = storage_path
         self.socket = socket
-        self.queues: dict[tuple[str, int], Queue] = {}
-        self.endpoints: dict[tuple[str, int], Endpoint] = {}
+        set_socket_buffers(socket)
+        # MSS configurado, si es None se usa el MTU del camino a cada cliente
+        self.mss = mss
+        # Una sola rueda de timers para todas las transferencias
+        self.timers = TimerWheel()
+        self.admission = Admission(max_sessions)
+        # Sesiones por ID de conexión. Las que terminaron responden sus
+        # retransmisiones sin thread hasta vencer
+        self.sessions = SessionTable(self.timers, self.admission, self.reply)
+        # Datagramas descartados por colas llenas, de todos los clientes
+        self.dropped = 0
+        # Limite de envio de cada transferencia. Con un limite para todas
+        # juntas o pesos por cliente, la salida pasa por el planificador
+        self.rate_limit = rate_limit
+        self.weights = weights or {}
+        self.scheduler = None
+        if server_rate_limit is not None or self.weights:
+            self.scheduler = EgressScheduler(socket, server_rate_limit)
     # Este metodo recibe los mensajes de clientes
     # Si el cliente es nuevo, se genera un thread para que maneje
     # sus mensajes entrantes
     # Cliente nuevo o no, el mensaje se encolará para luego ser manejado
     # por el thread correspondiente
 
-    def setup_new_client(self, client_addr: tuple[str, int]):
-        logging.info(f"Configurando nuevo cliente: {client_addr}")
+    def setup_new_client(self, session: Session):
+        logging.info(f"Configurando nuevo cliente: {session.address}")
         thread = Thread(
             target=self.handle_client,
-            args=(client_addr,),
+            args=(session,),
             daemon=True
         )
-        self.queues[client_addr] = Queue(-1)
-        self.endpoints[client_addr] = Endpoint(
-            WINDOW_SIZE, MSS, self.socket, client_addr
-        )
+        session.queue = IngressQueue()
+        session.endpoint = self.session_endpoint(session, self.socket)
         thread.start()
 
+    def session_endpoint(self, session: Session, socket) -> Endpoint:
+        endpoint = Endpoint(
+            WINDOW_SIZE, local_mss(session.address, self.mss), socket,
+            session.address, timers=self.timers, ingress=session.queue
+        )
+        endpoint.connection_id = session.id
+        endpoint.rate_limit = self.rate_limit
+        if self.scheduler is not None:
+            host, _ = session.address
+            endpoint.egress = self.scheduler.flow(
+                endpoint, self.weights.get(host, DEFAULT_WEIGHT))
+        return endpoint
+
     def start(self):
         logging.info(
             "Servidor iniciado con éxito, esperando mensajes de cliente")
+        receiver = BatchReceiver(
+            self.socket, (self.mss or MAX_MSS) + HEADER_SIZE)
         try:
             while True:
-                data, client_addr = self.socket.recvfrom(MSS + HEADER_SIZE)
-                if client_addr not in self.queues:
-                    logging.info(f"Nueva conexión recibida: {client_addr}")
-                    self.setup_new_client(client_addr)
-                self.queues[client_addr].put(data)
+                for data, client_addr in receiver.receive():
+                    session = self.sessions.route(data, client_addr)
+                    if session is None:
+                        session = self.admit(data, client_addr)
+                        if session is None:
+                            continue
+                        logging.info(
+                            f"Nueva conexión recibida: {client_addr}")
+                        self.setup_new_client(session)
+                    session.deliver(data)
         except KeyboardInterrupt:
             logging.info("Servidor detenido manualmente")
 
-    def handle_client(self, client_addr: tuple[str, int]):
-        logging.info(f"Cliente conectado: {client_addr}")
-        queue = self.queues[client_addr]
-        data = queue.get()
+    def admit(
+        self, data: bytes, client_addr: tuple[str, int]
+    ) -> Optional[Session]:
+        # Solo un SYN con una cookie valida crea una sesión para el
+        # cliente, todo lo demás se responde o descarta sin guardar nada.
+        # Un datagrama con ID no es un SYN, ya lo ruteó la tabla de sesiones
+        if len(data) < HEADER_SIZE or connection_id(data) != NO_CONNECTION:
+            return None
+        if not self.admission.allow(client_addr[0]):
+            return None
+        try:
+            datagram = Datagram.from_bytes(data)
+            payload = datagram.analyze()
+        except (struct.error, ValueError, IndexError):
+            return None
+        if not isinstance(payload, (UploadSYN, DownloadSYN)):
+            return None
+        ack = datagram.get_sequence_number()
+        if not self.admission.valid(client_addr, payload.cookie):
+            header = Header(COOKIE_SIZE, 0, ack, Flags.COOKIE)
+            cookie = self.admission.cookie(client_addr)
+            self.reply(Datagram(header, cookie).to_bytes(), client_addr)
+            return None
+        session = None
+        if self.sessions.active < self.admission.max_sessions:
+            session = self.sessions.open(
+                client_addr, data, bytes(payload.cookie))
+        if session is None:
+            logging.warning(
+                f"Conexión rechazada de {client_addr}: limite de sesiones "
+                f"alcanzado")
+            error = Datagram.make_error_datagram(
+                0, ack, str.encode("El servidor está ocupado"))
+            self.reply(error.to_bytes(), client_addr)
+        return session
+
+    def reply(self, data: bytes, client_addr: tuple[str, int]):
+        self.socket.sendto(data, client_addr)
+
+    def handle_client(self, session: Session):
+        logging.info(f"Cliente conectado: {session.address}")
+        data = session.queue.get()
         datagram = Datagram.from_bytes(data)
         payload = datagram.analyze()
 
-        match payload:
-            case UploadSYN():
-                self.handle_upload_syn(
-                    datagram, payload, client_addr)
-            case DownloadSYN():
-                self.handle_download_syn(
-                    datagram, payload, client_addr)
-
-        self.cleanup(client_addr)
+        try:
+            match payload:
+                case UploadSYN():
+                    self.handle_upload_syn(datagram, payload, session)
+                case DownloadSYN():
+                    self.handle_download_syn(datagram, payload, session)
+        finally:
+            self.cleanup(session)
 
     def handle_upload_syn(
         self,
         client_datagram: Datagram,
         client_payload: UploadSYN,
-        client_address: str
+        session: Session
     ):
-        logging.info(f"Recibido SYN para upload de {client_address}")
+        logging.info(f"Recibido SYN para upload de {session.address}")
         ack = client_datagram.get_sequence_number()
         error = self.validate_upload_syn(client_payload)
-        endp = self.endpoints[client_address]
-        queue = self.queues[client_address]
+        endp = session.endpoint
         if error is not None:
             logging.error(f"Error en SYN de upload: {error.decode()}")
-            send_error_response(error, ack, endp, queue)
+            self.send_error_response(error, ack, session)
             return
 
-        payload = UploadACK(MSS).to_bytes()
+        endp.update_mss(negotiate_mss(client_payload.mss, endp.mss))
+        endp.fec = negotiate_fec(client_payload.fec, self.rp.SUPPORTS_FEC)
+        endp.compression = negotiate_compression(
+            client_payload.compression, self.rp.SUPPORTS_COMPRESSION)
+        checkpoint = self.upload_checkpoint(client_payload)
+        offset = upload_offset(client_payload, checkpoint)
+        ack = self.upload_ack(endp, ack, offset)
+        endp.update_last_msg(ack)
+
+        endp.send_message(ack)
+        logging.info(f"ACK enviado para upload de {session.address}")
+
+        self.handle_upload(client_payload, session, checkpoint, offset)
+
+    def upload_checkpoint(self, client_payload: UploadSYN) -> Checkpoint:
+        file_path = str(Path(self.storage_path) / client_payload.filename)
+        return Checkpoint(
+            file_path, client_payload.identity, client_payload.stream)
+
+    def upload_ack(
+        self, endp: Endpoint, ack_number: int, offset: int
+    ) -> bytes:
+        payload = UploadACK(
+            endp.mss, offset, endp.fec, endp.compression).to_bytes()
 
         header = Header(
             payload_size=len(payload),
             sequence_number=endp.seq,
-            acknowledgment_number=ack,
-            flags=Flags.ACK_UPLOAD
+            acknowledgment_number=ack_number,
+            flags=Flags.ACK_UPLOAD,
+            connection_id=endp.connection_id
         )
-        ack = Datagram(
+        return Datagram(
             header,
             payload
         ).to_bytes()
-        endp.update_last_msg(ack)
-
-        endp.send_message(ack)
-        logging.info(f"ACK enviado para upload de {client_address}")
-
-        self.handle_upload(
-            client_payload.filename,
-            client_payload.file_size,
-            client_address
-        )
 
     def handle_upload(
         self,
-        filename: str,
-        file_size: int,
-        client_address: str
+        client_payload: UploadSYN,
+        session: Session,
+        checkpoint: Checkpoint,
+        offset: int
     ):
+        filename = client_payload.filename
         logging.info(
-            f"Iniciando recepción de archivo '{filename}' de {client_address}")
-        endp = self.endpoints[client_address]
-        file_path = str(Path(self.storage_path) / filename)
+            f"Iniciando recepción de archivo '{filename}' de "
+            f"{session.address}")
+        endp = session.endpoint
         try:
-            with open(file_path, "wb") as file:
-                self.rp.receive(
-                    endp,
-                    file,
-                    self.queues[client_address],
-                    file_size
-                )
-                logging.info(
-                    f"Archivo '{filename}' recibido correctamente de "
-                    f"{client_address}"
-                )
+            sink = upload_sink(client_payload, endp.mss, checkpoint, offset)
+            receiver = self.rp.receive(endp, sink, session.queue)
+            self.sessions.linger(session, receiver.on_linger)
+            logging.info(
+                f"Archivo '{filename}' recibido correctamente de "
+                f"{session.address}"
+            )
         except Exception as e:
+            # El archivo parcial y su checkpoint quedan para reanudar
             logging.error(
                 f"Error durante la recepción del archivo '{filename}': {e}")
-            Path(file_path).unlink(missing_ok=True)
 
     def validate_upload_syn(self, client_payload: UploadSYN):
         error = self.validate_syn(client_payload)
 
-        if client_payload.file_size > MAX_FILE_SIZE:
-            error = str.encode(
-                "El archivo es demasiado grande para ser subido"
-            )
+        manifest_size = client_payload.manifest_size
+        if manifest_size > min(client_payload.file_size, MAX_MANIFEST_SIZE):
+            error = str.encode("Manifiesto del lote inválido")
+        elif manifest_size and client_payload.stream != SINGLE_STREAM:
+            error = str.encode("Un lote de archivos no admite varios streams")
 
         return error
 
@@ -168,10 +270,18 @@ class Server:
         error = self.validate_syn(client_payload)
         filepath = Path(self.storage_path) / client_payload.filename
 
-        if not filepath.is_file():
+        if filepath.is_dir():
+            if client_payload.stream != SINGLE_STREAM:
+                error = str.encode(
+                    "Un lote de archivos no admite varios streams")
+        elif not filepath.is_file():
             error = str.encode(
                 "El archivo no existe en el servidor"
             )
+        elif filepath.stat().st_size > MAX_FILE_SIZE:
+            error = str.encode(
+                "El archivo es demasiado grande para ser descargado"
+            )
         return error, str(filepath)
 
     def validate_syn(self, client_payload):
@@ -181,102 +291,174 @@ class Server:
                 "El método de recuperación entre cliente y servidor "
                 "no es consistente"
             )
+        index, count = client_payload.stream
+        if not 0 <= index < count:
+            return str.encode("Stream inválido")
         return None
 
     def handle_download_syn(
         self,
         client_datagram: Datagram,
         client_payload: DownloadSYN,
-        client_addr: tuple[str, int]
+        session: Session
     ):
-        logging.info(f"Recibido SYN para download de {client_addr}")
-        endp = self.endpoints[client_addr]
+        logging.info(f"Recibido SYN para download de {session.address}")
+        endp = session.endpoint
         ack = client_datagram.get_sequence_number()
         error, filepath = self.validate_download_syn(client_payload)
 
-        queue = self.queues[client_addr]
         if error is not None:
             logging.error(f"Error en SYN de download: {error.decode()}")
-            send_error_response(error, ack, endp, queue)
+            self.send_error_response(error, ack, session)
             return
-        logging.info(f"SYN válido para download de {client_addr}")
-        file_data, rtt = self.send_download_ack(
-            client_datagram.get_sequence_number(),
-            filepath,
-            endp,
-            client_addr
-        )
-        self.rp.send(
-            endp,
-            file_data,
-            queue,
-            client_payload.mss,
-            Flags.DOWNLOAD,
-            rtt * TIMEOUT_COEFFICIENT
-        )
-        logging.info(f"Archivo enviado a {client_addr}")
+        logging.info(f"SYN válido para download de {session.address}")
+        endp.update_mss(negotiate_mss(client_payload.mss, endp.mss))
+        endp.fec = negotiate_fec(client_payload.fec, self.rp.SUPPORTS_FEC)
+        endp.compression = negotiate_compression(
+            client_payload.compression, self.rp.SUPPORTS_COMPRESSION)
+        source = open_file(filepath, mapped=True)
+        if source is None:
+            self.send_error_response(
+                str.encode("El archivo no existe en el servidor"),
+                ack, session
+            )
+            return
+        with source:
+            select_range(client_payload, source)
+            try:
+                rtt = self.send_download_ack(
+                    client_datagram.get_sequence_number(),
+                    source,
+                    session
+                )
+                self.rp.send(
+                    endp,
+                    source,
+                    session.queue,
+                    endp.mss,
+                    Flags.DOWNLOAD,
+                    rtt
+                )
+            except ConnectionAbortedError as e:
+                logging.error(
+                    f"El cliente {session.address} abortó el download: {e}")
+                return
+            except TimeoutError as e:
+                logging.error(f"Download a {session.address} abandonado: {e}")
+                return
+        logging.info(f"Archivo enviado a {session.address}")
 
     def send_download_ack(
         self,
         ack_number: int,
-        filepath: str,
-        endpoint: Endpoint,
-        client_addr: tuple[str, int]
+        source: FileSource,
+        session: Session
     ):
-        logging.info(f"Enviando ACK de download a {client_addr}")
-        file_data = read_file(filepath)
-        payload = DownloadACK(len(file_data)).to_bytes()
-
-        header = Header(
-            sequence_number=endpoint.seq,
-            acknowledgment_number=ack_number,
-            flags=Flags.ACK_DOWNLOAD,
-            payload_size=len(payload),
-        )
-        datagram = Datagram(
-            header,
-            payload
-        ).to_bytes()
+        logging.info(f"Enviando ACK de download a {session.address}")
+        endpoint = session.endpoint
+        datagram = self.download_ack(endpoint, ack_number, source)
         endpoint.update_last_msg(datagram)
 
-        queue = self.queues[client_addr]
-        rtt = 0
+        queue = session.queue
+        timeout = INITIAL_RTT
+        retries = 0
         start = time()
         endpoint.send_message(datagram)
         while True:
             try:
-                data = queue.get(timeout=INITIAL_RTT)
-                end = time()
-                response = Datagram.from_bytes(data)
-                if response.is_ack():
-                    rtt = end - start
-                    break
+                data = queue.get(timeout=max(0, start + timeout - time()))
             except Empty:
+                if retries == DOWNLOAD_ACK_RETRIES:
+                    raise TimeoutError("El cliente no respondió el ACK")
+                retries += 1
+                timeout = min(2 * timeout, MAX_RTO)
                 logging.debug(
-                    f"Timeout esperando download ACK de {client_addr},"
+                    f"Timeout esperando download ACK de {session.address},"
                     f" reenviando")
                 start = time()
                 endpoint.send_message(datagram)
                 continue
+            if Datagram.from_bytes(data).is_ack():
+                rtt = time() - start
+                break
         logging.info(f"RTT inicial calculado: {rtt:.2f} segundos")
-        return file_data, rtt
-
-    def cleanup(self, client_addr: tuple[str, int]):
-        self.queues.pop(client_addr)
-        self.endpoints.pop(client_addr)
-        logging.info(f"Cliente {client_addr} desconectado")
-
-
-def send_error_response(
-    payload: bytes, ack: int, endp: Endpoint, queue: Queue
-):
-    flag = Flags.ERROR
-    header = Header(len(payload), endp.seq, ack, flag)
-    datagram = Datagram(header, payload).to_bytes()
-    endp.send_message(datagram)
-    while True:
-        try:
-            queue.get(timeout=CONNECTION_TIMEOUT)
-            endp.send_message(datagram)
-        except Empty:
-            return
+        return rtt
+
+    def download_ack(
+        self, endpoint: Endpoint, ack_number: int, source: FileSource
+    ) -> bytes:
+        size, mtime = source.identity
+        payload = DownloadACK(
+            size, endpoint.mss, source.start, mtime, source.manifest_size,
+            endpoint.fec, endpoint.compression
+        ).to_bytes()
+
+        header = Header(
+            sequence_number=endpoint.seq,
+            acknowledgment_number=ack_number,
+            flags=Flags.ACK_DOWNLOAD,
+            payload_size=len(payload),
+            connection_id=endpoint.connection_id
+        )
+        return Datagram(
+            header,
+            payload
+        ).to_bytes()
+
+    def send_error_response(self, payload: bytes, ack: int, session: Session):
+        endp = session.endpoint
+        datagram = Datagram.make_error_datagram(
+            endp.seq, ack, payload, endp.connection_id).to_bytes()
+        endp.send_message(datagram)
+        # Los SYN retransmitidos reciben el mismo error mientras la sesión
+        # está en TIME_WAIT
+        self.sessions.linger(session, lambda _: endp.send_message(datagram))
+
+    def cleanup(self, session: Session):
+        queue = session.queue
+        self.sessions.close(session)
+        # Las retransmisiones que quedaron encoladas ya no hacen falta
+        if session.endpoint.egress is not None:
+            session.endpoint.egress.clear()
+        if queue.dropped:
+            self.dropped += queue.dropped
+            logging.warning(
+                f"Se descartaron {queue.dropped} datagramas de "
+                f"{session.address} por cola llena ({self.dropped} en total)"
+            )
+        logging.info(f"Cliente {session.address} desconectado")
+
+
+def upload_offset(client_payload: UploadSYN, checkpoint: Checkpoint) -> int:
+    # Offset desde el que se recibe el rango del stream, el inicio del
+    # rango salvo que su checkpoint indique que ya hay más escrito. Los lotes
+    # no se reanudan
+    if client_payload.manifest_size:
+        return 0
+    start, end = stream_range(client_payload.file_size, client_payload.stream)
+    return min(max(checkpoint.load(), start), end)
+
+
+def upload_sink(
+    client_payload: UploadSYN, mss: int, checkpoint: Checkpoint, offset: int
+) -> SegmentSink:
+    if client_payload.manifest_size:
+        # Un lote se guarda en el directorio con el nombre pedido
+        return BatchSink(
+            checkpoint.filepath, client_payload.file_size, mss,
+            client_payload.manifest_size
+        )
+    return open_sink(
+        checkpoint.filepath, client_payload.file_size, mss, offset,
+        checkpoint, client_payload.stream
+    )
+
+
+def select_range(client_payload: DownloadSYN, source: FileSource):
+    # Limita la fuente al rango del stream. Solo se reanuda si el archivo no
+    # cambió desde la descarga parcial
+    start, end = stream_range(len(source), client_payload.stream)
+    if client_payload.identity == source.identity:
+        start = min(max(client_payload.offset, start), end)
+    source.skip(start)
+    source.limit(end - start)
@@ -0,0 +1,213 @@
+import os
+from threading import Lock
+from typing import Any, Callable, Optional
+from .Admission import Admission, COOKIE_SIZE
+from .Datagram import Datagram
+from .Flags import Flags
+from .Header import Header, NO_CONNECTION, HEADER_SIZE, connection_id
+from .TimerWheel import TimerWheel
+import logging
+
+# Tiempo que se siguen respondiendo las retransmisiones de una conexión
+# terminada, cubre varios RTO del otro extremo
+TIME_WAIT = 5
+# El ID de conexión es el indice de un slot de la tabla y, en los bits
+# altos, su generación, aleatoria en cada uso del slot. Una generación
+# nunca es 0, asi ningun ID lo es. Son solo 16 bits al azar: el ID
+# identifica a la sesión pero no autentica al cliente
+SLOT_BITS = 16
+MAX_SLOTS = 1 << SLOT_BITS
+MAX_GENERATION = (1 << (32 - SLOT_BITS)) - 1
+
+
+class Session:
+    __slots__ = (
+        'id', 'address', 'origin', 'syn', 'secret', 'queue', 'endpoint',
+        'respond'
+    )
+
+    def __init__(
+        self, session_id: int, address: tuple[str, int], syn, secret: bytes
+    ):
+        self.id = session_id
+        # Dirección actual del cliente, cambia si el NAT lo reasigna y el
+        # cliente prueba que recibe en la nueva y que conoce secret
+        self.address = address
+        self.origin = address
+        # SYN que abrió la sesión, sus retransmisiones llegan sin ID
+        self.syn = bytes(syn)
+        # Cookie con la que el cliente abrió la sesión, nunca viaja de nuevo
+        self.secret = secret
+        self.queue = None
+        self.endpoint = None
+        # Mientras la sesión está en TIME_WAIT, responde sus datagramas
+        self.respond: Optional[Callable[[Datagram], Any]] = None
+
+    def deliver(self, data: bytes):
+        respond = self.respond
+        if respond is None:
+            self.queue.offer(data)
+        else:
+            respond(Datagram.from_bytes(data))
+
+
+class SessionTable:
+    """
+    Sesiones del servidor indexadas por el ID de conexión que viaja en el
+    header de cada datagrama.
+
+    Los IDs son la posición en una lista de slots más una generación
+    aleatoria que cambia cada vez que el slot se reutiliza, por lo que
+    rutear un datagrama es indexar la lista sin hashear la dirección, y un
+    datagrama atrasado de una sesión anterior no llega a la nueva. Solo el
+    SYN, que viaja antes de que el cliente conozca su ID, se busca por
+    dirección.
+
+    Como la dirección no identifica a la sesión, esta sobrevive a un cambio
+    de dirección del cliente. Pero un ID se puede adivinar, así que un
+    datagrama desde otra dirección no se entrega: se le responde una cookie
+    de Admission con el ID de la sesión, y la sesión migra solo cuando
+    desde esa dirección vuelve la cookie junto con su HMAC con la cookie
+    del handshake. Eso prueba que quien responde recibe en la nueva
+    dirección y es el cliente que abrió la sesión.
+
+    Las sesiones terminadas quedan en la tabla durante TIME_WAIT,
+    respondiendo las retransmisiones tardías del otro extremo, y un timer
+    de la rueda libera su slot al vencer.
+    """
+
+    def __init__(
+        self,
+        timers: TimerWheel,
+        admission: Admission,
+        reply: Callable[[bytes, tuple[str, int]], Any],
+        linger: float = TIME_WAIT
+    ):
+        self.timers = timers
+        self.admission = admission
+        # Envía un datagrama a una dirección, para las cookies de migración
+        self.reply = reply
+        self.linger_time = linger
+        self.slots: list[Optional[Session]] = []
+        self.generations: list[int] = []
+        self.free: list[int] = []
+        # Sesiones por dirección de origen, para las retransmisiones del SYN
+        self.handshakes: dict[tuple[str, int], Session] = {}
+        # Sesiones que no están en TIME_WAIT
+        self.active = 0
+        # Los slots se liberan desde el thread de la rueda de timers
+        self.lock = Lock()
+
+    def open(
+        self, address: tuple[str, int], syn: bytes, secret: bytes
+    ) -> Optional[Session]:
+        # Devuelve None si no quedan slots libres
+        with self.lock:
+            if self.free:
+                index = self.free.pop()
+                # Distinta de la anterior, que puede tener datagramas atrasados
+                generation = random_generation()
+                while generation == self.generations[index]:
+                    generation = random_generation()
+                self.generations[index] = generation
+            elif len(self.slots) < MAX_SLOTS:
+                index = len(self.slots)
+                generation = random_generation()
+                self.slots.append(None)
+                self.generations.append(generation)
+            else:
+                return None
+            session = Session(
+                (generation << SLOT_BITS) | index, address, syn, secret)
+            self.slots[index] = session
+            self.handshakes[address] = session
+            self.active += 1
+        return session
+
+    def get(self, session_id: int) -> Optional[Session]:
+        index = session_id & (MAX_SLOTS - 1)
+        if index >= len(self.slots):
+            return None
+        session = self.slots[index]
+        if session is None or session.id != session_id:
+            return None
+        return session
+
+    def route(
+        self, data: bytes, address: tuple[str, int]
+    ) -> Optional[Session]:
+        # Sesión a la que pertenece un datagrama, None si no tiene una
+        if len(data) < HEADER_SIZE:
+            return None
+        session_id = connection_id(data)
+        if session_id == NO_CONNECTION:
+            session = self.handshakes.get(address)
+            if session is None or session.syn != data:
+                return None
+            return session
+        session = self.get(session_id)
+        if session is not None and session.address != address:
+            self.validate(session, data, address)
+            return None
+        return session
+
+    def validate(
+        self, session: Session, data: bytes, address: tuple[str, int]
+    ):
+        # Un datagrama de la sesión desde otra dirección: si responde la
+        # cookie de esa dirección la sesión migra, si no se le envía una
+        datagram = Datagram.from_bytes(data)
+        if datagram.is_cookie():
+            if self.admission.proves(
+                    address, session.secret, bytes(datagram.data)):
+                self.migrate(session, address)
+            return
+        if not self.admission.allow(address[0]):
+            return
+        header = Header(
+            COOKIE_SIZE, 0, 0, Flags.COOKIE, connection_id=session.id)
+        cookie = self.admission.cookie(address)
+        self.reply(Datagram(header, cookie).to_bytes(), address)
+
+    def migrate(self, session: Session, address: tuple[str, int]):
+        logging.info(
+            f"Sesión {session.id:#x} cambió de dirección: {session.address}"
+            f" -> {address}"
+        )
+        session.address = address
+        if session.endpoint is not None:
+            session.endpoint.remote_addr = address
+
+    def linger(
+        self, session: Session, respond: Callable[[Datagram], Any]
+    ):
+        # Deja la sesión en TIME_WAIT respondiendo con respond
+        with self.lock:
+            if session.respond is None:
+                self.active -= 1
+            session.respond = respond
+        self.timers.schedule(
+            self.linger_time, lambda _: self.release(session))
+
+    def close(self, session: Session):
+        # Libera la sesión, salvo que esté en TIME_WAIT: se libera al vencer
+        if session.respond is None:
+            self.release(session)
+
+    def release(self, session: Session):
+        with self.lock:
+            index = session.id & (MAX_SLOTS - 1)
+            if self.slots[index] is not session:
+                return
+            self.slots[index] = None
+            self.free.append(index)
+            if self.handshakes.get(session.origin) is session:
+                del self.handshakes[session.origin]
+            if session.respond is None:
+                self.active -= 1
+
+
+def random_generation() -> int:
+    # La generación no se deduce de la anterior del slot ni se repite
+    # entre reinicios del servidor, pero se puede adivinar
+    return int.from_bytes(os.urandom(2), 'big') % MAX_GENERATION + 1
@@ -1,145 +1,145 @@
-from io import BufferedWriter
 from time import time
-from queue import Empty
-from queue import Queue
-from .Header import Header
-from .Flags import Flags
+from typing import Optional
+from .Header import Header, HEADER_SIZE
 from .Datagram import Datagram
-from .RecoveryProtocol import RecoveryProtocol
+from .RecoveryProtocol import RecoveryProtocol, Sender, Receiver
 from .Endpoint import Endpoint
 from .ProtocolID import ProtocolID
-from .Server import CONNECTION_TIMEOUT
+from .FileSource import FileSource
+from .FileSink import SegmentSink
 import logging
 
 
 class StopAndWait(RecoveryProtocol):
     PROTOCOL_ID = ProtocolID.STOP_AND_WAIT
 
-    def send(
+    def sender(
         self,
         endpoint: Endpoint,
-        file_data: bytes,
-        queue: Queue,
+        source: FileSource,
         receiver_mss: int,
-        flag: Flags,
-        rtt: float
-    ):
-        # Caso favorable: Manda un data segment, le llega un ACK de este data
-        # segment
-
-        # Casos desfavorables:
-        # 1. Manda un data segment, pero el servidor no lo recibe
-        # 2. Manda un data segment, pero no llega el ACK de este
-        # 3. Manda un data segment, pero el servidor tarda en procesarlo y
-        # cuando le llega el ACK al cliente, este ya habia enviado otra vez
-        # el segmento por timeout, por lo que el servidor lo recibe y manda
-        # un ACK pero ignora el duplicado. El cliente tambien ignora el
-        # duplicado del ACK
+        flag: int,
+        rtt: Optional[float]
+    ) -> 'StopAndWaitSender':
+        return StopAndWaitSender(
+            endpoint, source, receiver_mss, flag, rtt,
+            self.congestion_control
+        )
 
+    def receiver(
+        self, endpoint: Endpoint, sink: SegmentSink
+    ) -> 'StopAndWaitReceiver':
+        return StopAndWaitReceiver(endpoint, sink)
+
+
+class StopAndWaitSender(Sender):
+    # Caso favorable: Manda un data segment, le llega un ACK de este data
+    # segment
+
+    # Casos desfavorables:
+    # 1. Manda un data segment, pero el servidor no lo recibe
+    # 2. Manda un data segment, pero no llega el ACK de este
+    # 3. Manda un data segment, pero el servidor tarda en procesarlo y
+    # cuando le llega el ACK al cliente, este ya habia enviado otra vez
+    # el segmento por timeout, por lo que el servidor lo recibe y manda
+    # un ACK pero ignora el duplicado. El cliente tambien ignora el
+    # duplicado del ACK
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.offset = 0
+        self.datagram = None
+        self.transmissions = 0
+        self.start = 0
         logging.info("Iniciando envío de archivo con Stop-and-Wait")
-        for i in range(0, len(file_data), receiver_mss):
-            data = file_data[i:i + receiver_mss]
-            endpoint.increment_seq()
 
-            header = Header(
-                len(data),
-                endpoint.seq,
-                endpoint.ack,
-                flag
-            )
-
-            datagram = Datagram(header, data).to_bytes()
-
-            while True:
-                try:
-                    start = time()
-                    endpoint.send_message(datagram)
-                    logging.debug(
-                        f"Paquete enviado: Seq={header.sequence_number}")
-                    response_data = queue.get(timeout=rtt)
-                    rtt = (rtt + (time() - start)) / 2
-                    logging.debug(f"RTT actualizado: {rtt:.2f} segundos")
-                    response_datagram = Datagram.from_bytes(response_data)
-
-                    logging.debug(
-                        f"Flags recibidos: {response_datagram.header.flags}")
-
-                    if response_datagram.is_ack():
-                        if response_datagram.get_ack_number() == endpoint.seq:
-                            logging.debug(f"ACK recibido: {endpoint.seq}")
-                            endpoint.increment_ack()
-                            endpoint.update_last_msg(datagram)
-                            break
-                        if response_datagram.get_ack_number() < endpoint.seq:
-                            ack_number = response_datagram.get_ack_number()
-                            logging.debug(
-                                f"ACK duplicado recibido: {ack_number}")
-                            continue
-                    else:
-                        logging.warning(
-                            "ACK inválido, retransmitiendo último mensaje")
-                        endpoint.send_last_message()
-                        continue
-
-                except Empty:
-                    logging.debug("Timeout esperando ACK, retransmitiendo")
-                    rtt = rtt * 2
-                    continue
-
-                except Exception as e:
-                    logging.error(f"Error al recibir ACK: {e}")
-                    raise
-
-    def receive(
-        self,
-        endpoint: Endpoint,
-        file: BufferedWriter,
-        queue: Queue,
-        file_size: int,
-    ):
+    @property
+    def done(self) -> bool:
+        return self.datagram is None and self.offset >= len(self.source)
+
+    def send_window(self):
+        if self.datagram is not None or self.offset >= len(self.source):
+            return
+        # Sin ventana solo frena el limite de tasa configurado
+        self.paced = self.pacer.allowance() <= 0
+        if self.paced:
+            return
+        data = self.source.read(self.offset, self.receiver_mss)
+        self.endpoint.increment_seq()
+        header = Header(
+            len(data),
+            self.endpoint.seq,
+            self.endpoint.ack,
+            self.flag,
+            connection_id=self.endpoint.connection_id
+        )
+        self.datagram = Datagram(header, data)
+        self.transmissions = 0
+        self.transmit()
+
+    def transmit(self):
+        self.start = time()
+        self.endpoint.send_datagram(self.datagram)
+        self.pacer.consume(HEADER_SIZE + self.datagram.get_payload_size())
+        self.transmissions += 1
+        self.restart_timer()
+        logging.debug(
+            f"Paquete enviado: Seq={self.datagram.get_sequence_number()}")
+
+    def on_datagram(self, response_datagram: Datagram):
+        endpoint = self.endpoint
+        logging.debug(f"Flags recibidos: {response_datagram.header.flags}")
+
+        if not response_datagram.is_ack():
+            logging.warning("ACK inválido, retransmitiendo último mensaje")
+            endpoint.send_last_message()
+            return
+        if response_datagram.get_ack_number() == endpoint.seq:
+            logging.debug(f"ACK recibido: {endpoint.seq}")
+            # Regla de Karn: no se mide el RTT de retransmisiones
+            if self.transmissions == 1:
+                self.rtt_estimator.sample(time() - self.start)
+            logging.debug(
+                f"RTO actualizado: {self.rtt_estimator.rto:.2f} segundos")
+            endpoint.increment_ack()
+            endpoint.update_last_msg(self.datagram)
+            self.offset += self.datagram.get_payload_size()
+            self.datagram = None
+            self.stop_timer()
+            return
+        # Un ACK duplicado es de un segmento anterior retransmitido, se
+        # ignora: reenviar por él duplicaría también el segmento actual y
+        # así cada uno de los siguientes (sorcerer's apprentice)
+        ack_number = response_datagram.get_ack_number()
+        logging.debug(f"ACK duplicado recibido: {ack_number}")
+
+    def on_timeout(self):
+        logging.debug("Timeout esperando ACK, retransmitiendo")
+        self.rtt_estimator.backoff()
+        self.transmit()
+
+
+class StopAndWaitReceiver(Receiver):
+    def __init__(self, *args):
+        super().__init__(*args)
         logging.info("Iniciando recepción de archivo con Stop-and-Wait")
-        bytes_written = 0
-        while bytes_written < file_size:
-            try:
-                data = queue.get()
-                datagram = Datagram.from_bytes(data)
-                logging.debug(
-                    f"Paquete recibido: Seq={datagram.get_sequence_number()},"
-                    f" Esperado={endpoint.ack + 1}")
-                logging.debug(f"Flags recibidos: {datagram.header.flags}")
-                received_payload = datagram.data
-
-                if datagram.get_sequence_number() - 1 == endpoint.ack:
-                    endpoint.increment_seq()
-                    file.write(received_payload)
-                    bytes_written += len(received_payload)
-                    endpoint.ack = datagram.get_sequence_number()
-
-                    ack_header = Header(
-                        payload_size=0,
-                        sequence_number=datagram.get_sequence_number(),
-                        acknowledgment_number=endpoint.ack,
-                        flags=Flags.ACK
-                    )
-                    ack = Datagram(ack_header, b'').to_bytes()
-                    endpoint.last_msg = ack
-                    endpoint.send_message(ack)
-                    logging.debug(f"ACK enviado: {endpoint.ack}")
-                else:
-                    seq_number = datagram.get_sequence_number()
-                    logging.debug(
-                        f"Paquete duplicado recibido: Seq={seq_number}")
-                    endpoint.send_last_message()
-            except Exception as e:
-                logging.error(f"Error en recepción: {e}")
-                raise
-        file.close()
-        logging.info(f"Archivo recibido correctamente: {bytes_written} bytes")
-        while True:
-            try:
-                data = queue.get(timeout=CONNECTION_TIMEOUT)
-                endpoint.send_last_message()
-                continue
-            except Empty:
-                logging.info("Conexión cerrada correctamente")
-                return
+
+    def on_datagram(self, datagram: Datagram):
+        endpoint = self.endpoint
+        logging.debug(
+            f"Paquete recibido: Seq={datagram.get_sequence_number()},"
+            f" Esperado={endpoint.ack + 1}")
+        logging.debug(f"Flags recibidos: {datagram.header.flags}")
+
+        if datagram.get_sequence_number() - 1 == endpoint.ack:
+            endpoint.increment_seq()
+            self.write(datagram.data)
+            endpoint.ack = datagram.get_sequence_number()
+
+            endpoint.last_msg = endpoint.send_ack(
+                datagram.get_sequence_number())
+            logging.debug(f"ACK enviado: {endpoint.ack}")
+        else:
+            seq_number = datagram.get_sequence_number()
+            logging.debug(f"Paquete duplicado recibido: Seq={seq_number}")
+            endpoint.send_last_message()
@@ -0,0 +1,59 @@
+import signal
+from multiprocessing import Process
+from typing import Callable
+
+# Un archivo se puede transferir en hasta MAX_STREAMS rangos en paralelo
+MAX_STREAMS = 255
+# Los limites entre rangos quedan alineados a los bloques de escritura
+STREAM_ALIGNMENT = 1024 * 1024
+# Transferencia de un solo rango con todo el archivo
+SINGLE_STREAM = (0, 1)
+
+
+def stream_range(size: int, stream: tuple[int, int]) -> tuple[int, int]:
+    """
+    Rango [inicio, fin) del archivo que transfiere el stream (indice,
+    cantidad). Ambos extremos lo calculan a partir del tamaño, así que
+    solo viaja el par en los SYN.
+    """
+    index, count = stream
+
+    def boundary(i: int) -> int:
+        if i >= count:
+            return size
+        return size * i // count // STREAM_ALIGNMENT * STREAM_ALIGNMENT
+
+    return boundary(index), boundary(index + 1)
+
+
+def run_streams(transfers: list[Callable[[], None]]):
+    # Con un solo stream se transfiere en este proceso. Si no, cada stream
+    # va en su propio proceso para no compartir el GIL
+    if len(transfers) == 1:
+        transfers[0]()
+        return
+    processes = [
+        Process(target=run_stream, args=(transfer,)) for transfer in transfers
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Cada stream se interrumpe y guarda su checkpoint
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+
+
+def run_stream(transfer: Callable[[], None]):
+    # Ctrl-C lo atiende el proceso principal, que interrumpe a cada stream
+    # una sola vez con SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        transfer()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,89 @@
+from math import ceil
+from threading import Condition, Thread
+from time import monotonic, sleep
+from typing import Callable, Optional
+
+# Resolucion de los timers en segundos
+TICK = 0.005
+SLOTS = 512
+
+
+class Timer:
+    __slots__ = ('callback', 'slot', 'rounds')
+
+    def __init__(self, callback: Callable[['Timer'], None]):
+        self.callback = callback
+        self.slot = 0
+        self.rounds = 0
+
+
+class TimerWheel:
+    """
+    Hashed timing wheel atendida por un unico thread.
+
+    Armar y cancelar un timer son O(1): cada timer se guarda en el slot
+    donde vence y lleva la cantidad de vueltas que le faltan. Los callbacks
+    se ejecutan en el thread de la rueda, por lo que deben ser breves.
+    """
+
+    def __init__(self, tick: float = TICK, slots: int = SLOTS):
+        self.tick = tick
+        self.slots: list[set[Timer]] = [set() for _ in range(slots)]
+        self.current = 0
+        self.armed = 0
+        self.condition = Condition()
+        self.thread: Optional[Thread] = None
+
+    def schedule(
+        self, delay: float, callback: Callable[[Timer], None]
+    ) -> Timer:
+        timer = Timer(callback)
+        ticks = max(1, ceil(delay / self.tick))
+        with self.condition:
+            timer.slot = (self.current + ticks) % len(self.slots)
+            timer.rounds = (ticks - 1) // len(self.slots)
+            self.slots[timer.slot].add(timer)
+            self.armed += 1
+            if self.thread is None:
+                self.thread = Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return timer
+
+    def cancel(self, timer: Optional[Timer]):
+        if timer is None:
+            return
+        with self.condition:
+            slot = self.slots[timer.slot]
+            if timer in slot:
+                slot.remove(timer)
+                self.armed -= 1
+
+    def run(self):
+        next_tick = monotonic() + self.tick
+        while True:
+            with self.condition:
+                while self.armed == 0:
+                    self.condition.wait()
+                    next_tick = monotonic() + self.tick
+            delay = next_tick - monotonic()
+            if delay > 0:
+                sleep(delay)
+            next_tick += self.tick
+            for timer in self.advance():
+                timer.callback(timer)
+
+    def advance(self) -> list[Timer]:
+        with self.condition:
+            self.current = (self.current + 1) % len(self.slots)
+            slot = self.slots[self.current]
+            expired = [timer for timer in slot if timer.rounds == 0]
+            for timer in slot:
+                timer.rounds -= 1
+            slot.difference_update(expired)
+            self.armed -= len(expired)
+        return expired
+
+
+# Rueda compartida por los endpoints que no reciben una propia
+DEFAULT_TIMER_WHEEL = TimerWheel()
@@ -1,11 +1,46 @@
+import os
+from typing import Optional
+from .FileSource import FileSource, MappedFileSource
+from .FileSink import SegmentSink
+from .Checkpoint import Checkpoint
+from .Streams import SINGLE_STREAM, stream_range
+from .Batch import BatchSource, Manifest
 import logging
 
 
-def read_file(filepath: str) -> bytes:
+def open_file(
+    filepath: str, mapped: bool = False
+) -> Optional[FileSource]:
+    # Un directorio se envía entero como un lote de archivos
+    if os.path.isdir(filepath):
+        manifest = Manifest.scan(filepath)
+        logging.info(
+            f"Lote de {len(manifest.entries)} archivos en {filepath}")
+        return BatchSource(filepath, manifest)
     try:
-        with open(filepath, "rb") as file:
-            file_data = file.read()
-            return file_data
+        file = open(filepath, "rb")
+        if mapped:
+            return MappedFileSource(file)
+        return FileSource(file)
     except FileNotFoundError:
         logging.error(f"Archivo no encontrado: {filepath}")
         return
+
+
+def open_sink(
+    filepath: str,
+    size: int,
+    mss: int,
+    offset: int,
+    checkpoint: Checkpoint,
+    stream: tuple[int, int] = SINGLE_STREAM
+) -> SegmentSink:
+    # El archivo no se trunca: al reanudar se conserva lo que ya estaba
+    # escrito y los streams de un mismo archivo escriben cada uno su rango
+    fd = os.open(filepath, os.O_RDWR | os.O_CREAT, 0o666)
+    file = os.fdopen(fd, "r+b")
+    os.ftruncate(fd, size)
+    start, end = stream_range(size, stream)
+    if offset > start:
+        logging.info(f"Reanudando {filepath} desde el byte {offset}")
+    return SegmentSink(file, size, mss, offset, checkpoint, end)
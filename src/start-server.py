@@ -1,9 +1,17 @@
 import argparse
 import socket
 import logging
+from multiprocessing import Process
 from lib.logger import setup_logger
+from lib.CongestionControl import CONGESTION_CONTROLS
+from lib.MSS import MAX_MSS
+from lib.Admission import MAX_SESSIONS
+from lib.Pacer import parse_rate
+from lib.Scheduler import parse_weight
 from lib.Server import Server
+from lib.AsyncServer import AsyncServer
 from lib.GoBackN import GoBackN
+from lib.SelectiveRepeat import SelectiveRepeat
 from lib.StopAndWait import StopAndWait
 
 
@@ -35,25 +43,121 @@ def main():
         type=str,
         help='error recovery protocol',
         required=True,
-        choices=['GBN', 'SW'],
+        choices=['GBN', 'SW', 'SR'],
         default='GBN'
     )
+    parser.add_argument(
+        '-c', '--congestion',
+        type=str,
+        help='congestion control algorithm',
+        choices=list(CONGESTION_CONTROLS),
+        default='reno'
+    )
+    parser.add_argument(
+        '-m', '--mss',
+        type=int,
+        help='maximum segment size, taken from the path MTU by default'
+    )
+    parser.add_argument(
+        '-e', '--engine',
+        type=str,
+        help='server engine, a thread per client or an asyncio event loop',
+        choices=['threads', 'asyncio'],
+        default='threads'
+    )
+    parser.add_argument(
+        '-w', '--workers',
+        type=int,
+        help='number of server processes sharing the port with SO_REUSEPORT',
+        default=1
+    )
+    parser.add_argument(
+        '-l', '--max-sessions',
+        type=int,
+        help='maximum number of concurrent transfers per server process',
+        default=MAX_SESSIONS
+    )
+    parser.add_argument(
+        '-b', '--bandwidth',
+        type=parse_rate,
+        help='send rate limit of each transfer in bytes per second '
+             '(K, M and G suffixes)'
+    )
+    parser.add_argument(
+        '-B', '--server-bandwidth',
+        type=parse_rate,
+        help='send rate limit of all transfers together, split between '
+             'the workers, shared fairly by the transfers'
+    )
+    parser.add_argument(
+        '-W', '--weight',
+        type=parse_weight,
+        action='append',
+        default=[],
+        help='share of the send rate of a client, as HOST=WEIGHT, '
+             'repeatable (default weight 1)'
+    )
 
     args = parser.parse_args()
+    if args.mss is not None and not 0 < args.mss <= MAX_MSS:
+        parser.error(f'mss must be between 1 and {MAX_MSS}')
+    if args.workers < 1:
+        parser.error('workers must be at least 1')
+    if args.max_sessions < 1:
+        parser.error('max sessions must be at least 1')
+    if args.workers > 1 and not hasattr(socket, 'SO_REUSEPORT'):
+        parser.error('SO_REUSEPORT is not supported on this platform')
     setup_logger(args.verbose, args.quiet)
     logging.debug('Iniciando servidor con argumentos: %s', args)
+    if args.workers == 1:
+        run_server(args)
+        return
+    # Cada worker tiene su propio socket en el mismo puerto, el kernel
+    # reparte los clientes entre ellos segun su 4-tupla
+    workers = [
+        Process(target=run_server, args=(args, True), daemon=True)
+        for _ in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    logging.info('Servidor iniciado con %d workers', args.workers)
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        logging.info('Servidor detenido manualmente')
+
+
+def run_server(args: argparse.Namespace, reuse_port: bool = False):
+    setup_logger(args.verbose, args.quiet)
     recovery_protocol = None
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     address = (args.host, args.port)
     sock.bind(address)
+    congestion_control = CONGESTION_CONTROLS[args.congestion]
     match args.protocol:
         case 'GBN':
-            recovery_protocol = GoBackN()
+            recovery_protocol = GoBackN(congestion_control)
         case 'SW':
-            recovery_protocol = StopAndWait()
+            recovery_protocol = StopAndWait(congestion_control)
+        case 'SR':
+            recovery_protocol = SelectiveRepeat(congestion_control)
     logging.debug('Protocolo de recuperacion: %s', recovery_protocol)
-    serv = Server(recovery_protocol, address, args.storage, sock)
-    logging.info('Servidor creado con protocolo %s', args.protocol)
+    server_class = AsyncServer if args.engine == 'asyncio' else Server
+    server_rate_limit = None
+    if args.server_bandwidth is not None:
+        server_rate_limit = args.server_bandwidth / args.workers
+    serv = server_class(
+        recovery_protocol, address, args.storage, sock, args.mss,
+        args.max_sessions, args.bandwidth, server_rate_limit,
+        dict(args.weight)
+    )
+    logging.info(
+        'Servidor creado con protocolo %s y motor %s',
+        args.protocol, args.engine
+    )
     serv.start()
 
 